@@ -2,8 +2,10 @@ from django.contrib import admin
 
 from comics.tasks import (refresh_issue_task, refresh_arc_task,
                           refresh_creator_task, refresh_issue_credits_task)
+from comics.utils.throttle import INTERACTIVE
 
-from .models import Arc, Creator, Credits, Issue, Publisher, Series, Settings
+from .models import (Arc, Creator, Credits, FailedLookup, Issue, Publisher,
+                     Series, Settings)
 
 
 UNREAD = 0
@@ -34,7 +36,7 @@ class ArcAdmin(admin.ModelAdmin):
     def refresh_arc_metadata(self, request, queryset):
         rows_updated = 0
         for arc in queryset:
-            success = refresh_arc_task(arc.cvid)
+            success = refresh_arc_task(arc.cvid, INTERACTIVE)
             if success:
                 rows_updated += 1
 
@@ -58,7 +60,7 @@ class CreatorAdmin(admin.ModelAdmin):
     def refresh_creator_metadata(self, request, queryset):
         rows_updated = 0
         for creator in queryset:
-            success = refresh_creator_task(creator.cvid)
+            success = refresh_creator_task(creator.cvid, INTERACTIVE)
             if success:
                 rows_updated += 1
 
@@ -82,6 +84,16 @@ class RolesAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(FailedLookup)
+class FailedLookupAdmin(admin.ModelAdmin):
+    # Deleting one lets it be looked up again straight away.
+    search_fields = ('url',)
+    list_display = ('url', 'error', 'attempts', 'expires')
+    list_filter = ('resource', 'expires')
+    readonly_fields = ('url', 'resource', 'cvid', 'error', 'attempts',
+                       'modified')
+
+
 @admin.register(Issue)
 class IssueAdmin(admin.ModelAdmin):
     search_fields = ('series__name',)
@@ -129,7 +141,7 @@ class IssueAdmin(admin.ModelAdmin):
             # most likely run into issues with exceeding the ComicVine
             # API rate. Not to mention issues with timing of refresh for
             # mutiple issues with the same storyarc being add/refreshed.
-            success = refresh_issue_task(issue.cvid)
+            success = refresh_issue_task(issue.cvid, INTERACTIVE)
             if success:
                 rows_updated += 1
 
@@ -141,7 +153,7 @@ class IssueAdmin(admin.ModelAdmin):
     def refresh_issue_credits(self, request, queryset):
         rows_updated = 0
         for issue in queryset:
-            success = refresh_issue_credits_task(issue.cvid)
+            success = refresh_issue_credits_task(issue.cvid, INTERACTIVE)
             if success:
                 rows_updated += 1
 
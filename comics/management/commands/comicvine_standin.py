@@ -0,0 +1,40 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from comics.utils.cvstandin import Recording, StandInServer
+
+
+class Command(BaseCommand):
+    help = ('Serves a recording of Comic Vine (see record_comicvine) on a '
+            'local port, for testing and timing imports offline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'comicvine-recording'),
+                            help='Directory the recording is in.')
+        parser.add_argument('--port', type=int, default=8001,
+                            help='Port to listen on (default: 8001).')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Seconds to hold up each request, to '
+                                 'act like the real thing (default: 0).')
+        parser.add_argument('--per-hour', type=int, default=0,
+                            help='Requests allowed for each resource in an '
+                                 'hour, like Comic Vine (default: no '
+                                 'limit).')
+
+    def handle(self, *args, **options):
+        server = StandInServer(Recording(options['dir']),
+                               ('127.0.0.1', options['port']),
+                               latency=options['latency'],
+                               per_hour=options['per_hour'])
+        self.stdout.write(f'Serving {options["dir"]}. Set '
+                          f'COMICVINE_BASE_URL={server.base_url} to use it.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from comics.models import Settings
+from comics.utils.comicimporter import ComicImporter
+
+
+class Command(BaseCommand):
+    help = ('Reports what importing the comics directory would do, and '
+            'roughly how long the Comic Vine lookups would take, without '
+            'importing anything.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Plan a full scan, including directories '
+                                 'that look unchanged.')
+
+    def handle(self, *args, **options):
+        if not Settings.get_solo().comics_directory:
+            raise CommandError('The comics directory has not been set.')
+
+        plan = ComicImporter().plan_comic_files(full_scan=options['full'])
+        for line in plan.report():
+            self.stdout.write(line)
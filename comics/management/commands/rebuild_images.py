@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from comics.utils.rebuild import MediaRebuilder
+
+
+class Command(BaseCommand):
+    help = ('Makes every issue, arc, publisher and creator image (and its '
+            'renditions) again from the originals kept at import, at the '
+            'current sizes. Picks up where it left off if interrupted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of processes rendering images.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many images would be '
+                                 'rebuilt.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start over instead of carrying on from an '
+                                 'interrupted rebuild.')
+
+    def handle(self, *args, **options):
+        rebuilder = MediaRebuilder(options['workers'],
+                                   report=self.stdout.write)
+        if options['restart']:
+            rebuilder.progress.done = {}
+
+        if options['dry_run']:
+            for model, count, originals in rebuilder.plan():
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural.capitalize()}: '
+                    f'{count} images to rebuild, {count - originals} '
+                    f'without an original (renditions only)')
+            return
+
+        rebuilder.rebuild()
+        self.stdout.write(
+            f'Rebuilt {rebuilder.rendered} images, and the renditions of '
+            f'{rebuilder.no_original} without an original. '
+            f'{rebuilder.failed} failed.')
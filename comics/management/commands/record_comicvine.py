@@ -0,0 +1,31 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from comics.models import Settings
+from comics.utils.comicimporter import ComicImporter
+from comics.utils.cvstandin import Recording, record
+
+
+class Command(BaseCommand):
+    help = ('Imports the comics directory, saving every response from Comic '
+            'Vine (and every image) for comicvine_standin to serve. Run it '
+            'against an empty database to get everything an import needs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir',
+                            default=os.path.join(settings.BASE_DIR,
+                                                 'comicvine-recording'),
+                            help='Directory to save the recording in.')
+
+    def handle(self, *args, **options):
+        if not Settings.get_solo().comics_directory:
+            raise CommandError('The comics directory has not been set.')
+
+        ci = ComicImporter()
+        record(ci.cv, Recording(options['dir']))
+        with ci.cv.session.cache_disabled():
+            ci.import_comic_files(full_scan=True)
+
+        self.stdout.write(f'Recorded to {options["dir"]}')
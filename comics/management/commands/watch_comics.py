@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from comics.models import Settings
+from comics.tasks import import_comic_files_task, import_comic_paths_task
+from comics.utils.watcher import LibraryWatcher
+
+
+class Command(BaseCommand):
+    help = ('Watches the comics directory and imports archives as they are '
+            'added, changed or removed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debounce', type=float, default=5,
+                            help='Seconds to wait for changes to settle '
+                                 'before importing (default: 5).')
+        parser.add_argument('--max-delay', type=float, default=60,
+                            help='Longest time to hold on to changes while '
+                                 'more keep arriving (default: 60).')
+        parser.add_argument('--poll', action='store_true',
+                            help='Poll the directory instead of using '
+                                 'inotify (ie. for NFS mounts).')
+        parser.add_argument('--interval', type=float, default=30,
+                            help='Seconds between polls (default: 30).')
+
+    def handle(self, *args, **options):
+        directory = Settings.get_solo().comics_directory
+        if not directory:
+            raise CommandError('The comics directory has not been set.')
+
+        watcher = LibraryWatcher(directory, self.import_changes,
+                                 debounce=options['debounce'],
+                                 max_delay=options['max_delay'],
+                                 poll=options['poll'],
+                                 interval=options['interval'])
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            watcher.stop()
+
+    def import_changes(self, paths):
+        if paths is None:
+            self.stdout.write('Lost track of changes, importing everything.')
+            import_comic_files_task.apply_async()
+        else:
+            self.stdout.write(f'Importing {len(paths)} changed paths.')
+            import_comic_paths_task.apply_async((sorted(paths),))
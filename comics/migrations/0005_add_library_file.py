@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0004_change_image_upload_to'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=300, unique=True, verbose_name='File Path')),
+                ('size', models.BigIntegerField(verbose_name='Size')),
+                ('mtime', models.FloatField(verbose_name='Modified Time')),
+                ('inode', models.BigIntegerField(verbose_name='Inode')),
+            ],
+            options={
+                'ordering': ['path'],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0005_add_library_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryDirectory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=300, unique=True, verbose_name='Directory Path')),
+                ('mtime', models.FloatField(verbose_name='Modified Time')),
+                ('digest', models.CharField(max_length=40, verbose_name='Digest')),
+            ],
+            options={
+                'verbose_name_plural': 'Library directories',
+                'ordering': ['path'],
+            },
+        ),
+    ]
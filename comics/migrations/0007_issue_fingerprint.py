@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0006_add_library_directory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='Fingerprint'),
+        ),
+    ]
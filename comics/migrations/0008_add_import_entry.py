@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0007_issue_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=300, unique=True, verbose_name='File Path')),
+                ('mtime', models.FloatField(verbose_name='Modified Time')),
+                ('stage', models.PositiveSmallIntegerField(choices=[(0, 'Queued'), (1, 'Parsed'), (2, 'Resolved'), (3, 'Persisted'), (4, 'Images Done')], default=0, verbose_name='Stage')),
+                ('failed', models.BooleanField(default=False, verbose_name='Failed')),
+                ('error', models.CharField(blank=True, max_length=300, verbose_name='Error')),
+                ('record', models.TextField(blank=True, verbose_name='Metadata')),
+                ('images', models.TextField(blank=True, verbose_name='Pending Images')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Last Modified')),
+            ],
+            options={
+                'verbose_name_plural': 'Import entries',
+                'ordering': ['path'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0008_add_import_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedLookup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=300, unique=True, verbose_name='Comic Vine URL')),
+                ('resource', models.CharField(db_index=True, max_length=20, verbose_name='Resource')),
+                ('cvid', models.PositiveIntegerField(blank=True, null=True, verbose_name='Comic Vine ID')),
+                ('error', models.CharField(blank=True, max_length=300, verbose_name='Error')),
+                ('attempts', models.PositiveIntegerField(default=1, verbose_name='Attempts')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Last Failed')),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='Expires')),
+            ],
+            options={
+                'ordering': ['url'],
+            },
+        ),
+    ]
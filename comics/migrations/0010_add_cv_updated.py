@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0009_add_failed_lookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arc',
+            name='cv_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Comic Vine Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='creator',
+            name='cv_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Comic Vine Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='cv_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Comic Vine Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='publisher',
+            name='cv_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Comic Vine Last Updated'),
+        ),
+        migrations.AddField(
+            model_name='series',
+            name='cv_updated',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Comic Vine Last Updated'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0010_add_cv_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arc',
+            name='renditions',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='Image Renditions'),
+        ),
+        migrations.AddField(
+            model_name='creator',
+            name='renditions',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='Image Renditions'),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='renditions',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='Image Renditions'),
+        ),
+        migrations.AddField(
+            model_name='publisher',
+            name='renditions',
+            field=models.CharField(blank=True, editable=False, max_length=50, verbose_name='Image Renditions'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def merge_duplicate_publishers(apps, schema_editor):
+    # Imports running side by side could each add the same publisher.
+    # Keep the first one and move the others' series over to it.
+    Publisher = apps.get_model('comics', 'Publisher')
+    Series = apps.get_model('comics', 'Series')
+    duplicates = (Publisher.objects.exclude(cvid=None)
+                  .values('cvid')
+                  .annotate(count=models.Count('id'))
+                  .filter(count__gt=1)
+                  .values_list('cvid', flat=True))
+    for cvid in list(duplicates):
+        keep, *others = Publisher.objects.filter(cvid=cvid).order_by('id')
+        others = [p.id for p in others]
+        Series.objects.filter(publisher_id__in=others).update(publisher=keep)
+        Publisher.objects.filter(id__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comics', '0011_add_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_publishers,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='publisher',
+            name='cvid',
+            field=models.PositiveIntegerField(null=True, unique=True, verbose_name='Comic Vine ID'),
+        ),
+    ]
@@ -41,11 +41,16 @@ class Settings(SingletonModel):
 class Arc(models.Model):
     cvid = models.PositiveIntegerField('Comic Vine ID', unique=True)
     cvurl = models.URLField('Comic Vine URL', max_length=200)
+    cv_updated = models.DateTimeField('Comic Vine Last Updated', null=True,
+                                      blank=True)
     name = models.CharField('Arc Name', max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     desc = models.TextField('Description', max_length=500, blank=True)
     image = models.ImageField(upload_to='images/arcs/%Y/%m/%d/',
                               max_length=150, blank=True)
+    # Widths the image has renditions at (see utils.create_renditions).
+    renditions = models.CharField('Image Renditions', max_length=50,
+                                  blank=True, editable=False)
 
     def get_absolute_url(self):
         return reverse('api:arc-detail', args=[self.slug])
@@ -78,11 +83,16 @@ class Arc(models.Model):
 class Creator(models.Model):
     cvid = models.PositiveIntegerField('Comic Vine ID', unique=True)
     cvurl = models.URLField('Comic Vine URL', max_length=200)
+    cv_updated = models.DateTimeField('Comic Vine Last Updated', null=True,
+                                      blank=True)
     name = models.CharField('Creator Name', max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     desc = models.TextField('Description', max_length=500, blank=True)
     image = models.ImageField(
         upload_to='images/creators/%Y/%m/%d/', max_length=150, blank=True)
+    # Widths the image has renditions at (see utils.create_renditions).
+    renditions = models.CharField('Image Renditions', max_length=50,
+                                  blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -92,13 +102,18 @@ class Creator(models.Model):
 
 
 class Publisher(models.Model):
-    cvid = models.PositiveIntegerField('Comic Vine ID', null=True)
+    cvid = models.PositiveIntegerField('Comic Vine ID', null=True, unique=True)
     cvurl = models.URLField('Comic Vine URL', max_length=200)
+    cv_updated = models.DateTimeField('Comic Vine Last Updated', null=True,
+                                      blank=True)
     name = models.CharField('Series Name', max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     desc = models.TextField('Description', max_length=500, blank=True)
     image = models.ImageField(upload_to='images/publishers/%Y/%m/%d/',
                               max_length=150, blank=True)
+    # Widths the image has renditions at (see utils.create_renditions).
+    renditions = models.CharField('Image Renditions', max_length=50,
+                                  blank=True, editable=False)
 
     def get_absolute_url(self):
         return reverse('api:publisher-detail', args=[self.slug])
@@ -119,6 +134,8 @@ class Series(models.Model):
 
     cvid = models.PositiveIntegerField('Comic Vine ID', unique=True)
     cvurl = models.URLField('Comic Vine URL', max_length=200, blank=True)
+    cv_updated = models.DateTimeField('Comic Vine Last Updated', null=True,
+                                      blank=True)
     name = models.CharField('Series Name', max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     sort_title = models.CharField('Sort Name', max_length=200)
@@ -166,6 +183,8 @@ class Issue(models.Model):
 
     cvid = models.PositiveIntegerField('ComicVine ID', unique=True)
     cvurl = models.URLField('ComicVine URL', max_length=200, blank=True)
+    cv_updated = models.DateTimeField('Comic Vine Last Updated', null=True,
+                                      blank=True)
     series = models.ForeignKey(Series, on_delete=models.CASCADE, blank=True)
     name = models.CharField('Issue Name', max_length=350, blank=True)
     slug = models.SlugField(max_length=350, unique=True)
@@ -175,8 +194,13 @@ class Issue(models.Model):
     arcs = models.ManyToManyField(Arc, blank=True)
     creators = models.ManyToManyField(Creator, through='Credits', blank=True)
     file = models.CharField('File Path', max_length=300)
+    fingerprint = models.CharField('Fingerprint', max_length=64,
+                                   blank=True, db_index=True, editable=False)
     image = models.ImageField('Cover Image', upload_to='images/issues/%Y/%m/%d/',
                               max_length=150, blank=True)
+    # Widths the image has renditions at (see utils.create_renditions).
+    renditions = models.CharField('Image Renditions', max_length=50,
+                                  blank=True, editable=False)
     status = models.PositiveSmallIntegerField(
         'Status', choices=STATUS_CHOICES, default=0, blank=True)
     leaf = models.PositiveSmallIntegerField(
@@ -215,6 +239,80 @@ class Issue(models.Model):
         ordering = ['series__name', 'date', 'number']
 
 
+class LibraryDirectory(models.Model):
+    path = models.CharField('Directory Path', max_length=300, unique=True)
+    mtime = models.FloatField('Modified Time')
+    digest = models.CharField('Digest', max_length=40)
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name_plural = "Library directories"
+        ordering = ['path']
+
+
+class LibraryFile(models.Model):
+    path = models.CharField('File Path', max_length=300, unique=True)
+    size = models.BigIntegerField('Size')
+    mtime = models.FloatField('Modified Time')
+    inode = models.BigIntegerField('Inode')
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        ordering = ['path']
+
+
+class ImportEntry(models.Model):
+    QUEUED = 0
+    PARSED = 1
+    RESOLVED = 2
+    PERSISTED = 3
+    DONE = 4
+    STAGE_CHOICES = (
+        (QUEUED, 'Queued'),
+        (PARSED, 'Parsed'),
+        (RESOLVED, 'Resolved'),
+        (PERSISTED, 'Persisted'),
+        (DONE, 'Images Done'),
+    )
+
+    path = models.CharField('File Path', max_length=300, unique=True)
+    mtime = models.FloatField('Modified Time')
+    stage = models.PositiveSmallIntegerField(
+        'Stage', choices=STAGE_CHOICES, default=QUEUED)
+    failed = models.BooleanField('Failed', default=False)
+    error = models.CharField('Error', max_length=300, blank=True)
+    record = models.TextField('Metadata', blank=True)
+    images = models.TextField('Pending Images', blank=True)
+    modified = models.DateTimeField('Last Modified', auto_now=True)
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name_plural = "Import entries"
+        ordering = ['path']
+
+
+class FailedLookup(models.Model):
+    url = models.CharField('Comic Vine URL', max_length=300, unique=True)
+    resource = models.CharField('Resource', max_length=20, db_index=True)
+    cvid = models.PositiveIntegerField('Comic Vine ID', null=True, blank=True)
+    error = models.CharField('Error', max_length=300, blank=True)
+    attempts = models.PositiveIntegerField('Attempts', default=1)
+    modified = models.DateTimeField('Last Failed', auto_now=True)
+    expires = models.DateTimeField('Expires', db_index=True)
+
+    def __str__(self):
+        return self.url
+
+    class Meta:
+        ordering = ['url']
+
+
 class Role(models.Model):
     name = models.CharField(max_length=25)
 
@@ -2,15 +2,47 @@ from rest_framework import serializers
 
 from comics.models import (Arc, Credits, Issue, Publisher, Role, Series)
 from comics.utils.reader import ImageAPIHandler
+from comics.utils.utils import RENDITION_FORMATS, rendition_name
+
+
+class SrcsetField(serializers.Field):
+    '''
+    The srcset for an object's image renditions in each format, so grids
+    can load the smallest copy that fits, or None if it has none.
+    '''
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        if not obj.image or not obj.renditions:
+            return None
+
+        request = self.context.get('request')
+        srcset = {}
+        for ext, image_format, _ in RENDITION_FORMATS:
+            candidates = []
+            for width in obj.renditions.split(','):
+                url = obj.image.storage.url(
+                    rendition_name(obj.image.name, width, ext))
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                candidates.append(f'{url} {width}w')
+            srcset[image_format.lower()] = ', '.join(candidates)
+
+        return srcset
 
 
 class ArcSerializer(serializers.ModelSerializer):
     issue_count = serializers.ReadOnlyField
     percent_read = serializers.ReadOnlyField
+    srcset = SrcsetField()
 
     class Meta:
         model = Arc
-        fields = ('id', 'name', 'slug', 'image',
+        fields = ('id', 'name', 'slug', 'image', 'srcset',
                   'issue_count', 'percent_read', 'desc')
         lookup_field = 'slug'
 
@@ -60,22 +92,25 @@ class IssueSerializer(serializers.ModelSerializer):
     arcs = IssueArcSerializer(many=True, read_only=True)
     percent_read = serializers.ReadOnlyField
     leaf = serializers.IntegerField()
+    srcset = SrcsetField()
 
     class Meta:
         model = Issue
         fields = ('id', '__str__', 'slug', 'name', 'number', 'date', 'leaf',
                   'page_count', 'percent_read', 'status', 'desc', 'image',
-                  'arcs', 'credits')
+                  'srcset', 'arcs', 'credits')
         read_only_fields = ('id', '__str__', 'slug', 'cvurl', 'name',
                             'number', 'date', 'page_count', 'desc', 'image')
         lookup_field = 'slug'
 
 
 class PublisherSerializer(serializers.HyperlinkedModelSerializer):
+    srcset = SrcsetField()
 
     class Meta:
         model = Publisher
-        fields = ('slug', 'cvurl', 'name', 'desc', 'image', 'series_count')
+        fields = ('slug', 'cvurl', 'name', 'desc', 'image', 'srcset',
+                  'series_count')
         lookup_field = 'slug'
 
 
@@ -89,10 +124,11 @@ class ReaderSerializer(serializers.ModelSerializer):
 class SeriesImageSerializer(serializers.HyperlinkedModelSerializer):
     image = serializers.ImageField(
         max_length=None, use_url=True, allow_null=True, required=False)
+    srcset = SrcsetField()
 
     class Meta:
         model = Issue
-        fields = ('image',)
+        fields = ('image', 'srcset')
         lookup_field = 'slug'
 
 
@@ -109,7 +145,7 @@ class SeriesSerializer(serializers.HyperlinkedModelSerializer):
         lookup_field = 'slug'
 
     def to_representation(self, obj):
-        """ Move image field from Issue to Series representation. """
+        """ Move image fields from Issue to Series representation. """
         representation = super().to_representation(obj)
         issue_representation = representation.pop('image')
         for key in issue_representation:
@@ -1,11 +1,15 @@
+from comics.utils.utils import delete_image_copies, image_shared
+
 
 def pre_delete_image(sender, instance, **kwargs):
-    if (instance.image):
+    if (instance.image) and not image_shared(instance):
+        delete_image_copies(instance.image.name, instance.renditions)
         instance.image.delete(False)
 
 
 def pre_delete_issue(sender, instance, **kwargs):
-    if (instance.image):
+    if (instance.image) and not image_shared(instance):
+        delete_image_copies(instance.image.name, instance.renditions)
         instance.image.delete(False)
 
     # Delete related arc if this is the only
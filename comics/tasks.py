@@ -1,43 +1,91 @@
-from celery import shared_task
+import math
+import time
 
-from .utils.comicimporter import ComicImporter
+from celery import chain, group, shared_task
+
+from .utils.comicimporter import REQUEUE_LIMIT, ComicImporter
+from .utils.throttle import BULK
+
+
+def import_batches(batches):
+    # Any images left over from an interrupted import are picked up once,
+    # before the batches are handed out to whichever workers are free.
+    # Only those from before now, so none that this import queues.
+    resume = resume_images_task.si(time.time())
+    tasks = [import_comic_batch_task.si(batch) for batch in batches]
+    if tasks:
+        chain(resume, group(tasks)).apply_async()
+    else:
+        resume.apply_async()
+
+    return len(tasks)
 
 
 @shared_task
-def import_comic_files_task():
+def import_comic_files_task(full_scan=False):
     ci = ComicImporter()
-    success = ci.import_comic_files()
+    batches = ci.prepare_comic_files(full_scan)
 
-    return success
+    return import_batches(batches)
 
 
 @shared_task
-def refresh_issue_task(cvid):
+def import_comic_paths_task(paths):
     ci = ComicImporter()
+    batches = ci.prepare_comic_paths(paths)
+    if not batches:
+        return 0
+
+    return import_batches(batches)
+
+
+@shared_task
+def resume_images_task(before):
+    ci = ComicImporter()
+    ci.resumeImages(before)
+
+
+@shared_task
+def import_comic_batch_task(files, requeues=0):
+    ci = ComicImporter()
+    ci.importFiles(files, resume_images=False, wait=False)
+    if ci.deferred_files and requeues < REQUEUE_LIMIT:
+        # Comic Vine's unavailable, so try them again once it's back
+        # rather than holding up the worker.
+        import_comic_batch_task.apply_async(
+            (ci.deferred_files, requeues + 1),
+            countdown=math.ceil(ci.getRetryAfter()))
+
+    return len(files) - len(ci.failed_paths)
+
+
+@shared_task
+def refresh_issue_task(cvid, priority=BULK):
+    ci = ComicImporter(priority)
     success = ci.refreshIssueData(cvid)
 
     return success
 
 
 @shared_task
-def refresh_arc_task(cvid):
-    ci = ComicImporter()
+def refresh_arc_task(cvid, priority=BULK):
+    ci = ComicImporter(priority)
     success = ci.refreshArcData(cvid)
 
     return success
 
 
 @shared_task
-def refresh_creator_task(cvid):
-    ci = ComicImporter()
+def refresh_creator_task(cvid, priority=BULK):
+    ci = ComicImporter(priority)
     success = ci.refreshCreatorData(cvid)
 
     return success
 
 
 @shared_task
-def refresh_issue_credits_task(cvid):
-    ci = ComicImporter()
+def refresh_issue_credits_task(cvid, priority=BULK):
+    ci = ComicImporter(priority)
     success = ci.refreshIssueCreditsData(cvid)
 
     return success
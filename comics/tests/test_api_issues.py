@@ -106,6 +106,23 @@ class GetSingleIssueTest(APITestCase):
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_issue_srcset(self):
+        issue = Issue.objects.get(slug=self.superman.slug)
+        serializer = IssueSerializer(issue, context=self.serializer_context)
+        self.assertIsNone(serializer.data['srcset'])
+
+        issue.image = 'images/issues/cover.jpg'
+        issue.renditions = '160,320'
+        serializer = IssueSerializer(issue, context=self.serializer_context)
+        self.assertEqual(serializer.data['srcset'], {
+            'webp': 'http://testserver/media/images/issues/cover-160w.webp '
+                    '160w, http://testserver/media/images/issues/'
+                    'cover-320w.webp 320w',
+            'jpeg': 'http://testserver/media/images/issues/cover-160w.jpg '
+                    '160w, http://testserver/media/images/issues/'
+                    'cover-320w.jpg 320w',
+        })
+
     def test_absolute_url(self):
         reverse_url = reverse('api:issue-detail',
                               kwargs={'slug': self.superman.slug})
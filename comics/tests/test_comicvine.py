@@ -0,0 +1,362 @@
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+from unittest import mock
+import uuid
+
+from django.test import SimpleTestCase, TestCase, override_settings
+import requests
+from requests.adapters import HTTPAdapter
+
+from comics.models import FailedLookup
+from comics.utils.comicvine import (ComicVineClient, ComicVineError,
+                                    ComicVineNotFound, ComicVineUnavailable,
+                                    entity_for, image_rendition,
+                                    parse_date, resource_for)
+from comics.utils.cvcache import EntityCache, LookupMisses
+from comics.utils.throttle import CircuitBreaker, get_redis
+
+
+class FakeLimiter(object):
+
+    def __init__(self):
+        self.resources = []
+
+    def acquire(self, resource):
+        self.resources.append(resource)
+
+
+class FakeMisses(object):
+
+    def __init__(self):
+        self.urls = {}
+
+    def has(self, url):
+        return url.rstrip('/') in self.urls
+
+    def add(self, url, error, resource='', cvid=None):
+        self.urls[url.rstrip('/')] = (error, resource, cvid)
+
+
+def random_cvid():
+    # Cached records are shared, so don't reuse them between runs.
+    return random.randint(10 ** 9, 10 ** 12)
+
+
+RESULTS = {'status_code': 1, 'error': 'OK', 'results': {'id': 1}}
+
+
+def make_response(request, content=json.dumps(RESULTS).encode(),
+                  status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = request.url
+    response.request = request
+    response._content = content
+    return response
+
+
+class TestComicVineClient(SimpleTestCase):
+
+    def setUp(self):
+        # A new api url each time, so nothing comes from the cache.
+        self.base_url = f'https://cv.test/{uuid.uuid4().hex}/api'
+        self.limiter = FakeLimiter()
+        # Its own circuit, so a test tripping it doesn't affect the rest.
+        self.breaker = CircuitBreaker(uuid.uuid4().hex, threshold=3)
+        self.client = ComicVineClient('key', base_url=self.base_url,
+                                      limiter=self.limiter,
+                                      breaker=self.breaker, backoff=0)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append((request.url, kwargs['timeout']))
+        return make_response(request)
+
+    def test_detail(self):
+        issue, volume = random_cvid(), random_cvid()
+        with mock.patch.object(HTTPAdapter, 'send', self.send):
+            self.client.detail('issue', issue, 'id,name')
+            self.client.detail('volume', volume)
+            # Cached responses don't count against the rate limit.
+            self.client.detail('volume', volume)
+
+        self.assertEqual(self.requests, [
+            (f'{self.base_url}/issue/4000-{issue}?api_key=key'
+             '&field_list=id%2Cname&format=json', self.client.timeout),
+            (f'{self.base_url}/volume/4050-{volume}?api_key=key&format=json',
+             self.client.timeout),
+        ])
+        self.assertEqual(self.limiter.resources, ['issue', 'volume'])
+
+    def test_concurrent_lookups_are_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def send(adapter, request, **kwargs):
+            started.set()
+            release.wait(5)
+            return self.send(request, **kwargs)
+
+        results = []
+
+        cvid = random_cvid()
+
+        def lookup():
+            results.append(self.client.detail('person', cvid, 'id'))
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            threads = [threading.Thread(target=lookup) for _ in range(3)]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(results, [RESULTS] * 3)
+
+    def test_invalid_response(self):
+        def send(adapter, request, **kwargs):
+            return make_response(request, b'<html>Slow down</html>')
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            with self.assertRaises(ComicVineError):
+                self.client.detail('issue', random_cvid())
+
+    def test_not_found_is_remembered(self):
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            return make_response(request, (
+                b'{"status_code": 101, "error": "Object Not Found", '
+                b'"results": []}'))
+
+        misses = FakeMisses()
+        self.client.misses = misses
+        cvid = random_cvid()
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            for _ in range(2):
+                with self.assertRaises(ComicVineNotFound):
+                    self.client.detail('issue', cvid)
+            self.assertEqual(self.client.batch('issue', [cvid], 'id'), {})
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(list(misses.urls.values()),
+                         [('Object Not Found', 'issue', cvid)])
+
+    def test_throttled_requests_are_retried(self):
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            if len(self.requests) < 3:
+                response = make_response(request, b'', 420)
+                response.headers['Retry-After'] = '0'
+                return response
+            return make_response(request)
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            response = self.client.detail('issue', random_cvid())
+
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(response, RESULTS)
+        self.assertEqual(self.breaker.retry_after(), 0)
+
+    def test_long_retry_after_is_not_waited_for(self):
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            response = make_response(request, b'', 420)
+            response.headers['Retry-After'] = '3600'
+            return response
+
+        with mock.patch.object(HTTPAdapter, 'send', send), \
+                mock.patch('time.sleep') as sleep:
+            with self.assertRaises(ComicVineUnavailable) as cm:
+                self.client.detail('issue', random_cvid())
+
+        sleep.assert_not_called()
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(cm.exception.retry_after > 3500)
+
+    def test_circuit_opens(self):
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            return make_response(request, b'<html>Maintenance</html>')
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            with self.assertRaises(ComicVineUnavailable):
+                self.client.detail('issue', random_cvid())
+            # Once it's open, nothing else goes out until it closes.
+            with self.assertRaises(ComicVineUnavailable) as cm:
+                self.client.detail('volume', random_cvid())
+
+        self.assertEqual(len(self.requests), 3)
+        self.assertTrue(cm.exception.retry_after > 0)
+
+    def test_entity_cache(self):
+        cvid = random_cvid()
+
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            return make_response(request, (
+                b'{"status_code": 1, "error": "OK", '
+                b'"results": {"id": %d, "name": "Steve Ditko"}}' % cvid))
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            self.client.detail('person', cvid, 'id,name')
+            # A new client (ie. another worker) uses the cached record.
+            client = ComicVineClient('key', base_url=self.base_url,
+                                     limiter=self.limiter)
+            response = client.detail('person', cvid, 'name')
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(response['results'], {'name': 'Steve Ditko'})
+
+    def test_fresh_client_skips_caches(self):
+        cvid = random_cvid()
+        with mock.patch.object(HTTPAdapter, 'send', self.send):
+            self.client.detail('person', cvid, 'id')
+            client = ComicVineClient('key', base_url=self.base_url,
+                                     limiter=self.limiter,
+                                     breaker=self.breaker, fresh=True)
+            client.detail('person', cvid, 'id')
+            client.detail('person', cvid, 'id')
+            # What it got is still cached for everyone else.
+            self.client.detail('person', cvid, 'id')
+
+        self.assertEqual(len(self.requests), 3)
+
+    def test_batch(self):
+        ids = [random_cvid(), random_cvid()]
+
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            return make_response(request, json.dumps({
+                'status_code': 1, 'error': 'OK',
+                'results': [{'id': cvid, 'name': str(cvid)} for cvid in ids],
+            }).encode())
+
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            found = self.client.batch('person', ids + ids[:1], 'id,name')
+            # They're cached one by one, so a detail lookup is free.
+            self.client.detail('person', ids[1], 'name')
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertIn('filter=id%3A{}%7C{}'.format(*ids), self.requests[0])
+        self.assertEqual(found, {cvid: {'id': cvid, 'name': str(cvid)}
+                                 for cvid in ids})
+
+    def test_download(self):
+        def send(adapter, request, **kwargs):
+            self.requests.append(request.url)
+            response = make_response(request)
+            response.raw = io.BytesIO(b'image')
+            return response
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'cover.jpg')
+            with mock.patch.object(HTTPAdapter, 'send', send):
+                self.client.download(
+                    'https://comicvine.gamespot.com/api/image/original/1.jpg',
+                    path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'image')
+
+        # Images don't count against the api limits.
+        self.assertEqual(self.limiter.resources, [])
+
+    def test_resource_for(self):
+        self.assertEqual(resource_for(
+            'https://comicvine.gamespot.com/api/story_arc/4045-55691/'),
+            'story_arc')
+        self.assertEqual(resource_for(
+            'https://comicvine.gamespot.com/api/issues/'), 'issue')
+        self.assertIsNone(resource_for(
+            'https://comicvine.gamespot.com/api/search/'))
+
+    def test_image_rendition(self):
+        image = {'thumb_url': 'thumb', 'small_url': 'small',
+                 'super_url': 'super', 'original_url': 'original'}
+        self.assertEqual(image_rendition(image, 64), 'thumb')
+        # There's no medium rendition, so the next one up.
+        self.assertEqual(image_rendition(image, 400), 'super')
+        self.assertEqual(image_rendition(image, 640), 'super')
+        self.assertEqual(image_rendition(image, 2000), 'original')
+
+    def test_entity_for(self):
+        self.assertEqual(entity_for(
+            'https://comicvine.gamespot.com/api/volume/4050-796/'),
+            ('volume', 796))
+        self.assertIsNone(entity_for(
+            'https://comicvine.gamespot.com/api/issues/'))
+
+    @override_settings(TIME_ZONE='US/Eastern')
+    def test_parse_date(self):
+        self.assertEqual(parse_date('2019-06-05 16:14:54').isoformat(),
+                         '2019-06-05T16:14:54-04:00')
+        # When the clocks go back, and forward.
+        self.assertEqual(parse_date('2019-11-03 01:30:00').isoformat(),
+                         '2019-11-03T01:30:00-05:00')
+        self.assertIsNotNone(parse_date('2019-03-10 02:30:00'))
+        self.assertIsNone(parse_date('June 2019'))
+
+
+class TestEntityCache(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = EntityCache(ttl={'publisher': 60})
+        self.cvid = random_cvid()
+
+    def tearDown(self):
+        self.cache.delete('publisher', self.cvid)
+
+    def test_fields_are_merged(self):
+        self.cache.set('publisher', self.cvid, 'id,name',
+                       {'id': self.cvid, 'name': 'Charlton'})
+        self.assertIsNone(self.cache.get('publisher', self.cvid, 'deck'))
+        self.assertIsNone(self.cache.get('publisher', self.cvid))
+
+        self.cache.set('publisher', self.cvid, 'deck', {'deck': 'Derby, CT'})
+        response = self.cache.get('publisher', self.cvid, 'name,deck')
+        self.assertEqual(response['results'],
+                         {'name': 'Charlton', 'deck': 'Derby, CT'})
+
+    def test_ttl(self):
+        self.cache.set('publisher', self.cvid, None, {'id': self.cvid})
+        self.assertEqual(self.cache.get('publisher', self.cvid)['results'],
+                         {'id': self.cvid})
+        ttl = get_redis().ttl(EntityCache.key('publisher', self.cvid))
+        self.assertTrue(0 < ttl <= 60)
+
+
+class TestLookupMisses(TestCase):
+
+    def test_misses_are_saved(self):
+        url = 'https://comicvine.gamespot.com/api/issue/4000-1/'
+        LookupMisses().add(url, 'Object Not Found', 'issue', 1)
+        LookupMisses().add(url, 'Object Not Found', 'issue', 1)
+
+        lookup = FailedLookup.objects.get()
+        self.assertEqual(lookup.url, url.rstrip('/'))
+        self.assertEqual(lookup.attempts, 2)
+        self.assertTrue(LookupMisses().has(url))
+
+        # Expired (or deleted) ones can be looked up again.
+        lookup.expires = lookup.modified
+        lookup.save()
+        self.assertFalse(LookupMisses().has(url))
+
+    def test_other_threads_wait_for_save(self):
+        misses = LookupMisses()
+        url = 'https://comicvine.gamespot.com/api/person/4040-1'
+        thread = threading.Thread(target=misses.add, args=(url, 'Error'))
+        thread.start()
+        thread.join()
+
+        self.assertTrue(misses.has(url))
+        self.assertFalse(FailedLookup.objects.exists())
+        misses.save()
+        self.assertTrue(FailedLookup.objects.exists())
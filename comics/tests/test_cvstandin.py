@@ -0,0 +1,105 @@
+import glob
+import json
+import os
+import random
+import tempfile
+import uuid
+
+from django.test import SimpleTestCase
+import requests
+
+from comics.utils.comicvine import ComicVineClient, ComicVineUnavailable
+from comics.utils.cvstandin import (CV_ROOT, Recording, RecordingAdapter,
+                                    StandInServer)
+from comics.utils.throttle import CircuitBreaker
+
+
+class FakeLimiter(object):
+
+    def acquire(self, resource):
+        pass
+
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+    # What the real Comic Vine would send back.
+
+    def __init__(self, responses):
+        self.responses = responses
+        super().__init__()
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = self.responses[request.path_url.split('?')[0]]
+        return response
+
+    def close(self):
+        pass
+
+
+class TestStandInServer(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.recording = Recording(self.tmp_dir.name)
+        # Cached records are shared, so don't reuse them between runs.
+        self.cvid = random.randint(10 ** 9, 10 ** 12)
+        self.issue_path = f'/api/issue/4000-{self.cvid}'
+        self.image_path = '/a/uploads/scale_avatar/1/1.jpg'
+
+        # Record a session with "Comic Vine".
+        session = requests.Session()
+        session.mount(CV_ROOT, RecordingAdapter(self.recording, FakeAdapter({
+            self.issue_path: json.dumps({
+                'status_code': 1, 'error': 'OK',
+                'results': {'id': self.cvid,
+                            'volume': {'api_detail_url':
+                                       f'{CV_ROOT}/api/volume/4050-1/'},
+                            'image': {'thumb_url':
+                                      CV_ROOT + self.image_path}},
+            }).encode(),
+            self.image_path: b'image',
+        })))
+        session.get(f'{CV_ROOT}{self.issue_path}',
+                    params={'api_key': 'secret', 'field_list': 'id,image'})
+        session.get(CV_ROOT + self.image_path)
+
+        self.server = StandInServer(self.recording, per_hour=2).start()
+        self.client = ComicVineClient(
+            'key', base_url=self.server.base_url, limiter=FakeLimiter(),
+            breaker=CircuitBreaker(uuid.uuid4().hex), retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def test_replay(self):
+        response = self.client.detail('issue', self.cvid, 'id,volume')
+        results = response['results']
+
+        # The urls in it lead back to the stand-in.
+        self.assertEqual(results['volume']['api_detail_url'],
+                         f'{self.server.base_url}/volume/4050-1/')
+        image = requests.get(results['image']['thumb_url'])
+        self.assertEqual(image.content, b'image')
+
+    def test_rate_limit(self):
+        url = f'{self.server.base_url}/issues/'
+        # Different fields each time, so nothing comes from the cache.
+        self.client.fetch(url, 'id')
+        self.client.fetch(url, 'name')
+
+        with self.assertRaises(ComicVineUnavailable) as cm:
+            self.client.fetch(url, 'deck')
+        self.assertTrue(cm.exception.retry_after > 0)
+
+    def test_recording_has_no_api_key(self):
+        paths = glob.glob(os.path.join(self.tmp_dir.name, 'responses', '*'))
+        self.assertTrue(paths)
+        for path in paths:
+            with open(path) as f:
+                recorded = f.read()
+            self.assertNotIn('api_key', recorded)
+            self.assertNotIn('secret', recorded)
@@ -1,5 +1,8 @@
 from datetime import datetime
 import os
+import tempfile
+from unittest import mock
+import zipfile
 
 from django.conf import settings
 from django.test import TestCase
@@ -13,6 +16,9 @@ from rest_framework_jwt.compat import get_user_model
 from comics.models import (Settings, Issue, Publisher,
                            Creator, Role, Series)
 from comics.utils.comicimporter import ComicImporter
+from comics.utils.comicvine import parse_date
+from comics.utils.metadata import archive_fingerprint
+from comics.utils.scanner import LibraryScanner
 
 
 User = get_user_model()
@@ -83,6 +89,31 @@ class TestImportComics(TestCase):
 
         self.assertTrue(self.creator.desc)
 
+    def test_refresh_unchanged_creator(self):
+        self.creator.cv_updated = parse_date('2019-06-05 16:14:54')
+        self.creator.save()
+        results = {'id': self.creator_cvid, 'name': 'Ed Brubaker',
+                   'deck': 'Writer', 'site_detail_url': '',
+                   'date_last_updated': '2019-06-05 16:14:54',
+                   'image': {'thumb_url': 'https://cv.test/thumb.jpg'}}
+
+        ci = ComicImporter()
+        with mock.patch.object(ci.cv, 'detail',
+                               return_value={'results': results}), \
+                mock.patch.object(ci, 'fetchImage') as fetch_image:
+            self.assertTrue(ci.refreshCreatorData(self.creator_cvid))
+            # Nothing changed on Comic Vine, so nothing is redone.
+            fetch_image.assert_not_called()
+            self.creator.refresh_from_db()
+            self.assertEqual(self.creator.desc, '')
+
+            results['date_last_updated'] = '2019-07-01 09:00:00'
+            fetch_image.return_value = {}
+            self.assertTrue(ci.refreshCreatorData(self.creator_cvid))
+            fetch_image.assert_called_once()
+            self.creator.refresh_from_db()
+            self.assertEqual(self.creator.desc, 'Writer')
+
     def test_refresh_issue(self):
         ci = ComicImporter()
         ci.refreshIssueData(self.issue_cvid)
@@ -108,6 +139,59 @@ class TestImportComics(TestCase):
         self.assertEqual(issue.date, datetime.date(cover_date))
         self.assertTrue(issue.image)
 
+    def test_import_comic_paths_removes_missing(self):
+        path = self.settings.comics_directory + os.sep + 'Batman #714.cbz'
+        Issue.objects.create(series=self.bat, cvid=286880, file=path,
+                             slug='batman-714', mod_ts=timezone.now(),
+                             date=timezone.now().date(), number='714')
+
+        ci = ComicImporter()
+        ci.import_comic_paths([path])
+
+        self.assertFalse(Issue.objects.filter(file=path).exists())
+        self.assertTrue(Issue.objects.filter(cvid=self.issue_cvid).exists())
+
+    def test_moved_comic_is_kept(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'Batman #714.cbz')
+            with zipfile.ZipFile(path, 'w') as zf:
+                zf.writestr('page01.jpg', b'')
+            old_path = os.path.join(tmp_dir, 'old', 'Batman #714.cbz')
+            issue = Issue.objects.create(series=self.bat, cvid=286880,
+                                         file=old_path, slug='batman-714',
+                                         fingerprint=archive_fingerprint(path),
+                                         mod_ts=timezone.now(),
+                                         date=timezone.now().date(),
+                                         number='714')
+
+            ci = ComicImporter()
+            ci.removeMissingOrModified(LibraryScanner(tmp_dir).scan())
+            issue.refresh_from_db()
+
+            self.assertEqual(issue.file, path)
+
+    def test_shard_files(self):
+        files = [['/comics/b/2.cbz', 1, 4.0, 1], ['/comics/a/1.cbz', 1, 3.0, 2],
+                 ['/comics/b/1.cbz', 1, 2.0, 3], ['/comics/a/2.cbz', 1, 1.0, 4]]
+        batches = ComicImporter.shardFiles(files, 3)
+
+        self.assertEqual([[f[0] for f in batch] for batch in batches],
+                         [['/comics/a/2.cbz', '/comics/a/1.cbz', '/comics/b/1.cbz'],
+                          ['/comics/b/2.cbz']])
+        self.assertEqual(ComicImporter.shardFiles([], 3), [])
+
+    def test_get_publisher_by_cvid(self):
+        ci = ComicImporter()
+        self.assertEqual(ci.getPublisher({'id': self.pub_cvid}), self.dc)
+
+        # One added before publishers had ids is matched by name.
+        charlton = Publisher.objects.create(name='Charlton', slug='charlton')
+        data = {'cvid': 125, 'cvurl': '', 'name': 'Charlton', 'desc': '',
+                'image': '', 'image_url': ''}
+        publisher = ci.getPublisher({'id': 125}, data)
+        self.assertEqual(publisher, charlton)
+        self.assertEqual(Publisher.objects.get(name='Charlton').cvid, 125)
+
     def test_get_page(self):
         ci = ComicImporter()
         ci.import_comic_files()
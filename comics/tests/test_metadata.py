@@ -0,0 +1,71 @@
+import os
+import tempfile
+import zipfile
+
+from django.test import SimpleTestCase
+
+from comics.utils.metadata import (MetadataReader, archive_fingerprint,
+                                   read_comic_metadata)
+
+
+CIX = '''<?xml version="1.0"?>
+<ComicInfo>
+  <Series>Captain Atom</Series>
+  <Number>78</Number>
+  <Year>1965</Year>
+  <Month>12</Month>
+  <Publisher>Charlton</Publisher>
+  <Notes>Tagged with ComicTagger [Issue ID 8192]</Notes>
+</ComicInfo>'''
+
+
+class TestMetadataReader(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.comics = [self.create_archive(f'Captain Atom #{i:03}.cbz')
+                       for i in range(4)]
+        self.not_comic = os.path.join(self.tmp_dir.name, 'notes.txt')
+        with open(self.not_comic, 'w') as f:
+            f.write('Not a comic')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_archive(self, name):
+        path = os.path.join(self.tmp_dir.name, name)
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('page01.jpg', b'')
+            zf.writestr('page02.jpg', b'')
+            zf.writestr('ComicInfo.xml', CIX)
+        return path
+
+    def test_read_comic_metadata(self):
+        md = read_comic_metadata(self.comics[0])
+        self.assertEqual(md.path, self.comics[0])
+        self.assertEqual(md.cvid, '8192')
+        self.assertEqual(md.series, 'Captain Atom')
+        self.assertEqual(md.issue, '78')
+        self.assertEqual(md.page_count, 2)
+
+    def test_read_not_a_comic(self):
+        self.assertIsNone(read_comic_metadata(self.not_comic))
+
+    def test_reader_keeps_order(self):
+        files = [(path, 0) for path in self.comics + [self.not_comic]]
+        for workers in (1, 2):
+            results = list(MetadataReader(workers).read(files))
+            self.assertEqual([path for path, _ in results],
+                             [path for path, _ in files])
+            self.assertEqual([md.cvid for _, md in results[:-1]],
+                             ['8192'] * 4)
+            self.assertIsNone(results[-1][1])
+
+    def test_archive_fingerprint(self):
+        fingerprint = archive_fingerprint(self.comics[0])
+        renamed = os.path.join(self.tmp_dir.name, 'Renamed.cbz')
+        os.rename(self.comics[0], renamed)
+
+        self.assertTrue(fingerprint)
+        self.assertEqual(archive_fingerprint(renamed), fingerprint)
+        self.assertIsNone(archive_fingerprint(self.not_comic))
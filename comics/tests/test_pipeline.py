@@ -0,0 +1,285 @@
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from comics.models import Creator, ImportEntry, Publisher
+from comics.utils.comicimporter import ComicImporter
+from comics.utils.journal import ImportJournal
+from comics.utils.metadata import MetadataReader
+from comics.utils.pipeline import ImportPipeline
+
+
+CIX = '''<?xml version="1.0"?>
+<ComicInfo>
+  <Series>Captain Atom</Series>
+  <Number>{number}</Number>
+  <Publisher>Charlton</Publisher>
+  <Web>https://comicvine.gamespot.com/captain-atom-{number}/4000-{cvid}/</Web>
+</ComicInfo>'''
+
+
+PUBLISHER = {'id': 125, 'api_detail_url': 'publisher/125'}
+
+
+class FakeImporter(object):
+    arc_fields = 'arc'
+    creator_fields = 'creator'
+    publisher_fields = 'publisher'
+    series_fields = 'series'
+    parse_workers = 1
+    image_workers = 2
+
+    def __init__(self):
+        self.image_handler = None
+        self.fetched = []
+        self.downloaded = []
+        self.added = []
+        self.missing = {'3'}
+        self.retry_after = 0
+
+    def getRetryAfter(self):
+        return self.retry_after
+
+    def getIssue(self, cvid):
+        if cvid in self.missing:
+            return None
+        return {'results': {
+            'volume': {'id': 100, 'api_detail_url': 'volume/100'},
+            'story_arc_credits': [],
+            'person_credits': [{'id': 1, 'api_detail_url': 'person/1'},
+                               {'id': 2, 'api_detail_url': 'person/2'}],
+        }}
+
+    def getPublisherData(self, publisher_response, download_image=True):
+        self.fetched.append(publisher_response['api_detail_url'])
+        return {'name': 'Charlton', 'image_url': ''}
+
+    def getSeriesDetail(self, api_url):
+        self.fetched.append(api_url)
+        return {'name': 'Captain Atom', 'publisher': PUBLISHER}
+
+    def getDetailData(self, fields, api_url, download_image=True):
+        self.fetched.append(api_url)
+        return {'image_url': 'image/' + api_url}
+
+    def getDetailBatch(self, resource, fields, ids):
+        self.fetched.append((resource, ids))
+        return {cvid: {'name': f'{resource} {cvid}',
+                       'image_url': f'image/{resource}/{cvid}',
+                       'publisher': PUBLISHER}
+                for cvid in ids}
+
+    def fetchImage(self, image_url, folder, width, height):
+        self.downloaded.append(image_url)
+        if not image_url:
+            return {}
+        return {'image': image_url, 'renditions': ''}
+
+    copyImage = staticmethod(ComicImporter.copyImage)
+
+    def addComicFromMetadata(self, md, resolved):
+        if resolved.issue_response is None:
+            return False
+        self.added.append((md.cvid, resolved))
+        self.image_handler(Creator.objects.get(cvid=1),
+                           resolved.creators.get(2, {}).get('image_url'),
+                           'creators', 64, 64)
+        return True
+
+
+class TestImportPipeline(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Publisher.objects.create(name='Charlton', slug='charlton')
+        Creator.objects.create(cvid=1, name='Steve Ditko', slug='steve-ditko')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.files = [(self.create_archive(i), 0) for i in range(1, 5)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_archive(self, cvid):
+        path = os.path.join(self.tmp_dir.name, f'Captain Atom #{cvid:03}.cbz')
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('page01.jpg', b'')
+            zf.writestr('ComicInfo.xml', CIX.format(number=cvid, cvid=cvid))
+        return path
+
+    def test_run(self):
+        importer = FakeImporter()
+        failed = ImportPipeline(importer, queue_size=1).run(self.files)
+
+        self.assertEqual(failed, {self.files[2][0]})
+        self.assertEqual([cvid for cvid, _ in importer.added], ['1', '2', '4'])
+        # Existing or already fetched things are only looked up once.
+        self.assertEqual(importer.fetched, [('volume', [100]),
+                                            ('publisher', [125]),
+                                            ('person', [2])])
+        self.assertIsNone(importer.image_handler)
+
+        creator = Creator.objects.get(cvid=1)
+        self.assertEqual(creator.image, 'image/person/2')
+
+    def test_stage_errors_are_raised(self):
+        importer = FakeImporter()
+        importer.getIssue = None
+        with self.assertRaises(TypeError):
+            ImportPipeline(importer).run(self.files)
+
+    def test_resume_from_journal(self):
+        importer = FakeImporter()
+        failed = ImportPipeline(importer, journal=ImportJournal()).run(
+            self.files)
+
+        # Only the failed file is left in the journal, along with its
+        # metadata so it doesn't need to be read again.
+        path = self.files[2][0]
+        self.assertEqual(failed, {path})
+        entry = ImportEntry.objects.get()
+        self.assertEqual(entry.path, path)
+        self.assertEqual(entry.stage, ImportEntry.PARSED)
+        self.assertTrue(entry.failed)
+        self.assertTrue(entry.error)
+
+        os.remove(path)
+        importer = FakeImporter()
+        importer.missing = set()
+        failed = ImportPipeline(importer, journal=ImportJournal()).run(
+            [(path, 0)])
+
+        self.assertEqual(failed, set())
+        self.assertEqual([cvid for cvid, _ in importer.added], ['3'])
+        self.assertFalse(ImportEntry.objects.exists())
+
+    def test_deferred_while_unavailable(self):
+        importer = FakeImporter()
+        importer.retry_after = 60
+        pipeline = ImportPipeline(importer, journal=ImportJournal())
+        failed = pipeline.run(self.files)
+
+        # Nothing is asked of Comic Vine, and the files are kept for later.
+        paths = {path for path, _ in self.files}
+        self.assertEqual(failed, paths)
+        self.assertEqual(pipeline.deferred, paths)
+        self.assertEqual(importer.fetched, [])
+        self.assertEqual(importer.added, [])
+        self.assertEqual(ImportEntry.objects.filter(failed=True).count(), 4)
+
+    def test_integrity_errors_fail_the_file(self):
+        importer = FakeImporter()
+        add = importer.addComicFromMetadata
+
+        def add_comic(md, resolved):
+            if md.cvid == '2':
+                # Another batch got to the slug first.
+                Creator.objects.create(cvid=6, name='Dick Giordano',
+                                       slug='dick-giordano')
+                raise IntegrityError('UNIQUE constraint failed: slug')
+            return add(md, resolved)
+
+        importer.addComicFromMetadata = add_comic
+        pipeline = ImportPipeline(importer, journal=ImportJournal())
+        failed = pipeline.run(self.files)
+
+        self.assertEqual(failed, {self.files[1][0], self.files[2][0]})
+        self.assertEqual([cvid for cvid, _ in importer.added], ['1', '4'])
+        # Nothing is left half saved.
+        self.assertFalse(Creator.objects.filter(cvid=6).exists())
+        entry = ImportEntry.objects.get(path=self.files[1][0])
+        self.assertTrue(entry.failed)
+
+    def test_resume_pending_images(self):
+        creator = Creator.objects.get(cvid=1)
+        other = Creator.objects.create(cvid=5, name='Joe Gill', slug='joe-gill')
+        ImportEntry.objects.create(
+            path=self.files[0][0], mtime=0, stage=ImportEntry.PERSISTED,
+            images=json.dumps([['comics.Creator', pk, 'image/person/1',
+                                'creators', 64, 64]
+                               for pk in (creator.pk, other.pk)]))
+
+        importer = FakeImporter()
+        ImportPipeline(importer, journal=ImportJournal()).run([])
+        creator.refresh_from_db()
+        other.refresh_from_db()
+
+        # The same image is only fetched once, but each gets its own.
+        self.assertEqual(importer.downloaded, ['image/person/1'])
+        self.assertEqual(creator.image, 'image/person/1')
+        self.assertTrue(other.image.name.startswith('image/person/'))
+        self.assertNotEqual(other.image, creator.image)
+        self.assertEqual(importer.added, [])
+        self.assertFalse(ImportEntry.objects.exists())
+
+    def test_pending_images_before(self):
+        creator = Creator.objects.get(cvid=1)
+        ImportEntry.objects.create(
+            path=self.files[0][0], mtime=0, stage=ImportEntry.PERSISTED,
+            images=json.dumps([['comics.Creator', creator.pk,
+                                'image/person/1', 'creators', 64, 64]]))
+
+        # Queued since the import started, so another worker has it.
+        started = time.time() - 60
+        self.assertEqual(ImportJournal(before=started).pending_images(), [])
+        self.assertEqual(len(ImportJournal(before=time.time() + 60)
+                             .pending_images()), 1)
+
+    def test_shared_images_are_copied(self):
+        creator = Creator.objects.get(cvid=1)
+        other = Creator.objects.create(cvid=5, name='Joe Gill', slug='joe-gill')
+        ImportEntry.objects.create(
+            path=self.files[0][0], mtime=0, stage=ImportEntry.PERSISTED,
+            images=json.dumps([['comics.Creator', pk, 'image/person/1',
+                                'creators', 64, 64]
+                               for pk in (creator.pk, other.pk)]))
+
+        def fetch_image(image_url, folder, width, height):
+            name = f'images/{folder}/avatar.jpg'
+            os.makedirs(os.path.join(settings.MEDIA_ROOT, 'images', folder))
+            Image.new('RGB', (width, height)).save(
+                os.path.join(settings.MEDIA_ROOT, name))
+            return {'image': name, 'renditions': ''}
+
+        importer = FakeImporter()
+        importer.fetchImage = fetch_image
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            ImportPipeline(importer, journal=ImportJournal()).run([])
+            creator.refresh_from_db()
+            creator.delete()
+
+            other.refresh_from_db()
+            self.assertTrue(os.path.exists(other.image.path))
+
+    def test_resolve_batch(self):
+        importer = FakeImporter()
+        importer.getDetailBatch = lambda resource, fields, ids: {}
+        pipeline = ImportPipeline(importer)
+        known = {'publishers': set(), 'series': set(), 'arcs': set(),
+                 'creators': {1}}
+        records = [md for _, md in MetadataReader().read(self.files)]
+        resolved = pipeline.resolve_batch(records, known)
+
+        # Anything the batch lookup missed is fetched on its own, once.
+        # The publisher comes from the series response, by id.
+        self.assertEqual(importer.fetched,
+                         ['volume/100', 'publisher/125', 'person/2'])
+        self.assertEqual(resolved[0].series,
+                         {'name': 'Captain Atom', 'publisher': PUBLISHER})
+        self.assertEqual(resolved[0].publisher,
+                         {'name': 'Charlton', 'image_url': ''})
+        self.assertEqual(resolved[0].creators,
+                         {2: {'image_url': 'image/person/2'}})
+        self.assertIsNone(resolved[1].series)
+        self.assertIsNone(resolved[2].issue_response)
+        self.assertEqual(known['creators'], {1, 2})
+        self.assertEqual(known['publishers'], {125})
@@ -0,0 +1,80 @@
+from datetime import timedelta
+import os
+import tempfile
+import zipfile
+
+from django.test import TestCase
+from django.utils import timezone
+
+from comics.models import Creator, Issue, Publisher, Series, Settings
+from comics.utils.comicimporter import ComicImporter
+
+
+CIX = '''<?xml version="1.0"?>
+<ComicInfo>
+  <Series>{series}</Series>
+  <Number>{number}</Number>
+  <Publisher>{publisher}</Publisher>
+  <Writer>Steve Ditko, Joe Gill</Writer>
+  <StoryArc>{arc}</StoryArc>
+  <Web>https://comicvine.gamespot.com/issue/4000-{cvid}/</Web>
+</ComicInfo>'''
+
+
+class TestImportPlanner(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        Settings.objects.create(comics_directory=self.tmp_dir.name)
+
+        charlton = Publisher.objects.create(name='Charlton', slug='charlton')
+        series = Series.objects.create(cvid=1, name='Captain Atom',
+                                       slug='captain-atom', publisher=charlton)
+        Creator.objects.create(cvid=1, name='Steve Ditko', slug='steve-ditko')
+        Issue.objects.create(series=series, cvid=1, slug='captain-atom-1',
+                             file=os.path.join(self.tmp_dir.name, 'gone.cbz'),
+                             mod_ts=timezone.now(), date=timezone.now().date(),
+                             number='1')
+
+        self.create_archive('Captain Atom #002.cbz', series='Captain Atom',
+                            number=2, publisher='Charlton', arc='', cvid=2)
+        self.create_archive('Blue Beetle #001.cbz', series='Blue Beetle',
+                            number=1, publisher='Charlton', arc='Origins',
+                            cvid=3)
+        self.create_archive('Superman #001.cbz', series='Superman', number=1,
+                            publisher='DC Comics', arc='Origins', cvid=4)
+        with open(os.path.join(self.tmp_dir.name, 'notes.txt'), 'w') as f:
+            f.write('Not a comic')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_archive(self, name, **kwargs):
+        path = os.path.join(self.tmp_dir.name, name)
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('page01.jpg', b'')
+            zf.writestr('ComicInfo.xml', CIX.format(**kwargs))
+
+    def test_plan_comic_files(self):
+        plan = ComicImporter().plan_comic_files()
+
+        self.assertEqual(plan.added, 4)
+        self.assertEqual(plan.removed, 1)
+        self.assertEqual(plan.skipped, 1)
+        self.assertEqual(plan.issues, 3)
+        self.assertEqual(plan.publishers, {'DC Comics'})
+        self.assertEqual(plan.series, {'blue beetle', 'superman'})
+        self.assertEqual(plan.creators, {'joe gill'})
+        self.assertEqual(plan.arcs, {'origins'})
+        self.assertEqual(plan.calls, {'issue': 3, 'volume': 1, 'publisher': 1,
+                                      'person': 1, 'story_arc': 1})
+        self.assertEqual(plan.requests, 7)
+        self.assertEqual(plan.estimate, timedelta(0))
+
+        # Past the burst (less what's kept for interactive requests), each
+        # resource gets 200 requests an hour.
+        plan.issues = 15
+        self.assertEqual(plan.estimate, timedelta(minutes=3))
+
+        # Nothing was changed.
+        self.assertEqual(Issue.objects.count(), 1)
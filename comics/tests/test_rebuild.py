@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from comics.models import Creator, Issue, Publisher, Series
+from comics.utils.rebuild import MediaRebuilder, RebuildProgress
+
+
+class TestMediaRebuilder(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        media_root = self.tmp_dir.name
+        self.settings = override_settings(MEDIA_ROOT=media_root)
+        self.settings.enable()
+
+        # A cover made at an old size, with the original it came from.
+        self.save_image('images/issues/cover.jpg', (100, 150))
+        self.save_image('images/originals/issues/cover.jpg', (1280, 1920))
+        # An avatar imported before originals were kept.
+        self.save_image('images/creators/avatar.jpg', (64, 64))
+
+        publisher = Publisher.objects.create(name='Charlton', slug='charlton')
+        series = Series.objects.create(cvid=1, name='Captain Atom',
+                                       slug='captain-atom', publisher=publisher)
+        for cvid in (1, 2):
+            Issue.objects.create(series=series, cvid=cvid,
+                                 slug=f'captain-atom-{cvid}', file='',
+                                 mod_ts=timezone.now(),
+                                 date=timezone.now().date(), number=cvid,
+                                 image='images/issues/cover.jpg')
+        Creator.objects.create(cvid=1, name='Steve Ditko', slug='steve-ditko',
+                               image='images/creators/avatar.jpg')
+        self.progress_path = os.path.join(media_root, 'rebuild.json')
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmp_dir.cleanup()
+
+    def save_image(self, name, size):
+        path = os.path.join(self.tmp_dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', size).save(path)
+
+    def test_rebuild(self):
+        rebuilder = MediaRebuilder(
+            progress=RebuildProgress(self.progress_path))
+        rebuilder.rebuild()
+
+        # The shared cover is only done once.
+        self.assertEqual(rebuilder.rendered, 1)
+        self.assertEqual(rebuilder.no_original, 1)
+        self.assertEqual(rebuilder.failed, 0)
+        cover = Image.open(os.path.join(self.tmp_dir.name,
+                                        'images/issues/cover.jpg'))
+        self.assertEqual(cover.size, (640, 960))
+        self.assertEqual(set(Issue.objects.values_list('renditions',
+                                                       flat=True)),
+                         {'160,320,640'})
+        self.assertTrue(os.path.exists(os.path.join(
+            self.tmp_dir.name, 'images/issues/cover-160w.webp')))
+        self.assertFalse(os.path.exists(self.progress_path))
+
+    def test_resume(self):
+        progress = RebuildProgress(self.progress_path)
+        progress.set('comics.Issue', Issue.objects.order_by('pk').first().pk)
+        progress.save()
+
+        rebuilder = MediaRebuilder(
+            progress=RebuildProgress(self.progress_path))
+        self.assertEqual([(model.__name__, count, originals)
+                          for model, count, originals in rebuilder.plan()],
+                         [('Issue', 0, 0), ('Arc', 0, 0),
+                          ('Publisher', 0, 0), ('Creator', 1, 0)])
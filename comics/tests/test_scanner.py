@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+
+from django.test import TestCase
+
+from comics.models import LibraryDirectory, LibraryFile
+from comics.utils.scanner import LibraryScanner
+
+
+class TestLibraryScanner(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        os.makedirs(os.path.join(self.root, 'DC Comics', 'Batman'))
+        self.batman = self.create_file('DC Comics/Batman/Batman #001.cbz')
+        self.flash = self.create_file('DC Comics/Flash #001.cbz')
+        self.age_directories()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def age_directories(self):
+        # As if the library was last changed well before the scan.
+        old = time.time() - 60
+        for path, _, _ in os.walk(self.root):
+            os.utime(path, (old, old))
+
+    def create_file(self, name, data=b'comic'):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_walk(self):
+        files, directories = LibraryScanner(self.root).walk()
+        self.assertEqual(set(files), {self.batman, self.flash})
+        self.assertEqual(files[self.batman].size, 5)
+        self.assertEqual(len(directories), 3)
+
+    def test_walk_missing_directory(self):
+        files, directories = LibraryScanner(
+            os.path.join(self.root, 'missing')).walk()
+        self.assertEqual(files, {})
+        self.assertEqual(directories, {})
+
+    def test_first_scan_is_all_added(self):
+        scan = LibraryScanner(self.root).scan()
+        self.assertEqual(scan.added, {self.batman, self.flash})
+        self.assertFalse(scan.removed)
+        self.assertFalse(scan.modified)
+
+    def test_rescan(self):
+        scanner = LibraryScanner(self.root, full=True)
+        scanner.save_index(scanner.scan())
+        self.assertEqual(LibraryFile.objects.count(), 2)
+        self.assertEqual(LibraryDirectory.objects.count(), 3)
+
+        os.remove(self.flash)
+        self.create_file('DC Comics/Batman/Batman #001.cbz', b'tagged comic')
+        superman = self.create_file('DC Comics/Superman #001.cbz')
+
+        scan = scanner.scan()
+        self.assertEqual(scan.added, {superman})
+        self.assertEqual(scan.removed, {self.flash})
+        self.assertEqual(scan.modified, {self.batman})
+
+        scanner.save_index(scan)
+        scan = scanner.scan()
+        self.assertFalse(scan.added | scan.removed | scan.modified)
+
+    def test_unchanged_directories_are_skipped(self):
+        scanner = LibraryScanner(self.root)
+        scanner.save_index(scanner.scan())
+
+        scan = scanner.scan()
+        self.assertEqual(scanner.skipped, 3)
+        self.assertEqual(set(scan.files), {self.batman, self.flash})
+
+        superman = self.create_file('DC Comics/Superman #001.cbz')
+        scan = scanner.scan()
+        self.assertEqual(scanner.skipped, 2)
+        self.assertEqual(scan.added, {superman})
+
+    def test_failed_files_are_retried(self):
+        scanner = LibraryScanner(self.root)
+        scanner.save_index(scanner.scan(), exclude=[self.batman])
+
+        scan = scanner.scan()
+        self.assertEqual(scan.added, {self.batman})
+
+    def test_recently_changed_directories_are_listed(self):
+        # Coarse timestamps: a file added in the same tick as the scan
+        # leaves the directory's mtime where it was.
+        batman_dir = os.path.dirname(self.batman)
+        now = time.time()
+        os.utime(batman_dir, (now, now))
+        scanner = LibraryScanner(self.root)
+        scanner.save_index(scanner.scan())
+
+        robin = self.create_file('DC Comics/Batman/Robin #001.cbz')
+        os.utime(batman_dir, (now, now))
+        scan = scanner.scan()
+        self.assertEqual(scanner.skipped, 2)
+        self.assertEqual(scan.added, {robin})
@@ -1,9 +1,9 @@
 from datetime import datetime
 import os
 
+from celery import current_app
 from django.conf import settings
 from django.test import TestCase
-from django.test.utils import override_settings
 from django.utils.text import slugify
 
 from comics.models import Issue, Settings, Publisher, Creator
@@ -18,9 +18,15 @@ class TestTasks(TestCase):
         cls. settings = Settings.objects.create(comics_directory=test_data_dir,
                                                 api_key='27431e6787042105bd3e47e169a624521f89f3a4')
 
-    @override_settings(CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
-                       CELERY_ALWAYS_EAGER=True,
-                       BROKER_BACKEND='memory')
+    def setUp(self):
+        # The app's already been configured, so overriding the settings
+        # wouldn't stop the batches going to the real broker.
+        conf = current_app.conf
+        eager = (conf.task_always_eager, conf.task_eager_propagates)
+        conf.task_always_eager = conf.task_eager_propagates = True
+        self.addCleanup(conf.update, task_always_eager=eager[0],
+                        task_eager_propagates=eager[1])
+
     def test_import_comics_task(self):
         import_comic_files_task()
 
@@ -0,0 +1,40 @@
+import time
+import uuid
+
+from django.test import SimpleTestCase
+
+from comics.utils.throttle import TokenBucket
+
+
+class TestTokenBucket(SimpleTestCase):
+
+    def test_take(self):
+        bucket = TokenBucket(f'test-{uuid.uuid4()}', rate=10, capacity=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        # Empty, so the next callers wait in turn for it to refill.
+        self.assertAlmostEqual(bucket.take(), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket.take(), 0.2, delta=0.02)
+
+        time.sleep(0.3)
+        self.assertEqual(bucket.take(), 0)
+
+    def test_take_without_redis(self):
+        bucket = TokenBucket('test', rate=10, capacity=1,
+                             url='redis://localhost:1')
+        with self.assertLogs('thwip', 'WARNING'):
+            self.assertEqual(bucket.take(), 0)
+            self.assertGreater(bucket.take(), 0)
+
+    def test_take_with_reserve(self):
+        bucket = TokenBucket(f'test-{uuid.uuid4()}', rate=10, capacity=3)
+        # Bulk requests leave the last token alone...
+        self.assertEqual(bucket.take(reserve=1), 0)
+        self.assertEqual(bucket.take(reserve=1), 0)
+        self.assertAlmostEqual(bucket.take(reserve=1), -0.1, delta=0.02)
+        # ...for interactive ones.
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 0.1, delta=0.02)
+        # Which they wait behind.
+        self.assertAlmostEqual(bucket.take(reserve=1), -0.3, delta=0.02)
+        self.assertAlmostEqual(bucket.acquire(reserve=1), 0.3, delta=0.05)
@@ -1,6 +1,22 @@
-from django.test import SimpleTestCase
+import os
+import tempfile
 
-from comics.utils.utils import create_series_sortname
+import billiard
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from comics.utils.utils import (create_renditions, create_series_sortname,
+                                delete_renditions, process_map,
+                                resize_images)
+
+
+def square(x):
+    return x * x
+
+
+def squares(workers):
+    return (billiard.current_process().daemon,
+            list(process_map(square, [(x,) for x in range(10)], workers)))
 
 
 class UtilTest(SimpleTestCase):
@@ -8,3 +24,60 @@ class UtilTest(SimpleTestCase):
     def test_create_series_sortname(self):
         sort_name = create_series_sortname('The Avengers')
         self.assertEqual('Avengers, The', sort_name)
+
+    def test_resize_images(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            os.makedirs(os.path.join(media_root, 'images'))
+            path = os.path.join(media_root, 'images', 'avatar.jpg')
+            # Red, green & blue thirds, so only the green is left once
+            # it's cropped square.
+            img = Image.new('RGB', (1200, 400), (255, 0, 0))
+            img.paste((0, 255, 0), (400, 0, 800, 400))
+            img.paste((0, 0, 255), (800, 0, 1200, 400))
+            img.save(path)
+
+            with override_settings(MEDIA_ROOT=media_root):
+                with self.assertLogs('thwip', 'DEBUG'):
+                    new_image = resize_images(path, 'creators', 64, 64)
+
+            resized = Image.open(os.path.join(media_root, new_image))
+            self.assertEqual(resized.size, (64, 64))
+            for xy in ((2, 2), (32, 32), (61, 61)):
+                r, g, b = resized.getpixel(xy)
+                self.assertTrue(g > 200 and r < 50 and b < 50)
+
+    def test_create_renditions(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'images', 'issues'))
+            Image.new('RGB', (640, 960)).save(
+                os.path.join(media_root, 'images', 'issues', 'cover.jpg'))
+
+            renditions = create_renditions('images/issues/cover.jpg')
+            self.assertEqual(renditions, '160,320,640')
+            for name, size in (('cover-160w.webp', (160, 240)),
+                               ('cover-320w.jpg', (320, 480)),
+                               ('cover-640w.webp', (640, 960))):
+                img = Image.open(os.path.join(media_root, 'images', 'issues',
+                                              name))
+                self.assertEqual(img.size, size)
+
+            delete_renditions('images/issues/cover.jpg', renditions)
+            self.assertEqual(
+                os.listdir(os.path.join(media_root, 'images', 'issues')),
+                ['cover.jpg'])
+
+    def test_process_map(self):
+        for workers in (1, 2):
+            self.assertEqual(list(process_map(square, [(3,), (4,)], workers)),
+                             [9, 16])
+
+        # Like inside one of Celery's prefork workers.
+        pool = billiard.Pool(1)
+        try:
+            daemon, results = pool.apply(squares, (2,))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertTrue(daemon)
+        self.assertEqual(results, [x * x for x in range(10)])
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from comics.utils.watcher import (get_libc, InotifyBackend,
+                                  LibraryWatcher, PollingBackend)
+
+
+class FakeBackend(object):
+
+    def __init__(self, reads):
+        self.reads = list(reads)
+
+    def read(self, timeout=None):
+        return self.reads.pop(0)
+
+    def close(self):
+        pass
+
+
+class TestLibraryWatcher(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        os.makedirs(os.path.join(self.root, 'DC Comics'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_file(self, name):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(b'comic')
+        return path
+
+    def test_polling_backend(self):
+        backend = PollingBackend(self.root, 0)
+        path = self.create_file('DC Comics/Batman #001.cbz')
+        self.assertEqual(backend.read(), [path])
+        self.assertEqual(backend.read(), [])
+
+        os.remove(path)
+        self.assertEqual(backend.read(), [path])
+
+    @unittest.skipIf(get_libc() is None, 'inotify is not available')
+    def test_inotify_backend(self):
+        backend = InotifyBackend(self.root, get_libc())
+        try:
+            path = self.create_file('DC Comics/Batman #001.cbz')
+            self.assertEqual(backend.read(1), [path])
+
+            new_dir = os.path.join(self.root, 'Marvel')
+            os.makedirs(new_dir)
+            self.assertEqual(backend.read(1), [new_dir])
+            path = self.create_file('Marvel/X-Men #001.cbz')
+            self.assertEqual(backend.read(1), [path])
+        finally:
+            backend.close()
+
+    def test_changes_are_debounced(self):
+        batches = []
+        watcher = LibraryWatcher(self.root, batches.append, poll=True)
+        watcher.backend = FakeBackend([['a.cbz'], ['b.cbz'], [],
+                                       None, ['c.cbz'], []])
+        with self.assertRaises(IndexError):
+            watcher.run()
+
+        self.assertEqual(batches, [{'a.cbz', 'b.cbz'}, None])
@@ -1,26 +1,33 @@
-from datetime import datetime, timedelta, date
+from datetime import datetime, date
 import itertools
-import json
 import logging
 import os
 import re
+import time
 from urllib.parse import unquote_plus
-from urllib.request import urlretrieve
+import uuid
 
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.utils.text import slugify
-from ratelimit import limits, sleep_and_retry
 import requests
-import requests_cache
 
 from comics.models import (Arc, Creator, Issue, Publisher,
                            Role, Credits, Series, Settings)
 
 from . import utils
-from .comicapi.comicarchive import MetaDataStyle, ComicArchive
+from .comicapi.comicarchive import MetaDataStyle
 from .comicapi.issuestring import IssueString
+from .comicvine import (BASE_URL, ComicVineClient, image_rendition,
+                        parse_date, resource_for)
+from .cvcache import LookupMisses
+from .journal import ImportJournal
+from .metadata import fingerprint_files, get_issue_cvid
+from .pipeline import ImportPipeline, ResolvedIssue
+from .planner import ImportPlanner
+from .scanner import LibraryScanner, chunks, under_paths
+from .throttle import BULK, INTERACTIVE, ComicVineLimiter
 
 
 TODAY = date.today()
@@ -35,94 +42,161 @@ CREATOR_IMG_HEIGHT = 64
 NORMAL_IMG_WIDTH = 640
 NORMAL_IMG_HEIGHT = 960
 
-ONE_MINUTE = 60
+# Times files are put back in the queue while Comic Vine is unavailable,
+# before they're left for the next import.
+REQUEUE_LIMIT = 5
 
 
-def get_recursive_filelist(pathlist):
-    # Get a recursive list of all files under all path items in the list.
-    filelist = []
-    if os.path.isdir(pathlist):
-        for root, _, files in os.walk(pathlist):
-            for f in files:
-                filelist.append(os.path.join(root, f))
-    return filelist
-
-
-class CVTypeID:
-    Issue = '4000'
-    Person = '4040'
-    Publisher = '4010'
-    StoryArc = '4045'
-    Volume = '4050'
+def make_mod_ts(mtime):
+    # Issue.mod_ts has always been stored as the utc time of the file's
+    # mtime tagged with the current timezone, so keep doing the same.
+    current_timezone = timezone.get_current_timezone()
+    return timezone.make_aware(datetime.utcfromtimestamp(mtime),
+                               current_timezone)
 
 
 class ComicImporter(object):
 
-    def __init__(self):
+    def __init__(self, priority=BULK):
         # Configure logging
         logging.getLogger("requests").setLevel(logging.WARNING)
         self.logger = logging.getLogger('thwip')
-        # Setup requests caching
-        expire_after = timedelta(hours=1)
-        requests_cache.install_cache('cv-cache',
-                                     backend='redis',
-                                     expire_after=expire_after)
-        requests_cache.core.remove_expired_responses()
         # temporary values until settings view is created.
         self.api_key = Settings.get_solo().api_key
         self.directory_path = Settings.get_solo().comics_directory
-        # API Strings
-        self.baseurl = 'https://comicvine.gamespot.com/api'
-        self.imageurl = 'https://comicvine.gamespot.com/api/image/'
-        self.base_params = {'format': 'json',
-                            'api_key': self.api_key}
-        self.headers = {'user-agent': 'thwip'}
+        # Comic Vine client (cached, with pooled connections), in the
+        # rate limit's lane for the kind of work being done. Interactive
+        # work is an explicit refresh, so it doesn't use the caches.
+        self.cv = ComicVineClient(
+            self.api_key, misses=LookupMisses(),
+            base_url=getattr(settings, 'COMICVINE_BASE_URL', BASE_URL),
+            limiter=ComicVineLimiter(priority=priority),
+            fresh=(priority == INTERACTIVE))
         # API field strings
-        self.arc_fields = 'deck,description,id,image,name,site_detail_url'
-        self.creator_fields = 'deck,description,id,image,name,site_detail_url'
-        self.publisher_fields = 'deck,description,id,image,name,site_detail_url'
-        self.series_fields = 'api_detail_url,deck,description,id,name,publisher,site_detail_url,start_year'
-        self.issue_fields = 'api_detail_url,cover_date,deck,description,id,image,issue_number'
+        self.arc_fields = 'date_last_updated,deck,description,id,image,name,site_detail_url'
+        self.creator_fields = 'date_last_updated,deck,description,id,image,name,site_detail_url'
+        self.publisher_fields = 'date_last_updated,deck,description,id,image,name,site_detail_url'
+        self.series_fields = 'api_detail_url,date_last_updated,deck,description,id,name,publisher,site_detail_url,start_year'
+        self.issue_fields = 'api_detail_url,cover_date,date_last_updated,deck,description,id,image,issue_number'
         self.issue_fields += ',name,site_detail_url,story_arc_credits,volume,person_credits'
         # Initial Comic Book info to search
         self.style = MetaDataStyle.CIX
-
-    def checkIfRemovedOrModified(self, comic, pathlist):
-        remove = False
-
-        def inFolderlist(filepath, pathlist):
-            for p in pathlist:
-                if p in filepath:
-                    return True
-            return False
-
-        if not (os.path.exists(comic.file)):
-            self.logger.info(f"Removing missing {comic.file}")
-            remove = True
-        elif not inFolderlist(comic.file, pathlist):
-            self.logger.info(f"Removing unwanted {comic.file}")
-            remove = True
+        # Number of processes used to read the archives' metadata.
+        self.parse_workers = getattr(settings, 'IMPORT_PARSE_WORKERS', 1)
+        # Number of threads fetching images during an import.
+        self.image_workers = getattr(settings, 'IMPORT_IMAGE_WORKERS', 4)
+        self.batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', 50)
+        # Set by the import pipeline to fetch images in the background.
+        self.image_handler = None
+
+    def findStaleIssues(self, scan, issues=None):
+        '''
+        Compares the issues against a scan. Returns the ids of issues whose
+        file was modified, a dict of id -> (path, fingerprint) for issues
+        whose file is missing, and a list of (id, path) for issues that
+        don't have a fingerprint yet.
+        '''
+        if issues is None:
+            issues = Issue.objects.all()
+
+        modified = {}
+        missing = {}
+        unfingerprinted = []
+        rows = issues.values_list('id', 'file', 'mod_ts', 'fingerprint')
+        for pk, path, mod_ts, fingerprint in rows.iterator():
+            state = scan.files.get(path)
+            if state is None:
+                missing[pk] = (path, fingerprint)
+            elif path in scan.modified:
+                modified[pk] = path
+            elif path in scan.added and make_mod_ts(state.mtime) != mod_ts:
+                # The file isn't in the index yet (ie. first scan), so
+                # fall back to the modified time saved with the issue.
+                modified[pk] = path
+            elif not fingerprint:
+                unfingerprinted.append((pk, path))
+
+        return modified, missing, unfingerprinted
+
+    def findMovedIssues(self, scan, missing):
+        '''
+        Matches issues whose file has gone missing against new files with
+        the same content fingerprint. Returns a dict of id -> new path.
+        '''
+        by_fingerprint = {}
+        for pk, (_, fingerprint) in missing.items():
+            if fingerprint:
+                by_fingerprint.setdefault(fingerprint, []).append(pk)
+        if not by_fingerprint:
+            return {}
+
+        db_paths = set(Issue.objects.values_list('file', flat=True))
+        new_paths = [f for f in scan.added if f not in db_paths]
+        fingerprints = fingerprint_files(new_paths)
+
+        moved = {}
+        for path in sorted(new_paths):
+            pks = by_fingerprint.get(fingerprints[path])
+            if pks:
+                moved[pks.pop()] = path
+
+        return moved
+
+    def removeMissingOrModified(self, scan, issues=None):
+        modified, missing, unfingerprinted = self.findStaleIssues(scan, issues)
+
+        stale = []
+        for pk, path in modified.items():
+            self.logger.info(f"Removing modified {path}")
+            stale.append(pk)
+
+        moved = self.findMovedIssues(scan, missing)
+        self.moveComics(scan, moved)
+        for pk, (path, _) in missing.items():
+            if pk not in moved:
+                self.logger.info(f"Removing missing or unwanted {path}")
+                stale.append(pk)
+
+        for comic in Issue.objects.filter(id__in=stale).select_related('series'):
+            self.removeComic(comic)
+
+        # Issues imported before fingerprints existed need one to be
+        # recognised if they're moved later on.
+        self.setFingerprints(unfingerprinted)
+
+    def moveComics(self, scan, moved):
+        '''
+        Points moved issues at their new path, rather than deleting them &
+        fetching them all again from Comic Vine.
+        '''
+        issues = list(Issue.objects.filter(id__in=moved))
+        for issue in issues:
+            self.logger.info(f"Moving {issue.file} to {moved[issue.id]}")
+            issue.file = moved[issue.id]
+            issue.mod_ts = make_mod_ts(scan.files[issue.file].mtime)
+        Issue.objects.bulk_update(issues, ['file', 'mod_ts'], batch_size=500)
+
+    def setFingerprints(self, issues):
+        if not issues:
+            return
+
+        fingerprints = fingerprint_files([path for _, path in issues])
+        updates = [Issue(id=pk, fingerprint=fingerprints[path])
+                   for pk, path in issues if fingerprints[path]]
+        Issue.objects.bulk_update(updates, ['fingerprint'], batch_size=500)
+
+    def removeComic(self, comic):
+        series = comic.series
+        s_count = series.issue_count
+        # If this is the only issue for a series, delete the series.
+        if s_count == 1:
+            series.delete()
+            self.logger.info(f'Deleting series: {series}')
         else:
-            current_timezone = timezone.get_current_timezone()
-            c = datetime.utcfromtimestamp(os.path.getmtime(comic.file))
-            curr = timezone.make_aware(c, current_timezone)
-            prev = comic.mod_ts
-
-            if curr != prev:
-                self.logger.info(f"Removing modified {comic.file}")
-                remove = True
-
-        if remove:
-            series = Series.objects.get(id=comic.series.id)
-            s_count = series.issue_count
-            # If this is the only issue for a series, delete the series.
-            if s_count == 1:
-                series.delete()
-                self.logger.info(f'Deleting series: {series}')
-            else:
-                comic.delete()
+            comic.delete()
 
-    def getCVObjectData(self, response):
+    def getCVObjectData(self, response, download_image=True,
+                        image_width=NORMAL_IMG_WIDTH):
         '''
         Gathers object data from a response and tests each value to make sure
         it exists in the response before trying to set it.
@@ -130,6 +204,10 @@ class ComicImporter(object):
         CVID and CVURL will always exist in a ComicVine response, so there
         is no need to verify this data.
 
+        The image is the smallest rendition at least image_width wide. If
+        download_image is False it's left for the caller to fetch from
+        image_url.
+
         Returns a dictionary with all the gathered data.
         '''
 
@@ -165,19 +243,30 @@ class ComicImporter(object):
 
         # Get Image
         image = ''
+        cv_image_url = ''
         if 'image' in response:
             if response['image']:
-                image_url = self.imageurl + \
-                    response['image']['super_url'].rsplit('/', 1)[-1]
+                image_url = image_rendition(response['image'], image_width)
                 image_filename = unquote_plus(image_url.split('/')[-1])
                 if image_filename != '1-male-good-large.jpg' and not re.match(".*question_mark_large.*.jpg", image_filename):
-                    try:
-                        image = utils.test_image(urlretrieve(
-                            image_url, 'media/images/' + image_filename)[0])
-                    except OSError as e:
-                        self.logger.error(
-                            f'getCVObjectData retrieve image - {e}')
-                        image = None
+                    cv_image_url = image_url
+                    if download_image:
+                        image = self.downloadImage(image_url)
+
+        # When Comic Vine last changed it.
+        updated = None
+        if 'date_last_updated' in response:
+            updated = parse_date(response['date_last_updated'])
+
+        # Get Publisher (only exists for Series objects). Just the id & url,
+        # which is enough to look it up without fetching the series again.
+        publisher = None
+        if 'publisher' in response:
+            if response['publisher']:
+                publisher = {
+                    'id': response['publisher']['id'],
+                    'api_detail_url': response['publisher']['api_detail_url'],
+                }
 
         # Create data object
         data = {
@@ -188,22 +277,105 @@ class ComicImporter(object):
             'number': number,
             'desc': utils.cleanup_html(desc, True),
             'image': image,
+            'image_url': cv_image_url,
+            'publisher': publisher,
+            'updated': updated,
         }
 
         return data
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
-    def refreshCreatorData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.creator_fields
+    @staticmethod
+    def imageWidth(resource):
+        if resource == 'person':
+            return CREATOR_IMG_WIDTH
+        return NORMAL_IMG_WIDTH
+
+    def downloadImage(self, image_url):
+        image_filename = unquote_plus(image_url.split('/')[-1])
+        # Images are fetched in parallel, so each gets a file of its own.
+        image_dir = os.path.join(settings.MEDIA_ROOT, 'images')
+        os.makedirs(image_dir, exist_ok=True)
+        path = os.path.join(image_dir, f'{uuid.uuid4().hex}-{image_filename}')
+        try:
+            image = utils.test_image(self.cv.download(image_url, path))
+        except (OSError, requests.exceptions.RequestException) as e:
+            self.logger.error(f'getCVObjectData retrieve image - {e}')
+            image = None
+        if not image and os.path.exists(path):
+            os.remove(path)
+
+        return image
 
+    def fetchImage(self, image_url, folder, width, height):
+        '''
+        Downloads an image, resizes it into the folder and makes its
+        renditions. Returns the image and renditions fields to set, or an
+        empty dict if that wasn't possible.
+        '''
+        image = self.downloadImage(image_url)
+        if not image:
+            return {}
+
+        new_image = utils.resize_images(image, folder, width, height)
+        if not new_image:
+            os.remove(image)
+            return {}
+        # Keep the original, so the image can be made again without
+        # going back to Comic Vine.
+        utils.keep_original(image, new_image)
+
+        return {'image': new_image,
+                'renditions': utils.create_renditions(new_image)}
+
+    @staticmethod
+    def copyImage(fields):
+        '''
+        Returns the fields for a copy of an image from fetchImage, for
+        another object that wants the same one.
+        '''
+        return {'image': utils.copy_image(fields['image'],
+                                          fields['renditions']),
+                'renditions': fields['renditions']}
+
+    def setImage(self, db_obj, image_url, folder, width, height):
+        # When running in the import pipeline the image is handed off to be
+        # fetched in the background, otherwise just get it now.
+        if not image_url:
+            return
+
+        if self.image_handler is not None:
+            self.image_handler(db_obj, image_url, folder, width, height)
+        else:
+            fields = self.fetchImage(image_url, folder, width, height)
+            if fields:
+                for name, value in fields.items():
+                    setattr(db_obj, name, value)
+                db_obj.save()
+
+    @staticmethod
+    def hasChanged(db_obj, data):
+        '''
+        Whether Comic Vine has updated an entity since it was saved. If
+        either side doesn't know when, assume it has.
+        '''
+        return (db_obj.cv_updated is None or data['updated'] is None or
+                data['updated'] > db_obj.cv_updated)
+
+    def refreshImage(self, db_obj, image_url, folder, width, height):
+        if not image_url:
+            return
+        fields = self.fetchImage(image_url, folder, width, height)
+        if fields:
+            # Delete the existing image before adding the new one.
+            if db_obj.image and not utils.image_shared(db_obj):
+                utils.delete_image_copies(db_obj.image.name, db_obj.renditions)
+                db_obj.image.delete(save=False)
+            for name, value in fields.items():
+                setattr(db_obj, name, value)
+
+    def refreshCreatorData(self, cvid):
         try:
-            resp = requests.get(
-                self.baseurl + '/person/' + CVTypeID.Person + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('person', cvid, self.creator_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error(f'refreshCreatorData - {e}')
             return False
@@ -211,38 +383,27 @@ class ComicImporter(object):
         if not (resp['results']):
             return False
 
-        data = self.getCVObjectData(resp['results'])
+        data = self.getCVObjectData(resp['results'], download_image=False,
+                                    image_width=CREATOR_IMG_WIDTH)
 
         creator_obj = Creator.objects.get(cvid=cvid)
+        if not self.hasChanged(creator_obj, data):
+            self.logger.info(f'No changes for: {creator_obj}')
+            return True
 
-        if data['image'] != '':
-            if (creator_obj.image):
-                creator_obj.image.delete()
-            creator_obj.image = utils.resize_images(data['image'],
-                                                    CREATORS_FOLDERS,
-                                                    CREATOR_IMG_WIDTH,
-                                                    CREATOR_IMG_HEIGHT)
-            os.remove(data['image'])
-
+        self.refreshImage(creator_obj, data['image_url'], CREATORS_FOLDERS,
+                          CREATOR_IMG_WIDTH, CREATOR_IMG_HEIGHT)
         creator_obj.name = data['name']
         creator_obj.desc = data['desc']
+        creator_obj.cv_updated = data['updated']
         creator_obj.save()
         self.logger.info(f'Refresh metadata for: {creator_obj}')
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def refreshIssueData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.issue_fields
-
         try:
-            resp = requests.get(
-                self.baseurl + '/issue/' + CVTypeID.Issue + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('issue', cvid, self.issue_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error(f'refreshIssueData - {e}')
             return False
@@ -250,9 +411,12 @@ class ComicImporter(object):
         if not (resp['results']):
             return False
 
-        data = self.getCVObjectData(resp['results'])
+        data = self.getCVObjectData(resp['results'], download_image=False)
 
         issue_obj = Issue.objects.get(cvid=cvid)
+        if not self.hasChanged(issue_obj, data):
+            self.logger.info(f'No changes for: {issue_obj}')
+            return True
 
         # Clear any arcs the issue might have.
         issue_obj.arcs.clear()
@@ -260,40 +424,20 @@ class ComicImporter(object):
         # Add any story arcs.
         self.addIssueStoryArcs(cvid, resp['results']['story_arc_credits'])
 
-        # TODO: Makes sense to move the image refresh into a
-        #       separate function but for now let's leave it here.
-        if data['image'] != '':
-            # Delete the existing image before adding the new one.
-            if (issue_obj.image):
-                issue_obj.image.delete()
-            # Resize the image and save the new image then
-            # remove the original.
-            issue_obj.image = utils.resize_images(data['image'],
-                                                  ISSUES_FOLDER,
-                                                  NORMAL_IMG_WIDTH,
-                                                  NORMAL_IMG_HEIGHT)
-            os.remove(data['image'])
-
+        self.refreshImage(issue_obj, data['image_url'], ISSUES_FOLDER,
+                          NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
         issue_obj.desc = data['desc']
         issue_obj.name = data['name']
+        issue_obj.cv_updated = data['updated']
         issue_obj.save()
 
         self.logger.info(f'Refreshed metadata for: {issue_obj}')
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def refreshIssueCreditsData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = 'person_credits'
-
         try:
-            resp = requests.get(
-                self.baseurl + '/issue/' + CVTypeID.Issue + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('issue', cvid, 'person_credits')
         except requests.exceptions.RequestException as e:
             self.logger.error(f'refreshIssueCredits - {e}')
             return False
@@ -313,18 +457,9 @@ class ComicImporter(object):
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def refreshSeriesData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.series_fields
-
         try:
-            resp = requests.get(
-                self.baseurl + '/volume/' + CVTypeID.Volume + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('volume', cvid, self.series_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error(f'refreshSeriesData - {e}')
             return False
@@ -332,29 +467,25 @@ class ComicImporter(object):
         if not (resp['results']):
             return False
 
-        data = self.getCVObjectData(resp['results'])
+        data = self.getCVObjectData(resp['results'], download_image=False)
 
         series = Series.objects.get(cvid=cvid)
+        if series.publisher is None and data['publisher']:
+            series.publisher = self.getPublisher(data['publisher'])
+        elif not self.hasChanged(series, data):
+            self.logger.info(f'No changes for: {series}')
+            return True
         series.desc = data['desc']
         series.year = data['year']
+        series.cv_updated = data['updated']
         series.save()
         self.logger.info(f'Refreshed metadata for: {series}')
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def refreshPublisherData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.publisher_fields
-
         try:
-            resp = requests.get(
-                self.baseurl + '/publisher/' +
-                CVTypeID.Publisher + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('publisher', cvid, self.publisher_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error(f'refreshPublisherData - {e}')
             return False
@@ -362,32 +493,24 @@ class ComicImporter(object):
         if not (resp['results']):
             return False
 
-        data = self.getCVObjectData(resp['results'])
-
         # Currently I'm not refreshing the image until the
-        # cropping code is refactored, so let's remove the image.
-        os.remove(data['image'])
+        # cropping code is refactored, so don't download it.
+        data = self.getCVObjectData(resp['results'], download_image=False)
 
         publisher = Publisher.objects.get(cvid=cvid)
+        if not self.hasChanged(publisher, data):
+            self.logger.info(f'No changes for: {publisher}')
+            return True
         publisher.desc = data['desc']
+        publisher.cv_updated = data['updated']
         publisher.save()
         self.logger.info(f'Refresh metadata for: {publisher}')
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def refreshArcData(self, cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.arc_fields
-
         try:
-            resp = requests.get(
-                self.baseurl + '/story_arc/' +
-                CVTypeID.StoryArc + '-' + str(cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
+            resp = self.cv.detail('story_arc', cvid, self.arc_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error('%s', e)
             return False
@@ -395,40 +518,33 @@ class ComicImporter(object):
         if not (resp['results']):
             return False
 
-        data = self.getCVObjectData(resp['results'])
+        data = self.getCVObjectData(resp['results'], download_image=False)
 
         arc_obj = Arc.objects.get(cvid=cvid)
+        if not self.hasChanged(arc_obj, data):
+            self.logger.info(f'No changes for: {arc_obj}')
+            return True
 
-        if data['image'] != '':
-            if (arc_obj.image):
-                arc_obj.image.delete()
-
-            arc_obj.image = utils.resize_images(data['image'],
-                                                ARCS_FOLDER,
-                                                NORMAL_IMG_WIDTH,
-                                                NORMAL_IMG_HEIGHT)
-            os.remove(data['image'])
-
+        self.refreshImage(arc_obj, data['image_url'], ARCS_FOLDER,
+                          NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
         arc_obj.desc = data['desc']
+        arc_obj.cv_updated = data['updated']
         arc_obj.save()
         self.logger.info(f'Refreshed metadata for: {arc_obj}')
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
-    def getIssue(self, issue_cvid):
-        issue_params = self.base_params
-        issue_params['field_list'] = self.issue_fields
+    def getRetryAfter(self):
+        '''
+        Returns how many seconds until Comic Vine can be tried again, or 0
+        if it's available.
+        '''
+        return self.cv.breaker.retry_after()
 
+    def getIssue(self, issue_cvid):
         try:
-            response = requests.get(
-                self.baseurl + '/issue/' +
-                CVTypeID.Issue + '-' + str(issue_cvid),
-                params=issue_params,
-                headers=self.headers,
-            ).json()
-        except (requests.exceptions.RequestException, json.decoder.JSONDecodeError) as e:
+            response = self.cv.detail('issue', issue_cvid, self.issue_fields)
+        except requests.exceptions.RequestException as e:
             self.logger.error(f'getIssue - {e}')
             response = None
 
@@ -436,100 +552,79 @@ class ComicImporter(object):
 
     def setIssueDetail(self, issue_cvid, issue_response):
 
-        data = self.getCVObjectData(issue_response['results'])
+        data = self.getCVObjectData(issue_response['results'],
+                                    download_image=False)
 
         issue = Issue.objects.get(cvid=issue_cvid)
-        if data['image'] != '':
-            img = utils.resize_images(data['image'],
-                                      ISSUES_FOLDER,
-                                      NORMAL_IMG_WIDTH,
-                                      NORMAL_IMG_HEIGHT)
-            if img:
-                issue.image = img
-            os.remove(data['image'])
         issue.desc = data['desc']
+        issue.cv_updated = data['updated']
         issue.save()
+        self.setImage(issue, data['image_url'], ISSUES_FOLDER,
+                      NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
 
         return True
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
     def getSeriesDetail(self, api_url):
-        params = self.base_params
-        params['field_list'] = self.series_fields
-
         try:
-            response = requests.get(
-                api_url,
-                params=params,
-                headers=self.headers,
-            ).json()
+            response = self.cv.get(api_url, self.series_fields)
         except requests.exceptions.RequestException as e:
             self.logger.error(f'getSeriesDetail - {e}')
             return None
 
-        data = self.getCVObjectData(response['results'])
+        data = self.getCVObjectData(response['results'], download_image=False)
 
         return data
 
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
-    def getPublisherData(self, response_issue):
-        series_params = self.base_params
-        series_params['field_list'] = 'publisher'
-
+    def getPublisherData(self, publisherResponse, download_image=True):
+        '''
+        Looks up the publisher a series response points to.
+        '''
         try:
-            response_series = requests.get(
-                response_issue['results']['volume']['api_detail_url'],
-                params=series_params,
-                headers=self.headers,
-            ).json()
+            response = self.cv.get(publisherResponse['api_detail_url'],
+                                   self.publisher_fields)
         except requests.exceptions.RequestException as e:
-            self.logger.error(f'getPublisherData(volume) - {e}')
+            self.logger.error(f'getPublisherData - {e}')
             return None
 
-        params = self.base_params
-        params['field_list'] = self.publisher_fields
+        data = self.getCVObjectData(response['results'], download_image)
 
-        api_url = response_series['results']['publisher']['api_detail_url']
+        return data
 
+    def getDetailData(self, fields, api_url, download_image=True):
         try:
-            response = requests.get(
-                api_url,
-                params=params,
-                headers=self.headers,
-            ).json()
+            response = self.cv.get(api_url, fields)
         except requests.exceptions.RequestException as e:
-            self.logger.error(f'getPublisherData(publisher) - {e}')
+            self.logger.error(f'getDetailInfo - {e}')
             return None
 
-        data = self.getCVObjectData(response['results'])
-
-        return data
-
-    @sleep_and_retry
-    @limits(calls=7, period=ONE_MINUTE)
-    def getDetailInfo(self, db_obj, fields, api_url):
-        params = self.base_params
-        params['field_list'] = fields
+        return self.getCVObjectData(response['results'], download_image,
+                                    self.imageWidth(resource_for(api_url)))
 
+    def getDetailBatch(self, resource, fields, ids):
+        '''
+        Returns a dict of cvid -> data for a number of the same kind of
+        entity, looked up a hundred at a time. Anything Comic Vine didn't
+        send back is left out.
+        '''
         try:
-            response = requests.get(
-                api_url,
-                params=params,
-                headers=self.headers,
-            ).json()
-        except (requests.exceptions.RequestException, json.decoder.JSONDecodeError) as e:
-            self.logger.error(f'getDetailInfo - {e}')
-            return False
+            results = self.cv.batch(resource, ids, fields)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f'getDetailBatch({resource}) - {e}')
+            return {}
 
-        data = self.getCVObjectData(response['results'])
+        width = self.imageWidth(resource)
+        return {cvid: self.getCVObjectData(response, download_image=False,
+                                           image_width=width)
+                for cvid, response in results.items()}
 
+    @classmethod
+    def setDetailInfo(cls, db_obj, data):
         # Year (only exists for Series objects)
         if data['year'] is not None:
             db_obj.year = data['year']
         db_obj.cvurl = data['cvurl']
         db_obj.desc = data['desc']
+        db_obj.cv_updated = data['updated']
         # If the image name from Comic Vine is too large, don't save it since it will
         # cause a DB error. Using 132 as the value since that will take into account the
         # upload_to value from the longest model (Pubishers).
@@ -537,38 +632,33 @@ class ComicImporter(object):
             db_obj.image = data['image']
         db_obj.save()
 
-        return True
-
-    def addIssueStoryArcs(self, issue_cvid, arc_response):
+    def addIssueStoryArcs(self, issue_cvid, arc_response, prefetched=None):
+        prefetched = prefetched or {}
         issue_obj = Issue.objects.get(cvid=issue_cvid)
         for arc in arc_response:
-            arc_obj = self.getStoryArc(arc)
+            arc_obj = self.getStoryArc(arc, prefetched.get(arc['id']))
             if arc_obj:
                 issue_obj.arcs.add(arc_obj)
 
-    def getStoryArc(self, arcResponse):
+    def getStoryArc(self, arcResponse, data=None):
+        story_obj = Arc.objects.filter(cvid=arcResponse['id']).first()
+        if story_obj is not None:
+            return story_obj
+
         story_obj, s_create = Arc.objects.get_or_create(
-            cvid=arcResponse['id'],)
+            cvid=arcResponse['id'],
+            defaults={'name': arcResponse['name'],
+                      'slug': self.createSlug(Arc, arcResponse['name'])})
 
         if s_create:
-            new_slug = orig = slugify(arcResponse['name'])
-            for x in itertools.count(1):
-                if not Arc.objects.filter(slug=new_slug).exists():
-                    break
-                new_slug = f'{orig}-{x}'
-
-            story_obj.name = arcResponse['name']
-            story_obj.slug = new_slug
-            story_obj.save()
-
-            res = self.getDetailInfo(story_obj,
-                                     self.arc_fields,
-                                     arcResponse['api_detail_url'])
-
-            if story_obj.image:
-                self.create_arc_images(story_obj, ARCS_FOLDER)
-
-            if res:
+            if data is None:
+                data = self.getDetailData(self.arc_fields,
+                                          arcResponse['api_detail_url'],
+                                          download_image=False)
+            if data is not None:
+                self.setDetailInfo(story_obj, data)
+                self.setImage(story_obj, data['image_url'], ARCS_FOLDER,
+                              NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
                 self.logger.info(f'Added storyarc: {story_obj}')
             else:
                 self.logger.info(
@@ -576,10 +666,11 @@ class ComicImporter(object):
 
         return story_obj
 
-    def addIssueCredits(self, issue_cvid, credits_response):
+    def addIssueCredits(self, issue_cvid, credits_response, prefetched=None):
+        prefetched = prefetched or {}
         issue_obj = Issue.objects.get(cvid=issue_cvid)
         for p in credits_response:
-            creator_obj = self.getCreator(p)
+            creator_obj = self.getCreator(p, prefetched.get(p['id']))
             credits_obj = Credits.objects.create(
                 creator=creator_obj, issue=issue_obj)
 
@@ -590,29 +681,26 @@ class ComicImporter(object):
                 r, _ = Role.objects.get_or_create(name=role.title())
                 credits_obj.role.add(r)
 
-    def getCreator(self, creatorResponse):
+    def getCreator(self, creatorResponse, data=None):
+        creator_obj = Creator.objects.filter(cvid=creatorResponse['id']).first()
+        if creator_obj is not None:
+            return creator_obj
+
         creator_obj, c_create = Creator.objects.get_or_create(
-            cvid=creatorResponse['id'],)
+            cvid=creatorResponse['id'],
+            defaults={'name': creatorResponse['name'],
+                      'slug': self.createSlug(Creator,
+                                              creatorResponse['name'])})
 
         if c_create:
-            new_slug = orig = slugify(creatorResponse['name'])
-            for x in itertools.count(1):
-                if not Creator.objects.filter(slug=new_slug).exists():
-                    break
-                new_slug = f'{orig}-{x}'
-
-            creator_obj.name = creatorResponse['name']
-            creator_obj.slug = new_slug
-            creator_obj.save()
-
-            res = self.getDetailInfo(creator_obj,
-                                     self.creator_fields,
-                                     creatorResponse['api_detail_url'])
-
-            if creator_obj.image:
-                self.create_images(creator_obj, CREATORS_FOLDERS)
-
-            if res:
+            if data is None:
+                data = self.getDetailData(self.creator_fields,
+                                          creatorResponse['api_detail_url'],
+                                          download_image=False)
+            if data is not None:
+                self.setDetailInfo(creator_obj, data)
+                self.setImage(creator_obj, data['image_url'], CREATORS_FOLDERS,
+                              CREATOR_IMG_WIDTH, CREATOR_IMG_HEIGHT)
                 self.logger.info(f'Added creator: {creator_obj}')
             else:
                 self.logger.info(
@@ -620,98 +708,84 @@ class ComicImporter(object):
 
         return creator_obj
 
-    def getSeries(self, issueResponse):
-        series_cvid = issueResponse['results']['volume']['id']
-
-        series_obj, s_create = Series.objects.get_or_create(
-            cvid=int(series_cvid),)
+    def getSeries(self, issueResponse, data=None, publisher_data=None):
+        '''
+        Gets or creates the issue's series. A new series gets its publisher
+        from the same volume response, so nothing is fetched twice.
+        '''
+        series_cvid = int(issueResponse['results']['volume']['id'])
+        series_obj = Series.objects.filter(cvid=series_cvid).first()
+        if series_obj is not None:
+            return series_obj
 
-        if s_create:
+        if data is None:
             series_url = issueResponse['results']['volume']['api_detail_url']
             data = self.getSeriesDetail(series_url)
-            if data is not None:
-                # Create the slug & make sure it's not a duplicate
-                new_slug = orig = slugify(data['name'])
-                for x in itertools.count(1):
-                    if not Series.objects.filter(slug=new_slug).exists():
-                        break
-                    new_slug = f'{orig}-{x}'
-
-            sort_name = utils.create_series_sortname(data['name'])
-            series_obj.slug = new_slug
-            series_obj.cvurl = data['cvurl']
-            series_obj.name = data['name']
-            series_obj.sort_title = sort_name
-            series_obj.year = data['year']
-            series_obj.desc = data['desc']
-            series_obj.save()
+        if data is None:
+            return None
+
+        publisher_obj = None
+        if data.get('publisher'):
+            publisher_obj = self.getPublisher(data['publisher'],
+                                              publisher_data)
+
+        series_obj, s_create = Series.objects.get_or_create(
+            cvid=series_cvid,
+            defaults={
+                'name': data['name'],
+                'slug': self.createSlug(Series, data['name']),
+                'sort_title': utils.create_series_sortname(data['name']),
+                'cvurl': data['cvurl'],
+                'year': data['year'],
+                'desc': data['desc'],
+                'cv_updated': data['updated'],
+                'publisher': publisher_obj,
+            })
+        if s_create:
             self.logger.info(f'Added series: {series_obj}')
 
         return series_obj
 
-    def getPublisher(self, publisher, issueResponse):
-        publisher_obj, p_create = Publisher.objects.get_or_create(name=publisher,
-                                                                  slug=slugify(publisher),)
+    def getPublisher(self, publisherResponse, data=None):
+        '''
+        Gets or creates a publisher by its Comic Vine id. One added before
+        publishers had ids is matched by name instead, and given the id.
+        '''
+        publisher_cvid = int(publisherResponse['id'])
+        publisher_obj = Publisher.objects.filter(cvid=publisher_cvid).first()
+        if publisher_obj is not None:
+            return publisher_obj
+
+        p = data
+        if p is None:
+            p = self.getPublisherData(publisherResponse, download_image=False)
+        if p is None:
+            return None
 
+        publisher_obj = Publisher.objects.filter(cvid__isnull=True,
+                                                 name=p['name']).first()
+        if publisher_obj is not None:
+            publisher_obj.cvid = publisher_cvid
+            publisher_obj.save()
+            return publisher_obj
+
+        publisher_obj, p_create = Publisher.objects.get_or_create(
+            cvid=publisher_cvid,
+            defaults={'name': p['name'],
+                      'slug': self.createSlug(Publisher, p['name']),
+                      'cvurl': p['cvurl'],
+                      'desc': p['desc'],
+                      'cv_updated': p['updated']})
         if p_create:
-            p = self.getPublisherData(issueResponse)
-            if p is not None:
-                publisher_obj.cvid = int(p['cvid'])
-                publisher_obj.cvurl = p['cvurl']
-                publisher_obj.desc = p['desc']
-                if p['image'] is not '':
-                    publisher_obj.image = utils.resize_images(p['image'],
-                                                              PUBLISHERS_FOLDER,
-                                                              NORMAL_IMG_WIDTH,
-                                                              NORMAL_IMG_HEIGHT)
-                    # Delete the original image
-                    os.remove(p['image'])
-                publisher_obj.save()
+            self.setImage(publisher_obj, p['image_url'], PUBLISHERS_FOLDER,
+                          NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
             self.logger.info(f'Added publisher: {publisher_obj}')
 
         return publisher_obj
 
-    @classmethod
-    def create_arc_images(cls, db_obj, img_dir):
-        base_name = os.path.basename(db_obj.image.name)
-        old_image_path = settings.MEDIA_ROOT + '/images/' + base_name
-        db_obj.image = utils.resize_images(db_obj.image, img_dir,
-                                           NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT)
-        db_obj.save()
-        os.remove(old_image_path)
-
-    # Only the Creators are using this right now.
-    @classmethod
-    def create_images(cls, db_obj, img_dir):
-        base_name = os.path.basename(db_obj.image.name)
-        old_image_path = settings.MEDIA_ROOT + '/images/' + base_name
-        db_obj.image = utils.resize_images(db_obj.image, img_dir,
-                                           CREATOR_IMG_WIDTH, CREATOR_IMG_HEIGHT)
-        db_obj.save()
-        os.remove(old_image_path)
-
     @classmethod
     def getIssueCVID(cls, md):
-        # Get the issues cvid
-        # TODO: Need to clean this up a bit, but for now it works.
-        cvID = None
-        if md.notes is not None:
-            cvID = re.search(r'\d+]', md.notes)
-            if cvID is not None:
-                cvID = str(cvID.group(0))
-                cvID = cvID[:-1]
-                return cvID
-
-        if md.webLink is not None:
-            cvID = re.search(r'/\d+-\d+/', md.webLink)
-            if cvID is not None:
-                cvID = str(cvID.group(0))
-                cvID = cvID.split('-')
-                cvID = cvID[1]
-                cvID = cvID[:-1]
-                return cvID
-
-        return cvID
+        return get_issue_cvid(md)
 
     @classmethod
     def createPubDate(cls, day, month, year):
@@ -731,6 +805,18 @@ class ComicImporter(object):
 
         return pub_date
 
+    @classmethod
+    def createSlug(cls, model, name):
+        # Another import running at the same time can still take the
+        # slug before it's saved; the insert then raises IntegrityError.
+        new_slug = orig = slugify(name)
+        for x in itertools.count(1):
+            if not model.objects.filter(slug=new_slug).exists():
+                break
+            new_slug = f'{orig}-{x}'
+
+        return new_slug
+
     @classmethod
     def createIssueSlug(cls, pubDate, fixedNumber, seriesName):
         if pubDate is not None:
@@ -747,64 +833,45 @@ class ComicImporter(object):
 
         return new_slug
 
-    def getComicMetadata(self, path):
-        # TODO: Need to fix the default image path
-        ca = ComicArchive(path, default_image_path=None)
-        if ca.seemsToBeAComicArchive():
-            self.logger.info(f"Reading in {self.read_count} {path}")
-            self.read_count += 1
-            if ca.hasMetadata(MetaDataStyle.CIX):
-                style = MetaDataStyle.CIX
-            else:
-                style = None
-
-            if style is not None:
-                md = ca.readMetadata(style)
-                md.path = ca.path
-                md.page_count = ca.page_count
-                md.mod_ts = datetime.utcfromtimestamp(
-                    os.path.getmtime(ca.path))
-
-                return md
-        return None
-
-    def addComicFromMetadata(self, md):
-        if not md.isEmpty:
-            # Let's get the issue Comic Vine id from the archive's metadata
-            # If it's not there we'll skip the issue.
-            cvID = self.getIssueCVID(md)
-            if cvID is None:
-                issue_name = md.series + ' #' + md.number
-                self.logger.info(
-                    f'No Comic Vine ID for: {issue_name}... skipping.')
-                return False
-
-            # let's get the issue info from CV.
-            issue_response = self.getIssue(cvID)
-            if issue_response is None:
-                return False
+    def addComicFromMetadata(self, md, resolved=None):
+        '''
+        Adds the issue for the archive. resolved holds anything the import
+        pipeline has already fetched from Comic Vine for it.
+        '''
+        # Let's get the issue Comic Vine id from the archive's metadata
+        # If it's not there we'll skip the issue.
+        cvID = md.cvid
+        if cvID is None:
+            issue_name = f'{md.series} #{md.issue}'
+            self.logger.info(
+                f'No Comic Vine ID for: {issue_name}... skipping.')
+            return False
 
-            # Get or create the Publisher.
-            if md.publisher is not None:
-                publisher_obj = self.getPublisher(md.publisher, issue_response)
+        # let's get the issue info from CV.
+        if resolved is None:
+            resolved = ResolvedIssue(self.getIssue(cvID))
+        issue_response = resolved.issue_response
+        if issue_response is None:
+            return False
 
-            # Get or create the series and if a publisher is available set it.
-            series_obj = self.getSeries(issue_response)
-            if publisher_obj:
-                series_obj.publisher = publisher_obj
-                series_obj.save()
+        # Get or create the series, along with its publisher.
+        series_obj = self.getSeries(issue_response, resolved.series,
+                                    resolved.publisher)
+        if series_obj is None:
+            return False
 
-            # Ugh, deal wih the timezone
-            current_timezone = timezone.get_current_timezone()
-            tz = timezone.make_aware(md.mod_ts, current_timezone)
+        # Ugh, deal wih the timezone
+        current_timezone = timezone.get_current_timezone()
+        tz = timezone.make_aware(md.mod_ts, current_timezone)
 
-            pub_date = self.createPubDate(md.day, md.month, md.year)
-            fixed_number = IssueString(md.issue).asString(pad=3)
-            issue_slug = self.createIssueSlug(
-                pub_date, fixed_number, series_obj.name)
+        pub_date = self.createPubDate(md.day, md.month, md.year)
+        fixed_number = IssueString(md.issue).asString(pad=3)
+        issue_slug = self.createIssueSlug(
+            pub_date, fixed_number, series_obj.name)
 
-            try:
-                # Create the issue
+        try:
+            # Create the issue
+            with transaction.atomic():
                 issue_obj = Issue.objects.create(
                     file=md.path,
                     name=str(md.title),
@@ -815,78 +882,169 @@ class ComicImporter(object):
                     cvurl=md.webLink,
                     cvid=int(cvID),
                     mod_ts=tz,
+                    fingerprint=md.fingerprint or '',
                     series=series_obj,)
-            except IntegrityError as e:
-                self.logger.error(f'Attempting to create issue in db - {e}')
-                self.logger.info(f'Skipping: {md.path}')
-                return
-
-            # Set the issue image & short description.
-            res = self.setIssueDetail(cvID, issue_response)
-            if res:
-                self.logger.info(f"Added: {issue_obj}")
-            else:
-                self.logger.warning(
-                    f'No detail information was saved for {issue_obj}')
+        except IntegrityError as e:
+            self.logger.error(f'Attempting to create issue in db - {e}')
+            self.logger.info(f'Skipping: {md.path}')
+            return False
 
-            # Add the storyarc.
-            self.addIssueStoryArcs(issue_obj.cvid,
-                                   issue_response['results']['story_arc_credits'])
+        # Set the issue image & short description.
+        res = self.setIssueDetail(cvID, issue_response)
+        if res:
+            self.logger.info(f"Added: {issue_obj}")
+        else:
+            self.logger.warning(
+                f'No detail information was saved for {issue_obj}')
 
-            # Add the creators
-            self.addIssueCredits(issue_obj.cvid,
-                                 issue_response['results']['person_credits'])
+        # Add the storyarc.
+        self.addIssueStoryArcs(issue_obj.cvid,
+                               issue_response['results']['story_arc_credits'],
+                               resolved.arcs)
 
-            return True
+        # Add the creators
+        self.addIssueCredits(issue_obj.cvid,
+                             issue_response['results']['person_credits'],
+                             resolved.creators)
 
-    def commitMetadataList(self, md_list):
-        for md in md_list:
-            self.addComicFromMetadata(md)
+        return True
 
-    def import_comic_files(self):
-        filelist = get_recursive_filelist(self.directory_path)
-        filelist = sorted(filelist, key=os.path.getmtime)
+    def getImportList(self, scan, exclude=()):
+        '''
+        Returns (path, mtime) pairs for the new or changed files that
+        aren't already in the database, oldest first.
+        '''
+        db_paths = set(Issue.objects.values_list('file', flat=True))
+        db_paths.difference_update(exclude)
+        filelist = [f for f in scan.added | scan.modified if f not in db_paths]
+        filelist.sort(key=lambda f: scan.files[f].mtime)
 
-        # Grab the entire issue table into memory
-        comics_list = Issue.objects.all()
+        return [(f, scan.files[f].mtime) for f in filelist]
 
+    def prepareImport(self, scanner, scan, issues=None):
+        '''
+        Removes any missing or changed files and saves the index, leaving
+        out the files still to be imported. Returns those files as a list
+        of [path, size, mtime, inode], oldest first.
+        '''
         # Remove from the database any missing or changed files
-        for comic in comics_list:
-            self.checkIfRemovedOrModified(comic, self.directory_path)
+        self.removeMissingOrModified(scan, issues)
 
-        comics_list = None
+        # Anything left in the journal from an interrupted import picks
+        # up from the stage it got to.
+        ImportJournal.forget(scan.removed)
+        files = [[path, scan.files[path].size, mtime, scan.files[path].inode]
+                 for path, mtime in self.getImportList(scan)]
 
-        # Load the issue table again to take into account any
-        # issues remove from the database
-        c_list = Issue.objects.all()
+        # The files being imported are added to the index as they're done,
+        # so anything that fails or gets interrupted is retried next scan.
+        scanner.save_index(scan, exclude=[f[0] for f in files])
 
-        # Make a list of all path string in issue table
-        db_pathlist = []
-        for comic in c_list:
-            db_pathlist.append(comic.file)
+        return files
+
+    def importFiles(self, files, resume_images=True, wait=True):
+        '''
+        Imports a list of files from prepareImport, adding the ones that
+        imported to the index.
 
-        c_list = None
+        Files put off because Comic Vine was unavailable are left in
+        deferred_files. With wait, they're retried here once it's back,
+        up to REQUEUE_LIMIT times.
+        '''
+        journal = ImportJournal(resume_images=resume_images)
+        pipeline = ImportPipeline(self, journal=journal)
+        self.failed_paths = pipeline.run([(f[0], f[2]) for f in files])
+        self.deferred_files = [f for f in files if f[0] in pipeline.deferred]
+
+        for _ in range(REQUEUE_LIMIT if wait else 0):
+            if not self.deferred_files:
+                break
+            delay = self.getRetryAfter()
+            self.logger.info(f'Retrying {len(self.deferred_files)} files '
+                             f'in {delay:.0f}s')
+            time.sleep(delay)
+            pipeline = ImportPipeline(
+                self, journal=ImportJournal(resume_images=False))
+            failed = pipeline.run([(f[0], f[2]) for f in self.deferred_files])
+            self.failed_paths -= {f[0] for f in self.deferred_files}
+            self.failed_paths |= failed
+            self.deferred_files = [f for f in self.deferred_files
+                                   if f[0] in pipeline.deferred]
+
+        # Lookups that failed while resolving, so the next import skips them.
+        self.cv.misses.save()
+
+        LibraryScanner.index_files(
+            [f for f in files if f[0] not in self.failed_paths])
+
+    def resumeImages(self, before=None):
+        '''
+        Fetches the images an interrupted import never got to, from
+        before the given timestamp if there is one.
+        '''
+        journal = ImportJournal(before=before)
+        ImportPipeline(self, journal=journal).run([])
 
-        # Now let's remove any existing files in the database
-        # from the directory list of files.
-        for f in db_pathlist:
-            if f in filelist:
-                filelist.remove(f)
-        db_pathlist = None
+    def importScan(self, scanner, scan, issues=None):
+        self.importFiles(self.prepareImport(scanner, scan, issues))
 
-        md_list = []
-        self.read_count = 0
-        for filename in filelist:
-            md = self.getComicMetadata(filename)
-            if md is not None:
-                md_list.append(md)
+    @staticmethod
+    def shardFiles(files, batch_size):
+        '''
+        Splits the files up into batches for the import workers. Files in
+        the same directory (usually the same series) are kept together,
+        so workers aren't all looking up the same series & creators.
+        '''
+        files = sorted(files, key=lambda f: (os.path.dirname(f[0]), f[2]))
 
-            if self.read_count % 100 == 0 and self.read_count != 0:
-                if len(md_list) > 0:
-                    self.commitMetadataList(md_list)
-                    md_list = []
+        return list(chunks(files, batch_size))
 
-        if len(md_list) > 0:
-            self.commitMetadataList(md_list)
+    def import_comic_files(self, full_scan=False):
+        scanner = LibraryScanner(self.directory_path, full=full_scan)
+        self.importScan(scanner, scanner.scan())
 
         self.logger.info('Finished importing..')
+
+    def prepare_comic_files(self, full_scan=False):
+        '''
+        Does the scan part of import_comic_files, returning the files to
+        be imported split up into batches for the workers.
+        '''
+        scanner = LibraryScanner(self.directory_path, full=full_scan)
+        files = self.prepareImport(scanner, scanner.scan())
+
+        return self.shardFiles(files, self.batch_size)
+
+    def plan_comic_files(self, full_scan=False):
+        '''
+        Works out what import_comic_files would do, without changing
+        anything or talking to Comic Vine. Returns an ImportPlan.
+        '''
+        scanner = LibraryScanner(self.directory_path, full=full_scan)
+        return ImportPlanner(self).plan(scanner.scan())
+
+    def import_comic_paths(self, paths):
+        '''
+        Imports, updates or removes just the given files or directories,
+        for when we already know what changed (ie. the library watcher).
+        '''
+        paths = [p for p in paths if p.startswith(self.directory_path)]
+        if not paths:
+            return
+
+        scanner = LibraryScanner(self.directory_path)
+        issues = Issue.objects.filter(under_paths(paths, 'file'))
+        self.importScan(scanner, scanner.scan_paths(paths), issues)
+
+        self.logger.info(f'Finished importing {len(paths)} changed paths..')
+
+    def prepare_comic_paths(self, paths):
+        paths = [p for p in paths if p.startswith(self.directory_path)]
+        if not paths:
+            return []
+
+        scanner = LibraryScanner(self.directory_path)
+        issues = Issue.objects.filter(under_paths(paths, 'file'))
+        files = self.prepareImport(scanner, scanner.scan_paths(paths), issues)
+
+        return self.shardFiles(files, self.batch_size)
@@ -0,0 +1,537 @@
+import copy
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils import timezone
+import pytz
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+import requests_cache
+
+from .cvcache import EntityCache
+from .throttle import CircuitBreaker, ComicVineLimiter, get_redis
+
+
+BASE_URL = 'https://comicvine.gamespot.com/api'
+
+# Seconds to wait to connect, and then for a response.
+TIMEOUT = (5, 30)
+
+# Connections kept open to Comic Vine, enough for the import pipeline
+# and an image pool to share.
+POOL_SIZE = 10
+
+CACHE_EXPIRE = timedelta(hours=1)
+
+# Bytes read at a time when downloading an image.
+CHUNK_SIZE = 64 * 1024
+
+# Comic Vine's scaled renditions of an image, smallest first, with the
+# width each one is scaled down to. The original is only used when none
+# of them is big enough.
+IMAGE_RENDITIONS = (
+    ('thumb_url', 100),
+    ('small_url', 320),
+    ('medium_url', 480),
+    ('super_url', 640),
+    ('screen_large_url', 1280),
+)
+
+# Lock held in Redis while a request is being made, so other processes
+# wait for it rather than asking for the same thing.
+INFLIGHT_PREFIX = 'thwip:inflight'
+INFLIGHT_TIMEOUT = 60
+INFLIGHT_POLL = 0.1
+
+# Times a request is retried when Comic Vine is throttling us or down,
+# backing off exponentially from BACKOFF seconds (up to BACKOFF_MAX)
+# unless it says how long to wait. If that's longer than BACKOFF_MAX the
+# circuit is opened instead.
+RETRIES = 3
+BACKOFF = 2
+BACKOFF_MAX = 120
+
+# Failed requests in a row before every request is stopped for a while.
+CIRCUIT_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 300
+
+# 420 is what Comic Vine sends when it's rate limiting.
+RETRY_STATUS = (420, 429, 500, 502, 503, 504)
+
+# status_code in the body of a response for an id that doesn't exist,
+# and for one that hit the rate limit.
+CV_NOT_FOUND = 101
+CV_RATE_LIMITED = 107
+
+
+class CVTypeID:
+    Issue = '4000'
+    Person = '4040'
+    Publisher = '4010'
+    StoryArc = '4045'
+    Volume = '4050'
+
+
+RESOURCE_TYPES = {
+    'issue': CVTypeID.Issue,
+    'person': CVTypeID.Person,
+    'publisher': CVTypeID.Publisher,
+    'story_arc': CVTypeID.StoryArc,
+    'volume': CVTypeID.Volume,
+}
+
+
+# Most ids a list request can filter on.
+BATCH_SIZE = 100
+
+# The plural (list) resources, which count against the same limit.
+LIST_RESOURCES = {
+    'issues': 'issue',
+    'people': 'person',
+    'publishers': 'publisher',
+    'story_arcs': 'story_arc',
+    'volumes': 'volume',
+}
+
+
+class ComicVineError(requests.exceptions.RequestException):
+    pass
+
+
+class ComicVineNotFound(ComicVineError):
+    '''
+    Comic Vine has nothing for the url, or it failed recently and is in
+    the negative cache.
+    '''
+
+
+class ComicVineUnavailable(ComicVineError):
+    '''
+    Comic Vine is throttling us or down, so the request wasn't made, or
+    gave up after its retries. retry_after is how many seconds until
+    it's worth trying again.
+    '''
+
+    def __init__(self, *args, retry_after=0, **kwargs):
+        self.retry_after = retry_after
+        super().__init__(*args, **kwargs)
+
+
+def retry_after(response):
+    '''
+    Returns the seconds a response's Retry-After header asks us to wait
+    for (it can be a number of seconds or a date), or None.
+    '''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, (parsedate_to_datetime(value) -
+                       timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, base=BACKOFF, limit=BACKOFF_MAX):
+    # Exponential, with some jitter so workers don't retry in step.
+    delay = min(limit, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def resource_for(url):
+    '''
+    Returns the resource an api url is for, ie. 'volume' for
+    .../api/volume/4050-796/, or None if it isn't one of them.
+    '''
+    parts = urlsplit(url).path.rstrip('/').split('/')
+    if parts[-1] in LIST_RESOURCES:
+        return LIST_RESOURCES[parts[-1]]
+    if len(parts) > 1 and parts[-2] in RESOURCE_TYPES:
+        return parts[-2]
+
+    return None
+
+
+def image_rendition(image, width):
+    '''
+    Returns the url of the smallest rendition in a Comic Vine image
+    response that's at least width pixels wide. That's enough as long as
+    the image is about the shape it gets cropped to, and resize_images
+    makes up for any that are a little short.
+    '''
+    for key, rendition_width in IMAGE_RENDITIONS:
+        if rendition_width >= width and image.get(key):
+            return image[key]
+
+    return image.get('original_url') or image.get('super_url') or ''
+
+
+def parse_date(value):
+    '''
+    Returns an aware datetime for one of Comic Vine's dates, ie.
+    date_last_updated ('2019-06-05 16:14:54'), or None.
+    '''
+    if not value:
+        return None
+    try:
+        # Times in the hour the clocks go back happen twice (and the hour
+        # they go forward, not at all), so don't let that be an error.
+        return timezone.make_aware(
+            datetime.strptime(value, '%Y-%m-%d %H:%M:%S'), is_dst=False)
+    except (ValueError, pytz.exceptions.InvalidTimeError):
+        return None
+
+
+def entity_for(url):
+    '''
+    Returns (resource, cvid) for an api detail url, ie. ('volume', 796)
+    for .../api/volume/4050-796/, or None for anything else.
+    '''
+    parts = urlsplit(url).path.rstrip('/').split('/')
+    if len(parts) < 2 or parts[-2] not in RESOURCE_TYPES:
+        return None
+    match = re.fullmatch(r'\d+-(\d+)', parts[-1])
+    if match is None:
+        return None
+
+    return parts[-2], int(match.group(1))
+
+
+class InFlight(object):
+    '''
+    A request that's already under way, for others to wait on.
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+        return copy.deepcopy(self.result)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    '''
+    Takes a token from the resource's rate limit before anything goes out
+    to Comic Vine. Sits below the cache, so cached responses are free.
+    '''
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        resource = resource_for(request.url)
+        if resource is not None:
+            self.limiter.acquire(resource)
+
+        return super().send(request, **kwargs)
+
+
+class ComicVineClient(object):
+    '''
+    Talks to the Comic Vine api over one cached session, so connections
+    are pooled and kept alive between calls rather than paying for a new
+    TLS handshake every time. Nothing is changed per call, so it's safe
+    to share between threads. Every request waits its turn on the shared
+    rate limit for its resource.
+
+    Lookups of the same thing that overlap are coalesced: only the first
+    one goes out and the rest wait for its result. Between threads that's
+    done here, and between processes with a lock in Redis, after which
+    the waiting processes find the response in the shared cache.
+
+    Records of single entities (a publisher, volume, person, story arc or
+    issue) are also kept in the entity cache, each type for as long as
+    the settings allow, and are used before going out to Comic Vine.
+
+    Entities that come back empty or with an error are recorded in the
+    negative cache (misses), if there is one, and not asked for again
+    until they expire.
+
+    A fresh client (for an explicit refresh) skips both caches and always
+    goes out to Comic Vine, though what comes back is still put in the
+    entity cache for everyone else.
+
+    When Comic Vine is rate limiting us (420/429), down or sending back
+    its maintenance page, requests are retried with an exponential
+    backoff, or after as long as it asks. Failures in a row open the
+    shared circuit breaker, and until it closes requests fail straight
+    away with ComicVineUnavailable instead of using up the quota.
+    '''
+
+    def __init__(self, api_key, base_url=BASE_URL, timeout=TIMEOUT,
+                 pool_size=POOL_SIZE, limiter=None, cache=None,
+                 breaker=None, retries=RETRIES, backoff=BACKOFF, misses=None,
+                 fresh=False):
+        self.base_url = base_url
+        self.cache = cache or EntityCache()
+        self.fresh = fresh
+        self.misses = misses
+        self.breaker = breaker or CircuitBreaker(
+            'comicvine',
+            getattr(settings, 'COMICVINE_CIRCUIT_THRESHOLD', CIRCUIT_THRESHOLD),
+            getattr(settings, 'COMICVINE_CIRCUIT_COOLDOWN', CIRCUIT_COOLDOWN))
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.params = {'format': 'json',
+                       'api_key': api_key}
+        self.logger = logging.getLogger('thwip')
+        self.inflight = {}
+        self.inflight_lock = threading.Lock()
+
+        self.session = requests_cache.CachedSession('cv-cache',
+                                                    backend='redis',
+                                                    expire_after=CACHE_EXPIRE,
+                                                    connection=get_redis())
+        self.session.remove_expired_responses()
+        self.session.headers['user-agent'] = 'thwip'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.mount(base_url, RateLimitedAdapter(
+            limiter or ComicVineLimiter(), pool_connections=1,
+            pool_maxsize=pool_size))
+
+        # Images don't count against the api limits, and are too big to
+        # keep in the cache, so they get a plain session of their own.
+        self.images = requests.Session()
+        self.images.headers['user-agent'] = 'thwip'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.images.mount('https://', adapter)
+        self.images.mount('http://', adapter)
+
+    def get(self, url, fields=None, filter=None):
+        '''
+        Returns the decoded response from an api url, only asking for the
+        fields given (a comma separated string). List urls can also be
+        given a filter.
+        '''
+        entity = entity_for(url)
+        if entity is not None:
+            cached = None if self.fresh else self.cache.get(*entity, fields)
+            if cached is not None:
+                return cached
+            if self.misses is not None and self.misses.has(url):
+                raise ComicVineNotFound(f'{url} failed recently, skipping')
+
+        key = (url.rstrip('/'), fields, filter)
+        with self.inflight_lock:
+            call = self.inflight.get(key)
+            first = call is None
+            if first:
+                call = self.inflight[key] = InFlight()
+        if not first:
+            return call.wait()
+
+        try:
+            call.result = self.get_shared(url, fields, filter)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.inflight_lock:
+                del self.inflight[key]
+            call.done.set()
+
+        return call.result
+
+    def get_shared(self, url, fields, filter=None):
+        lock = f'{INFLIGHT_PREFIX}:{url.rstrip("/")}:{fields}:{filter}'
+        try:
+            conn = get_redis()
+            if not conn.set(lock, 1, nx=True, ex=INFLIGHT_TIMEOUT):
+                # Another process is fetching it, so wait for that to
+                # finish and then get it from the cache.
+                deadline = time.monotonic() + INFLIGHT_TIMEOUT
+                while conn.exists(lock) and time.monotonic() < deadline:
+                    time.sleep(INFLIGHT_POLL)
+                return self.fetch(url, fields, filter)
+        except redis.RedisError as e:
+            self.logger.warning(f'Comic Vine request lock - {e}')
+            return self.fetch(url, fields, filter)
+
+        try:
+            return self.fetch(url, fields, filter)
+        finally:
+            try:
+                conn.delete(lock)
+            except redis.RedisError:
+                pass
+
+    def fetch(self, url, fields, filter=None):
+        params = dict(self.params)
+        if fields:
+            params['field_list'] = fields
+        if filter:
+            params['filter'] = filter
+            params['limit'] = BATCH_SIZE
+
+        attempt = 0
+        while True:
+            wait = self.breaker.retry_after()
+            if wait:
+                raise ComicVineUnavailable(
+                    f'Comic Vine unavailable, not requesting {url}',
+                    retry_after=wait)
+
+            try:
+                data = self.send(url, params)
+            except ComicVineNotFound as e:
+                self.breaker.success()
+                self.missed(url, str(e))
+                raise
+            except ComicVineUnavailable as e:
+                self.breaker.failure()
+                # Don't hold things up for long waits, just leave it until
+                # Comic Vine's ready (the same as running out of retries).
+                if attempt >= self.retries or e.retry_after > BACKOFF_MAX:
+                    # Give everyone else a rest from it too.
+                    self.breaker.trip(e.retry_after)
+                    e.retry_after = self.breaker.retry_after()
+                    raise
+                delay = e.retry_after or backoff(attempt, self.backoff)
+                self.logger.warning(f'{e}, retrying in {delay:.0f}s')
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.success()
+            break
+
+        entity = entity_for(url)
+        if entity is not None:
+            status = data.get('status_code')
+            if status in (1, CV_NOT_FOUND) and not data.get('results'):
+                error = data.get('error') or 'No results'
+                self.missed(url, error)
+                raise ComicVineNotFound(f'{url} - {error}')
+            if status != 1:
+                # Something wrong with the request (or the api key), so
+                # it's not the entity's fault.
+                raise ComicVineError(f'{url} - {data.get("error")}')
+            if isinstance(data['results'], dict):
+                self.cache.set(*entity, fields, data['results'])
+
+        return data
+
+    def missed(self, url, error):
+        entity = entity_for(url)
+        if entity is not None and self.misses is not None:
+            self.misses.add(url, error, *entity)
+
+    def send(self, url, params):
+        '''
+        Makes the request, raising ComicVineUnavailable for anything worth
+        retrying.
+        '''
+        try:
+            if self.fresh:
+                # Don't let a cached response stand in for a refresh.
+                with self.session.cache_disabled():
+                    response = self.session.get(url, params=params,
+                                                timeout=self.timeout)
+            else:
+                response = self.session.get(url, params=params,
+                                            timeout=self.timeout)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            raise ComicVineUnavailable(f'{url} - {e}')
+
+        if response.status_code == 404:
+            self.forget(response)
+            raise ComicVineNotFound(f'{url} - HTTP 404')
+
+        if response.status_code in RETRY_STATUS:
+            self.forget(response)
+            raise ComicVineUnavailable(
+                f'{url} - HTTP {response.status_code}',
+                retry_after=retry_after(response) or 0)
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            # Usually the maintenance page.
+            self.forget(response)
+            raise ComicVineUnavailable(f'Invalid response from {url} - {e}',
+                                       retry_after=retry_after(response) or 0)
+
+        if isinstance(data, dict) and data.get('status_code') == CV_RATE_LIMITED:
+            self.forget(response)
+            raise ComicVineUnavailable(f'{url} - {data.get("error")}',
+                                       retry_after=retry_after(response) or 0)
+
+        return data
+
+    def forget(self, response):
+        # Don't serve a failed response from the cache next time.
+        try:
+            self.session.cache.delete_url(response.url)
+        except redis.RedisError as e:
+            self.logger.warning(f'Comic Vine cache - {e}')
+
+    def download(self, url, path):
+        '''
+        Saves the image at url to path, returning the path.
+        '''
+        with self.images.get(url, stream=True,
+                             timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+        return path
+
+    def detail_url(self, resource, cvid):
+        return f'{self.base_url}/{resource}/{RESOURCE_TYPES[resource]}-{cvid}'
+
+    def detail(self, resource, cvid, fields=None):
+        return self.get(self.detail_url(resource, cvid), fields)
+
+    def batch(self, resource, ids, fields):
+        '''
+        Looks up a number of the same kind of entity with as few requests
+        as possible, using the list endpoint's id filter. fields has to
+        include id. Returns a dict of id -> results, leaving out any that
+        Comic Vine didn't send back.
+        '''
+        plural = next(p for p, r in LIST_RESOURCES.items() if r == resource)
+        found = {}
+        missing = []
+        for cvid in dict.fromkeys(ids):
+            cached = self.cache.get(resource, cvid, fields)
+            if cached is not None:
+                found[cvid] = cached['results']
+            elif (self.misses is None or
+                    not self.misses.has(self.detail_url(resource, cvid))):
+                missing.append(cvid)
+
+        for start in range(0, len(missing), BATCH_SIZE):
+            ids = missing[start:start + BATCH_SIZE]
+            data = self.get(f'{self.base_url}/{plural}/', fields,
+                            'id:' + '|'.join(str(cvid) for cvid in ids))
+            if data.get('status_code') != 1:
+                raise ComicVineError(f'{plural} - {data.get("error")}')
+            for results in data['results']:
+                found[results['id']] = results
+                self.cache.set(resource, results['id'], fields, results)
+
+        return found
@@ -0,0 +1,157 @@
+from datetime import timedelta
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+import redis
+
+from comics.models import FailedLookup
+
+from .throttle import get_redis
+
+
+KEY_PREFIX = 'thwip:cv'
+
+# Seconds to keep each type of record for, unless the settings say
+# otherwise. Publishers and creators hardly ever change; issues pick up
+# credits and story arcs for a while after they come out.
+DEFAULT_TTL = {
+    'issue': 24 * 60 * 60,
+    'volume': 7 * 24 * 60 * 60,
+    'story_arc': 7 * 24 * 60 * 60,
+    'person': 30 * 24 * 60 * 60,
+    'publisher': 30 * 24 * 60 * 60,
+}
+
+# Seconds a lookup that came back empty or failed is skipped for.
+MISS_TTL = 7 * 24 * 60 * 60
+
+
+class EntityCache(object):
+    '''
+    Caches the records Comic Vine sends back, one per entity (resource
+    and id) rather than one per request. Lookups of the same entity that
+    ask for different fields share the record, and a lookup is answered
+    from it when every field it asks for is there.
+    '''
+
+    def __init__(self, ttl=None, url=None):
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or getattr(settings, 'COMICVINE_CACHE_TTL', {}))
+        self.url = url
+        self.logger = logging.getLogger('thwip')
+
+    @staticmethod
+    def key(resource, cvid):
+        return f'{KEY_PREFIX}:{resource}:{cvid}'
+
+    def load(self, conn, resource, cvid):
+        data = conn.get(self.key(resource, cvid))
+        if data is None:
+            return None
+
+        return json.loads(data)
+
+    def get(self, resource, cvid, fields=None):
+        '''
+        Returns a response with just the fields asked for (a comma
+        separated string, or None for everything), or None if the record
+        isn't cached or is missing any of them.
+        '''
+        try:
+            record = self.load(get_redis(self.url), resource, cvid)
+        except redis.RedisError as e:
+            self.logger.warning(f'Comic Vine cache - {e}')
+            return None
+        if record is None:
+            return None
+
+        if fields is None:
+            if not record['complete']:
+                return None
+            results = record['results']
+        else:
+            names = fields.split(',')
+            if any(name not in record['results'] for name in names):
+                return None
+            results = {name: record['results'][name] for name in names}
+
+        return {'error': 'OK', 'status_code': 1, 'results': results}
+
+    def set(self, resource, cvid, fields, results):
+        try:
+            conn = get_redis(self.url)
+            record = self.load(conn, resource, cvid)
+            ttl = self.ttl[resource]
+            if record is None:
+                record = {'complete': False, 'results': {}}
+            else:
+                # Adding fields doesn't make the rest of the record new.
+                ttl = conn.ttl(self.key(resource, cvid))
+                if ttl <= 0:
+                    ttl = self.ttl[resource]
+            record['results'].update(results)
+            record['complete'] = record['complete'] or fields is None
+            conn.set(self.key(resource, cvid), json.dumps(record), ex=ttl)
+        except redis.RedisError as e:
+            self.logger.warning(f'Comic Vine cache - {e}')
+
+    def delete(self, resource, cvid):
+        try:
+            get_redis(self.url).delete(self.key(resource, cvid))
+        except redis.RedisError as e:
+            self.logger.warning(f'Comic Vine cache - {e}')
+
+
+class LookupMisses(object):
+    '''
+    The Comic Vine urls that came back empty or with an error, so they're
+    skipped, rather than using up the rate limit again, until they expire
+    or are deleted from the admin.
+
+    They're loaded when this is made, and only that thread writes to the
+    database. Misses found on any other thread (the import's stages) are
+    kept until save() is called.
+    '''
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or getattr(settings, 'COMICVINE_MISS_TTL', MISS_TTL)
+        self.thread = threading.current_thread()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.expires = dict(
+            FailedLookup.objects.filter(expires__gt=timezone.now())
+            .values_list('url', 'expires'))
+
+    @staticmethod
+    def key(url):
+        return url.rstrip('/')
+
+    def has(self, url):
+        expires = self.expires.get(self.key(url))
+        return expires is not None and expires > timezone.now()
+
+    def add(self, url, error, resource='', cvid=None):
+        url = self.key(url)
+        with self.lock:
+            self.expires[url] = timezone.now() + timedelta(seconds=self.ttl)
+            self.pending[url] = (resource, cvid, error[:300])
+        if threading.current_thread() is self.thread:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        for url, (resource, cvid, error) in pending.items():
+            lookup, created = FailedLookup.objects.get_or_create(
+                url=url, defaults={'resource': resource, 'cvid': cvid,
+                                   'error': error,
+                                   'expires': self.expires[url]})
+            if not created:
+                lookup.attempts += 1
+                lookup.error = error
+                lookup.expires = self.expires[url]
+                lookup.save()
@@ -0,0 +1,270 @@
+import collections
+import hashlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from .comicvine import resource_for
+
+
+# Where everything in a recording originally came from. It's swapped for
+# the stand-in's address when served, so the urls in the responses (api
+# details & images) lead back to it.
+CV_ROOT = 'https://comicvine.gamespot.com'
+
+# Parameters that don't change what comes back.
+IGNORED_PARAMS = ('api_key', 'format')
+
+# Comic Vine's answers for an id it doesn't have, and for a client that's
+# over the rate limit.
+NOT_FOUND = {'status_code': 101, 'error': 'Object Not Found',
+             'number_of_total_results': 0, 'results': []}
+RATE_LIMITED = {'status_code': 107,
+                'error': 'Rate limit exceeded.  Slow down cowboy.',
+                'number_of_total_results': 0, 'results': []}
+
+
+def is_image(path):
+    return path.startswith('/a/') or path.startswith('/api/image/')
+
+
+class Recording(object):
+    '''
+    Comic Vine responses saved to a directory: the api responses as json
+    in responses/, and the images as they were in images/.
+
+    A response is looked up by its path and parameters (apart from the
+    api key), or failing that by its path alone, so a lookup asking for
+    different fields still gets an answer.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path, params=()):
+        params = sorted((k, v) for k, v in params if k not in IGNORED_PARAMS)
+        key = path.rstrip('/') + '?' + '&'.join(f'{k}={v}' for k, v in params)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def response_path(self, key):
+        return os.path.join(self.directory, 'responses', f'{key}.json')
+
+    def image_path(self, path):
+        return os.path.join(self.directory, 'images', path.lstrip('/'))
+
+    def write(self, path, data):
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+
+    def save(self, url, response):
+        '''
+        Saves a response from Comic Vine. Only successful ones are kept.
+        '''
+        if response.status_code != 200:
+            return
+        parts = urlsplit(url)
+        if is_image(parts.path):
+            self.write(self.image_path(parts.path), response.content)
+            return
+
+        # Recordings get shared, so leave the api key out.
+        params = [(k, v) for k, v in parse_qsl(parts.query)
+                  if k not in IGNORED_PARAMS]
+        data = json.dumps({'path': parts.path, 'params': dict(params),
+                           'body': response.text}).encode()
+        self.write(self.response_path(self.key(parts.path, params)), data)
+        self.write(self.response_path(self.key(parts.path)), data)
+
+    def load(self, path, params=()):
+        '''
+        Returns the body of the recorded response, or None.
+        '''
+        for key in (self.key(path, params), self.key(path)):
+            try:
+                with open(self.response_path(key)) as f:
+                    return json.load(f)['body']
+            except FileNotFoundError:
+                pass
+
+        return None
+
+    def image(self, path):
+        try:
+            with open(self.image_path(path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class RecordingAdapter(HTTPAdapter):
+    '''
+    Passes requests on to another adapter, saving what comes back.
+    '''
+
+    def __init__(self, recording, adapter, **kwargs):
+        self.recording = recording
+        self.adapter = adapter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        self.recording.save(request.url, response)
+
+        return response
+
+    def close(self):
+        self.adapter.close()
+        super().close()
+
+
+class NullCache(object):
+    '''
+    An entity cache that never has anything, so every lookup goes out.
+    '''
+
+    def get(self, resource, cvid, fields=None):
+        return None
+
+    def set(self, resource, cvid, fields, results):
+        pass
+
+    def delete(self, resource, cvid):
+        pass
+
+
+def record(client, recording):
+    '''
+    Makes a ComicVineClient save everything it gets from Comic Vine to
+    the recording. Lookups answered from its caches never go out, so the
+    entity cache is turned off; use the session's cache_disabled() for
+    the request cache.
+    '''
+    client.session.mount(client.base_url, RecordingAdapter(
+        recording, client.session.get_adapter(client.base_url)))
+    for prefix in ('https://', 'http://'):
+        client.images.mount(prefix, RecordingAdapter(
+            recording, client.images.get_adapter(prefix)))
+    client.cache = NullCache()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        if server.latency:
+            time.sleep(server.latency)
+
+        if is_image(parts.path):
+            image = server.recording.image(parts.path)
+            if image is None:
+                self.send_body(404, b'', 'text/plain')
+            else:
+                self.send_body(200, image, 'image/jpeg')
+            return
+
+        wait = server.throttle(resource_for(parts.path))
+        if wait:
+            self.send_json(420, RATE_LIMITED,
+                           {'Retry-After': str(int(wait) + 1)})
+            return
+
+        body = server.recording.load(parts.path, parse_qsl(parts.query))
+        if body is None:
+            self.send_json(200, NOT_FOUND)
+            return
+        self.send_body(200, body.replace(CV_ROOT, server.root).encode(),
+                       'application/json')
+
+    def send_json(self, status, data, headers=None):
+        self.send_body(status, json.dumps(data).encode(), 'application/json',
+                       headers)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger('thwip').debug(
+            f'Comic Vine stand-in - {format % args}')
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''
+    A local stand-in for Comic Vine that serves a recording, so imports
+    can be tested and timed without a network or an api key. Point
+    COMICVINE_BASE_URL at base_url to use it.
+
+    Every request can be held up by latency seconds, and like Comic Vine
+    each resource only gets per_hour requests in any window (an hour),
+    after which it answers 420 until some expire.
+    '''
+    daemon_threads = True
+
+    def __init__(self, recording, address=('127.0.0.1', 0), latency=0,
+                 per_hour=None, window=3600):
+        self.recording = recording
+        self.latency = latency
+        self.per_hour = per_hour
+        self.window = window
+        self.requests = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        self.thread = None
+        super().__init__(address, StandInHandler)
+
+    @property
+    def root(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def base_url(self):
+        return f'{self.root}/api'
+
+    def throttle(self, resource):
+        '''
+        Counts a request for the resource, returning 0 if it's allowed,
+        or how many seconds until it would be.
+        '''
+        if not self.per_hour or resource is None:
+            return 0
+
+        with self.lock:
+            now = time.monotonic()
+            requests = self.requests[resource]
+            while requests and requests[0] <= now - self.window:
+                requests.popleft()
+            if len(requests) >= self.per_hour:
+                return requests[0] + self.window - now
+            requests.append(now)
+
+        return 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       name='comicvine-standin', daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
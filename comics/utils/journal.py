@@ -0,0 +1,187 @@
+from datetime import datetime
+import json
+import time
+
+from django.utils import timezone
+
+from comics.models import ImportEntry
+
+from .metadata import ComicRecord
+from .scanner import BATCH_SIZE, chunks
+
+
+# How often the journal is written out while an import is running.
+FLUSH_INTERVAL = 2
+
+
+class ImportJournal(object):
+    '''
+    Records how far each file has got through an import (parsed, resolved,
+    persisted, images done), so an import that gets interrupted can pick
+    up where it stopped instead of starting over:
+
+        - Files that were already parsed skip straight to the resolve
+          stage, using the metadata saved in the journal.
+        - Files whose issue was saved but whose images weren't fetched
+          only have their images fetched again.
+        - Files that failed keep their entry, with the stage they got to,
+          and are retried from there next time.
+
+    All the database work happens on the thread doing the import; changes
+    are kept in memory and written out in batches every few seconds.
+
+    When an import is split over several workers, only one of them
+    should pick up the left over images (resume_images), and only those
+    left before the import started (before, a timestamp), so it doesn't
+    take on images the other workers have just queued.
+    '''
+
+    def __init__(self, resume_images=True, before=None):
+        self.resume_images = resume_images
+        self.before = before
+        self.entries = {}
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def dump_record(record):
+        # The modified time comes back from the entry's mtime.
+        data = record._asdict()
+        del data['mod_ts']
+        return json.dumps(data)
+
+    @staticmethod
+    def load_record(entry):
+        data = json.loads(entry.record)
+        data['mod_ts'] = datetime.utcfromtimestamp(entry.mtime)
+        return ComicRecord(**data)
+
+    def start(self, files):
+        '''
+        Takes the list of (path, mtime) pairs being imported and returns a
+        dict of path -> ComicRecord for any that were already parsed.
+        '''
+        mtimes = dict(files)
+        for batch in chunks(mtimes):
+            for entry in ImportEntry.objects.filter(path__in=batch):
+                self.entries[entry.path] = entry
+
+        records = {}
+        new = []
+        for path, mtime in files:
+            entry = self.entries.get(path)
+            if entry is None:
+                entry = ImportEntry(path=path, mtime=mtime)
+                self.entries[path] = entry
+                new.append(entry)
+            elif entry.mtime != mtime:
+                # The file changed since it was journaled, so start over.
+                entry.mtime = mtime
+                entry.stage = ImportEntry.QUEUED
+                entry.failed = False
+                entry.error = ''
+                entry.record = ''
+                entry.images = ''
+                self.dirty.add(path)
+            elif entry.stage >= ImportEntry.PARSED and entry.record:
+                records[path] = self.load_record(entry)
+        ImportEntry.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        # bulk_create doesn't set the ids, which bulk_update needs.
+        for batch in chunks([e.path for e in new]):
+            for pk, path in ImportEntry.objects.filter(
+                    path__in=batch).values_list('id', 'path'):
+                self.entries[path].pk = pk
+
+        return records
+
+    def pending_images(self):
+        '''
+        Returns a list of (path, image) pairs for the images that were
+        queued by an earlier import but never saved, where image is
+        [model label, pk, image_url, folder, width, height].
+        '''
+        images = []
+        if not self.resume_images:
+            return images
+
+        entries = ImportEntry.objects.filter(stage=ImportEntry.PERSISTED)
+        if self.before is not None:
+            entries = entries.filter(modified__lt=datetime.fromtimestamp(
+                self.before, timezone.utc))
+        for entry in entries.exclude(images=''):
+            self.entries.setdefault(entry.path, entry)
+            images.extend((entry.path, image)
+                          for image in json.loads(entry.images))
+
+        return images
+
+    def update(self, path, **kwargs):
+        entry = self.entries.get(path)
+        if entry is None:
+            return
+        for name, value in kwargs.items():
+            setattr(entry, name, value)
+        self.dirty.add(path)
+
+    def parsed(self, path, record):
+        if record is None:
+            # Not a comic, so there's nothing more to do with it.
+            self.update(path, stage=ImportEntry.DONE)
+        else:
+            self.update(path, stage=ImportEntry.PARSED,
+                        record=self.dump_record(record))
+
+    def resolved(self, path):
+        self.update(path, stage=ImportEntry.RESOLVED)
+
+    def persisted(self, path, images):
+        if images:
+            self.update(path, stage=ImportEntry.PERSISTED, failed=False,
+                        error='', images=json.dumps(images))
+        else:
+            self.update(path, stage=ImportEntry.DONE, failed=False,
+                        error='', images='')
+
+    def image_done(self, path, image):
+        entry = self.entries.get(path)
+        if entry is None or not entry.images:
+            return
+        images = json.loads(entry.images)
+        if image in images:
+            images.remove(image)
+        if images:
+            self.update(path, images=json.dumps(images))
+        else:
+            self.update(path, stage=ImportEntry.DONE, images='')
+
+    def failed(self, path, error):
+        self.update(path, failed=True, error=error[:300])
+
+    def flush(self, force=False):
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.last_flush < FLUSH_INTERVAL:
+            return
+
+        now = timezone.now()
+        entries = [self.entries[path] for path in self.dirty]
+        for entry in entries:
+            entry.modified = now
+        ImportEntry.objects.bulk_update(
+            entries, ['mtime', 'stage', 'failed', 'error', 'record', 'images',
+                      'modified'], batch_size=BATCH_SIZE)
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+
+    def finish(self):
+        '''
+        Writes out anything left and drops the entries for files that
+        made it all the way through.
+        '''
+        self.flush(force=True)
+        ImportEntry.objects.filter(stage=ImportEntry.DONE).delete()
+
+    @classmethod
+    def forget(cls, paths):
+        for batch in chunks(paths):
+            ImportEntry.objects.filter(path__in=batch).delete()
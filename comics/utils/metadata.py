@@ -0,0 +1,166 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+import logging
+import os
+import re
+import struct
+
+from .comicapi.comicarchive import MetaDataStyle, ComicArchive
+from .utils import process_map
+
+
+# The bits of an archive's ComicInfo.xml the importer needs. Kept small
+# since it has to be pickled back from the worker processes.
+ComicRecord = namedtuple('ComicRecord', ['path', 'mod_ts', 'page_count',
+                                         'fingerprint', 'cvid', 'series',
+                                         'issue', 'title', 'publisher', 'day',
+                                         'month', 'year', 'webLink',
+                                         'creators', 'story_arcs'])
+
+# Zip end of central directory record.
+EOCD_SIGNATURE = b'PK\x05\x06'
+EOCD_SIZE = 22
+MAX_COMMENT_SIZE = 0xFFFF
+
+
+def archive_fingerprint(path):
+    '''
+    Returns a fingerprint of the archive's contents: its size plus a hash of
+    the zip central directory, which has the name, size & crc32 of every
+    page. It stays the same when the file is moved or renamed, and only
+    needs the end of the file to be read rather than the whole thing.
+    Returns None if the file can't be read or isn't a zip.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            tail_size = min(size, EOCD_SIZE + MAX_COMMENT_SIZE)
+            f.seek(size - tail_size)
+            tail = f.read(tail_size)
+
+            pos = tail.rfind(EOCD_SIGNATURE)
+            if pos < 0 or len(tail) < pos + EOCD_SIZE:
+                return None
+            cd_size = struct.unpack_from('<I', tail, pos + 12)[0]
+            eocd_offset = size - tail_size + pos
+            if cd_size > eocd_offset:
+                return None
+
+            f.seek(eocd_offset - cd_size)
+            central_directory = f.read(cd_size)
+    except OSError:
+        return None
+
+    return f'{size}-{hashlib.sha1(central_directory).hexdigest()}'
+
+
+def fingerprint_files(paths, workers=8):
+    '''
+    Returns a dict of path -> fingerprint. This is mostly waiting on the
+    disk, so threads are plenty.
+    '''
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(archive_fingerprint, paths)))
+
+
+def get_issue_cvid(md):
+    # Get the issues cvid
+    # TODO: Need to clean this up a bit, but for now it works.
+    cvID = None
+    if md.notes is not None:
+        cvID = re.search(r'\d+]', md.notes)
+        if cvID is not None:
+            cvID = str(cvID.group(0))
+            cvID = cvID[:-1]
+            return cvID
+
+    if md.webLink is not None:
+        cvID = re.search(r'/\d+-\d+/', md.webLink)
+        if cvID is not None:
+            cvID = str(cvID.group(0))
+            cvID = cvID.split('-')
+            cvID = cvID[1]
+            cvID = cvID[:-1]
+            return cvID
+
+    return cvID
+
+
+def split_story_arcs(story_arc):
+    if not story_arc:
+        return []
+    return [arc.strip() for arc in story_arc.split(',') if arc.strip()]
+
+
+def read_comic_metadata(path, mtime=None):
+    '''
+    Returns a ComicRecord for the archive, or None if it isn't a comic
+    archive or has no ComicInfo.xml.
+    '''
+    # TODO: Need to fix the default image path
+    ca = ComicArchive(path, default_image_path=None)
+    if not ca.seemsToBeAComicArchive() or not ca.hasMetadata(MetaDataStyle.CIX):
+        return None
+
+    md = ca.readMetadata(MetaDataStyle.CIX)
+    if md.isEmpty:
+        return None
+
+    # Use the mtime from the scan when we have it rather
+    # than stat'ing the file again.
+    if mtime is None:
+        mtime = os.path.getmtime(path)
+
+    return ComicRecord(path=path,
+                       mod_ts=datetime.utcfromtimestamp(mtime),
+                       page_count=ca.page_count,
+                       fingerprint=archive_fingerprint(path),
+                       cvid=get_issue_cvid(md),
+                       series=md.series,
+                       issue=md.issue,
+                       title=md.title,
+                       publisher=md.publisher,
+                       day=md.day,
+                       month=md.month,
+                       year=md.year,
+                       webLink=md.webLink,
+                       creators=sorted({c['person'] for c in md.credits}),
+                       story_arcs=split_story_arcs(md.storyArc))
+
+
+def safe_read_comic_metadata(path, mtime=None):
+    # Don't let one broken archive take down the rest of the batch.
+    try:
+        return read_comic_metadata(path, mtime)
+    except Exception as e:
+        logging.getLogger('thwip').error(f'Unable to read {path} - {e}')
+        return None
+
+
+class MetadataReader(object):
+    '''
+    Reads the metadata from a list of archives, spread over a pool of
+    worker processes. Opening the zip, sorting its page list and parsing
+    the xml is all CPU bound, so this scales with the number of cores.
+    '''
+
+    def __init__(self, workers=1):
+        self.workers = max(1, workers or 1)
+
+    def read(self, files):
+        '''
+        Takes a list of (path, mtime) pairs and yields (path, ComicRecord)
+        pairs in the same order, with a record of None for anything that
+        isn't an importable comic.
+        '''
+        if self.workers == 1 or len(files) < 2:
+            for path, mtime in files:
+                yield path, safe_read_comic_metadata(path, mtime)
+            return
+
+        records = process_map(safe_read_comic_metadata, files, self.workers)
+        for (path, _), record in zip(files, records):
+            yield path, record
@@ -0,0 +1,459 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import queue
+import threading
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+
+from comics.models import Arc, Creator, Publisher, Series
+
+from .metadata import MetadataReader
+
+
+# How many items each stage can get ahead of the next one.
+QUEUE_SIZE = 100
+
+# Marks the end of a stage's output.
+DONE = object()
+
+# Most issues resolved together, which is as many ids as a Comic Vine
+# list request can take.
+RESOLVE_BATCH_SIZE = 100
+
+# How an object gets an image that's fetched once: the file itself, a
+# copy of it, or nothing more (it was already getting it).
+OWN = 'own'
+COPY = 'copy'
+SAME = 'same'
+
+
+class ResolvedIssue(object):
+    '''
+    Everything fetched from Comic Vine for one issue before it gets saved:
+    the issue response plus the details of any series, publisher, story
+    arcs (by cvid) and creators (by cvid) that aren't in the database yet.
+    '''
+
+    def __init__(self, issue_response):
+        self.issue_response = issue_response
+        self.series = None
+        self.publisher = None
+        self.arcs = {}
+        self.creators = {}
+        # Comic Vine was unavailable, so it should be tried again later.
+        self.deferred = False
+
+
+class ImportPipeline(object):
+    '''
+    Runs an import as a set of stages connected by bounded queues, so
+    reading archives (disk/CPU), talking to Comic Vine (network), saving
+    to the database and fetching images all overlap instead of taking
+    turns:
+
+        parse -> resolve -> persist
+                               \\-> images
+
+    Parsing, resolving and images each run in their own thread and never
+    touch the database. Persisting happens on the calling thread, which
+    also saves the finished images (and writes the journal, if there is
+    one), so all the database work stays on one connection. When a stage
+    falls behind, the queue feeding it fills up and the stages before it
+    wait.
+    '''
+
+    def __init__(self, importer, queue_size=QUEUE_SIZE, journal=None):
+        self.importer = importer
+        self.journal = journal
+        self.logger = logging.getLogger('thwip')
+        self.parsed = queue.Queue(maxsize=queue_size)
+        self.resolved = queue.Queue(maxsize=queue_size)
+        self.images = queue.Queue(maxsize=queue_size)
+        self.finished_images = queue.Queue()
+        self.progress = queue.Queue()
+        self.current = None
+        self.stopped = threading.Event()
+        self.errors = []
+        # Paths put off until Comic Vine is available again.
+        self.deferred = set()
+
+    def put(self, q, item):
+        # Block while the next stage is busy, unless the import has stopped.
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, q):
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def start_stage(self, name, target, outbox, *args):
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                self.logger.exception(f'Import {name} stage failed - {e}')
+                self.errors.append(e)
+                self.stopped.set()
+            finally:
+                if outbox is not None:
+                    self.put(outbox, DONE)
+
+        thread = threading.Thread(target=run, name=f'import-{name}',
+                                  daemon=True)
+        thread.start()
+
+        return thread
+
+    def parse(self, files, records):
+        # Anything the journal already has was parsed by an earlier run.
+        for md in records.values():
+            if not self.put(self.parsed, md):
+                return
+
+        files = [f for f in files if f[0] not in records]
+        reader = MetadataReader(self.importer.parse_workers)
+        read_count = 0
+        for path, md in reader.read(files):
+            self.report(path, 'parsed', md)
+            if md is None:
+                continue
+            self.logger.info(f"Reading in {read_count} {path}")
+            read_count += 1
+            if not self.put(self.parsed, md):
+                break
+
+    def get_batch(self, q, size):
+        '''
+        Waits for an item, then takes whatever else is ready (up to size),
+        so batches are as big as the stage before can keep up with.
+        Returns the list and whether DONE was reached.
+        '''
+        item = self.get(q)
+        if item is DONE:
+            return [], True
+
+        batch = [item]
+        while len(batch) < size:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is DONE:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def resolve(self, known):
+        done = False
+        while not done:
+            batch, done = self.get_batch(self.parsed, RESOLVE_BATCH_SIZE)
+            for md, resolved in zip(batch, self.resolve_batch(batch, known)):
+                if (resolved is not None and not resolved.deferred and
+                        resolved.issue_response is not None):
+                    self.report(md.path, 'resolved')
+                if not self.put(self.resolved, (md, resolved)):
+                    return
+
+    def resolve_batch(self, batch, known):
+        '''
+        Looks up the issues, then everything new they need (series,
+        publishers, story arcs & creators) for the whole batch at once,
+        using Comic Vine's list endpoints. Only the first issue to need
+        something gets it.
+        '''
+        importer = self.importer
+        results = []
+        wanted = {'volume': {}, 'publisher': {}, 'story_arc': {},
+                  'person': {}}
+        for md in batch:
+            if md.cvid is None:
+                results.append(None)
+                continue
+            if importer.getRetryAfter():
+                # Don't spend the quota on requests that will fail.
+                resolved = ResolvedIssue(None)
+                resolved.deferred = True
+                results.append(resolved)
+                continue
+            resolved = ResolvedIssue(importer.getIssue(md.cvid))
+            results.append(resolved)
+            if resolved.issue_response is None:
+                resolved.deferred = bool(importer.getRetryAfter())
+                continue
+            issue = resolved.issue_response['results']
+
+            # Only fetch things that don't exist yet, and only once per
+            # import.
+            volume = issue['volume']
+            if int(volume['id']) not in known['series']:
+                wanted['volume'].setdefault(int(volume['id']),
+                                            (resolved, volume))
+            for arc in issue['story_arc_credits']:
+                if arc['id'] not in known['arcs']:
+                    wanted['story_arc'].setdefault(arc['id'], (resolved, arc))
+            for person in issue['person_credits']:
+                if person['id'] not in known['creators']:
+                    wanted['person'].setdefault(person['id'],
+                                                (resolved, person))
+
+        for cvid, (resolved, data) in self.fetch_batch(
+                'volume', importer.series_fields, wanted['volume'],
+                known['series']):
+            resolved.series = data
+            # The series response says who the publisher is, so a new one
+            # is looked up by id without fetching the series again.
+            publisher = data.get('publisher')
+            if publisher and publisher['id'] not in known['publishers']:
+                wanted['publisher'].setdefault(publisher['id'],
+                                               (resolved, publisher))
+
+        for cvid, (resolved, data) in self.fetch_batch(
+                'publisher', importer.publisher_fields, wanted['publisher'],
+                known['publishers']):
+            resolved.publisher = data
+
+        for resource, fields, attr in (
+                ('story_arc', importer.arc_fields, 'arcs'),
+                ('person', importer.creator_fields, 'creators')):
+            for cvid, (resolved, data) in self.fetch_batch(
+                    resource, fields, wanted[resource], known[attr]):
+                getattr(resolved, attr)[cvid] = data
+
+        if importer.getRetryAfter():
+            # Some of the lookups may have been cut short, so save none of
+            # the batch rather than issues with missing details. What was
+            # fetched is cached for next time.
+            for resolved in results:
+                if resolved is not None:
+                    resolved.deferred = True
+
+        return results
+
+    def fetch_batch(self, resource, fields, wanted, known_ids):
+        '''
+        Looks up the wanted (cvid -> (resolved, response)) entities in one
+        go, returning (cvid, (resolved, data)) for each one found.
+        '''
+        if not wanted:
+            return []
+
+        importer = self.importer
+        found = importer.getDetailBatch(resource, fields, list(wanted))
+        results = []
+        for cvid, (resolved, response) in wanted.items():
+            data = found.get(cvid)
+            if data is None:
+                # Left out of the list for some reason, so try it on its
+                # own.
+                if resource == 'volume':
+                    data = importer.getSeriesDetail(response['api_detail_url'])
+                elif resource == 'publisher':
+                    data = importer.getPublisherData(response,
+                                                     download_image=False)
+                else:
+                    data = importer.getDetailData(
+                        fields, response['api_detail_url'],
+                        download_image=False)
+            if data is None:
+                continue
+            known_ids.add(cvid)
+            results.append((cvid, (resolved, data)))
+
+        return results
+
+    def fetch_images(self, pending):
+        '''
+        Fetches the queued images on a pool of threads. An image that's
+        wanted more than once (the same url, folder & size) is only
+        fetched once. Each object that wants it gets a copy of its own,
+        since the files are deleted along with the object.
+        '''
+        workers = self.importer.image_workers
+        # Don't take more off the queue than the pool can get on with.
+        slots = threading.BoundedSemaphore(workers * 2)
+        fetching = {}
+        owners = {}
+        with ThreadPoolExecutor(workers,
+                                thread_name_prefix='import-image') as pool:
+            while True:
+                if pending:
+                    item = pending.pop(0)
+                else:
+                    item = self.get(self.images)
+                if item is DONE:
+                    break
+                path, job = item
+                key = tuple(job[2:])
+                owner = tuple(job[:2])
+                future = fetching.get(key)
+                if future is None:
+                    slots.acquire()
+                    future = pool.submit(self.importer.fetchImage, *key)
+                    future.add_done_callback(lambda _: slots.release())
+                    fetching[key] = future
+                    owners[key] = {owner}
+                    share = OWN
+                elif owner in owners[key]:
+                    # It's already getting this one.
+                    share = SAME
+                else:
+                    owners[key].add(owner)
+                    share = COPY
+                future.add_done_callback(
+                    functools.partial(self.image_fetched, path, job, share))
+
+    def image_fetched(self, path, job, share, future):
+        try:
+            fields = future.result()
+            if share == SAME:
+                fields = {}
+            elif share == COPY and fields:
+                fields = self.importer.copyImage(fields)
+        except Exception as e:
+            self.logger.error(f'Unable to fetch image {job[2]} - {e}')
+            fields = {}
+        self.finished_images.put((path, job, fields))
+
+    def queue_image(self, db_obj, image_url, folder, width, height):
+        job = [db_obj._meta.label, db_obj.pk, image_url, folder, width, height]
+        self.current[1].append(job)
+
+    def save_images(self):
+        while True:
+            try:
+                path, job, fields = self.finished_images.get_nowait()
+            except queue.Empty:
+                break
+            if fields:
+                model = apps.get_model(job[0])
+                model.objects.filter(pk=job[1]).update(**fields)
+            if self.journal is not None:
+                self.journal.image_done(path, job)
+
+    def report(self, path, stage, md=None):
+        # Stages can't write to the journal themselves, so they pass
+        # their progress back to the calling thread.
+        if self.journal is not None:
+            self.progress.put((path, stage, md))
+
+    def save_progress(self):
+        while True:
+            try:
+                path, stage, md = self.progress.get_nowait()
+            except queue.Empty:
+                break
+            if stage == 'parsed':
+                self.journal.parsed(path, md)
+            else:
+                self.journal.resolved(path)
+
+    def persist(self, md, resolved):
+        self.current = (md.path, [])
+        if resolved is not None and resolved.deferred:
+            self.deferred.add(md.path)
+            if self.journal is not None:
+                self.journal.failed(md.path, 'Comic Vine was unavailable')
+            return False
+
+        try:
+            # All or nothing, so a file that fails can be tried again.
+            with transaction.atomic():
+                added = self.importer.addComicFromMetadata(md, resolved)
+                if added is False:
+                    transaction.set_rollback(True)
+        except IntegrityError as e:
+            # Usually another batch adding the same thing at the same time.
+            self.logger.error(f'Unable to save {md.path} - {e}')
+            if self.journal is not None:
+                self.journal.failed(md.path, f'Unable to save the issue - {e}')
+            return False
+
+        if added is False:
+            if self.journal is not None:
+                if md.cvid is None:
+                    error = 'No Comic Vine ID found'
+                elif resolved.issue_response is None:
+                    error = 'Unable to fetch the issue from Comic Vine'
+                else:
+                    error = 'Unable to save the issue'
+                self.journal.failed(md.path, error)
+            return False
+
+        if self.journal is not None:
+            self.journal.persisted(*self.current)
+        # Only fetched once what they belong to is saved.
+        path, images = self.current
+        for job in images:
+            self.put(self.images, (path, job))
+        return True
+
+    def run(self, files):
+        '''
+        Imports the list of (path, mtime) pairs, returning the set of
+        paths that failed to import. Those that failed because Comic Vine
+        was unavailable are also left in deferred.
+        '''
+        failed = set()
+        records = {}
+        pending = []
+        if self.journal is not None:
+            records = self.journal.start(files)
+            pending = self.journal.pending_images()
+        if not files and not pending:
+            return failed
+
+        # Loaded up front so the resolve stage can tell what's new
+        # without going near the database.
+        known = {
+            'publishers': set(Publisher.objects.exclude(cvid=None)
+                              .values_list('cvid', flat=True)),
+            'series': set(Series.objects.values_list('cvid', flat=True)),
+            'arcs': set(Arc.objects.values_list('cvid', flat=True)),
+            'creators': set(Creator.objects.values_list('cvid', flat=True)),
+        }
+
+        self.importer.image_handler = self.queue_image
+        self.start_stage('parse', self.parse, self.parsed, files, records)
+        self.start_stage('resolve', self.resolve, self.resolved, known)
+        images = self.start_stage('images', self.fetch_images, None, pending)
+        try:
+            while True:
+                item = self.get(self.resolved)
+                if item is DONE:
+                    break
+                md, resolved = item
+                if self.journal is not None:
+                    self.save_progress()
+                if not self.persist(md, resolved):
+                    failed.add(md.path)
+                self.save_images()
+                if self.journal is not None:
+                    self.journal.flush()
+
+            self.put(self.images, DONE)
+            images.join()
+            self.save_images()
+        finally:
+            self.stopped.set()
+            self.importer.image_handler = None
+            if self.journal is not None:
+                # Whatever got done is kept, even if the import failed.
+                self.save_progress()
+                self.journal.finish()
+
+        if self.errors:
+            raise self.errors[0]
+
+        return failed
@@ -0,0 +1,148 @@
+from datetime import timedelta
+import math
+
+from django.conf import settings
+
+from comics.models import Arc, Creator, Publisher, Series
+
+from .metadata import MetadataReader
+from .pipeline import RESOLVE_BATCH_SIZE
+
+
+class ImportPlan(object):
+    '''
+    What an import would do: how many files get added, removed, modified
+    or moved, and how many Comic Vine lookups that takes.
+    '''
+
+    def __init__(self, per_hour, burst):
+        self.per_hour = per_hour
+        self.burst = burst
+        self.added = 0
+        self.removed = 0
+        self.modified = 0
+        self.moved = 0
+        self.skipped = 0
+        self.no_cvid = 0
+        self.issues = 0
+        self.publishers = set()
+        self.series = set()
+        self.creators = set()
+        self.arcs = set()
+
+    def list_calls(self, count):
+        # New series, creators & arcs are looked up a batch of issues at
+        # a time, with up to a hundred ids in a request.
+        batches = math.ceil(self.issues / RESOLVE_BATCH_SIZE)
+        return max(math.ceil(count / RESOLVE_BATCH_SIZE), min(count, batches))
+
+    @property
+    def calls(self):
+        '''
+        The number of Comic Vine requests, for each resource.
+        '''
+        return {
+            'issue': self.issues,
+            'volume': self.list_calls(len(self.series)),
+            'publisher': self.list_calls(len(self.publishers)),
+            'person': self.list_calls(len(self.creators)),
+            'story_arc': self.list_calls(len(self.arcs)),
+        }
+
+    @property
+    def requests(self):
+        return sum(self.calls.values())
+
+    @property
+    def estimate(self):
+        '''
+        Each resource has its own limit, and the lookups are spread fairly
+        evenly through an import, so the busiest one sets the pace. The
+        first few (the burst) don't have to wait.
+        '''
+        busiest = max(self.calls.values())
+        seconds = max(0, busiest - self.burst) * 3600 / self.per_hour
+
+        return timedelta(seconds=math.ceil(seconds))
+
+    def report(self):
+        return [
+            f'Files to add: {self.added}',
+            f'Files to remove: {self.removed}',
+            f'Files modified: {self.modified}',
+            f'Files moved: {self.moved}',
+            f'Files without metadata: {self.skipped}',
+            f'Files without a Comic Vine ID: {self.no_cvid}',
+            f'Issue lookups: {self.issues}',
+            f'New publishers: {len(self.publishers)}',
+            f'New series: {len(self.series)}',
+            f'New creators: {len(self.creators)}',
+            f'New story arcs: {len(self.arcs)}',
+            f'Comic Vine requests: {self.requests}',
+            f'Estimated time: {self.estimate} '
+            f'(at {self.per_hour} requests per hour for each resource)',
+        ]
+
+
+class ImportPlanner(object):
+    '''
+    Works out what an import would do without changing anything or
+    talking to Comic Vine. The archives still have to be read, but that's
+    quick next to the lookups.
+
+    The series, creators and story arcs that need looking up are a guess
+    from the names in each ComicInfo.xml, since their Comic Vine IDs only
+    come with the issue's details.
+    '''
+
+    def __init__(self, importer):
+        self.importer = importer
+        self.per_hour = getattr(settings, 'COMICVINE_REQUESTS_PER_HOUR', 200)
+        # Imports leave some of the burst for interactive requests.
+        self.burst = max(0, getattr(settings, 'COMICVINE_BURST', 7) -
+                         getattr(settings, 'COMICVINE_INTERACTIVE_RESERVE', 2))
+
+    @staticmethod
+    def names(queryset):
+        return {name.lower() for name in queryset.values_list('name', flat=True)}
+
+    def plan(self, scan, issues=None):
+        importer = self.importer
+        plan = ImportPlan(self.per_hour, self.burst)
+
+        modified, missing, _ = importer.findStaleIssues(scan, issues)
+        moved = importer.findMovedIssues(scan, missing)
+        plan.modified = len(modified)
+        plan.moved = len(moved)
+        plan.removed = len(missing) - len(moved)
+
+        moved_paths = set(moved.values())
+        files = [f for f in importer.getImportList(scan, modified.values())
+                 if f[0] not in moved_paths]
+        plan.added = len(files) - plan.modified
+
+        publishers = set(Publisher.objects.values_list('name', flat=True))
+        series = self.names(Series.objects.all())
+        creators = self.names(Creator.objects.all())
+        arcs = self.names(Arc.objects.all())
+
+        reader = MetadataReader(importer.parse_workers)
+        for _, md in reader.read(files):
+            if md is None:
+                plan.skipped += 1
+                continue
+            if md.cvid is None:
+                plan.no_cvid += 1
+                continue
+
+            plan.issues += 1
+            if md.publisher is not None and md.publisher not in publishers:
+                plan.publishers.add(md.publisher)
+            if md.series and md.series.lower() not in series:
+                plan.series.add(md.series.lower())
+            plan.creators.update(c.lower() for c in md.creators
+                                 if c.lower() not in creators)
+            plan.arcs.update(a.lower() for a in md.story_arcs
+                             if a.lower() not in arcs)
+
+        return plan
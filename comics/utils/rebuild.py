@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+
+from comics.models import Arc, Creator, Issue, Publisher
+
+from .comicimporter import (CREATOR_IMG_HEIGHT, CREATOR_IMG_WIDTH,
+                            NORMAL_IMG_HEIGHT, NORMAL_IMG_WIDTH)
+from .utils import original_name, process_map, rebuild_image
+
+
+# The size each model's images are made at.
+IMAGE_SIZES = (
+    (Issue, NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT),
+    (Arc, NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT),
+    (Publisher, NORMAL_IMG_WIDTH, NORMAL_IMG_HEIGHT),
+    (Creator, CREATOR_IMG_WIDTH, CREATOR_IMG_HEIGHT),
+)
+
+# How often the progress is saved (and reported) while rebuilding.
+SAVE_INTERVAL = 5
+
+
+class RebuildProgress(object):
+    '''
+    The last image finished for each model, saved to a file as a rebuild
+    goes, so an interrupted one can carry on from there. It's removed once
+    the rebuild is done.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = json.load(f)
+
+    def get(self, label):
+        return self.done.get(label, 0)
+
+    def set(self, label, pk):
+        self.done[label] = pk
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.done, f)
+
+    def clear(self):
+        self.done = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MediaRebuilder(object):
+    '''
+    Renders every issue, arc, publisher and creator image again from the
+    original kept when it was imported, at the sizes the importer uses
+    now, and makes its renditions again. Nothing is fetched from Comic
+    Vine. The work is spread over a pool of worker processes, since
+    decoding and encoding images is all CPU bound.
+
+    Each model's images are done in order, so the progress is just the
+    last one finished. Objects sharing an image file are done together.
+    '''
+
+    def __init__(self, workers=1, progress=None, report=None):
+        self.workers = max(1, workers or 1)
+        self.progress = progress or RebuildProgress(os.path.join(
+            settings.MEDIA_ROOT, 'images', 'originals', 'rebuild.json'))
+        self.report = report or (lambda message: None)
+        self.logger = logging.getLogger('thwip')
+        self.rendered = 0
+        self.no_original = 0
+        self.failed = 0
+
+    def images(self, model):
+        '''
+        Returns a list of (name, renditions, pks) for the model's images
+        that are still to be done, in order.
+        '''
+        label = model._meta.label
+        images = {}
+        rows = (model.objects.exclude(image='').order_by('pk')
+                .values_list('pk', 'image', 'renditions'))
+        for pk, name, renditions in rows.iterator():
+            if name not in images:
+                images[name] = (name, renditions, [])
+            images[name][2].append(pk)
+
+        done = self.progress.get(label)
+        return [image for image in images.values() if image[2][0] > done]
+
+    def plan(self):
+        '''
+        Returns (model, images to do, how many have an original) for each
+        model, without changing anything.
+        '''
+        plan = []
+        for model, _, _ in IMAGE_SIZES:
+            images = self.images(model)
+            originals = sum(1 for name, _, _ in images if os.path.exists(
+                os.path.join(settings.MEDIA_ROOT, original_name(name))))
+            plan.append((model, len(images), originals))
+
+        return plan
+
+    def results(self, images, width, height):
+        # The progress is saved as results come in, so it never gets far
+        # behind what's actually been done.
+        results = process_map(
+            rebuild_image,
+            [(name, renditions, width, height)
+             for name, renditions, _ in images],
+            self.workers)
+        for (_, renditions, pks), result in zip(images, results):
+            yield pks, renditions, result
+
+    def rebuild_model(self, model, width, height):
+        label = model._meta.label
+        images = self.images(model)
+        last_save = time.monotonic()
+        for count, (pks, old, (rendered, renditions)) in enumerate(
+                self.results(images, width, height), 1):
+            if rendered is None:
+                self.no_original += 1
+            elif rendered:
+                self.rendered += 1
+            else:
+                self.failed += 1
+                self.logger.error(f'Unable to rebuild image for {label} '
+                                  f'{pks[0]}')
+            if renditions != old:
+                model.objects.filter(pk__in=pks).update(renditions=renditions)
+            self.progress.set(label, pks[0])
+
+            if time.monotonic() - last_save >= SAVE_INTERVAL:
+                self.progress.save()
+                self.report(f'{label}: {count}/{len(images)}')
+                last_save = time.monotonic()
+
+        self.progress.save()
+        self.report(f'{label}: {len(images)}/{len(images)}')
+
+    def rebuild(self):
+        '''
+        Rebuilds everything still to be done. Afterwards rendered,
+        no_original (only had their renditions made) and failed say how
+        it went.
+        '''
+        for model, width, height in IMAGE_SIZES:
+            self.rebuild_model(model, width, height)
+        self.progress.clear()
@@ -0,0 +1,292 @@
+from collections import defaultdict, namedtuple
+import hashlib
+import logging
+import os
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+from comics.models import LibraryDirectory, LibraryFile
+
+
+# Size, modification time & inode of a file as seen by the scanner.
+FileState = namedtuple('FileState', ['size', 'mtime', 'inode'])
+
+# Modification time of a directory & a digest of everything below it.
+DirState = namedtuple('DirState', ['mtime', 'digest'])
+
+# files & directories are dicts of path -> FileState / DirState for
+# everything found on disk (directories is None for a scan of just some
+# paths), while added, removed & modified are sets of file paths
+# compared to the saved index.
+ScanResult = namedtuple('ScanResult', ['files', 'directories',
+                                       'added', 'removed', 'modified'])
+
+BATCH_SIZE = 500
+
+# Seconds between the timestamps a filesystem can tell apart (NFS/SMB can
+# be as coarse as 2s). A directory changed within this long of a scan
+# starting could change again without its mtime moving.
+MTIME_GRANULARITY = 2
+
+# Saved in place of the mtime of a directory like that, so it never
+# matches and the directory is listed again on the next scan.
+RACY_MTIME = -1.0
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def encode_name(name):
+    return name.encode('utf-8', 'surrogateescape')
+
+
+def under_paths(paths, field='path'):
+    '''
+    Returns a filter matching the given paths, and for anything that isn't
+    a file on disk (a directory, or a path that's gone) everything below it.
+    '''
+    query = Q(**{f'{field}__in': list(paths)})
+    for path in paths:
+        if not os.path.isfile(path):
+            query |= Q(**{f'{field}__startswith': path.rstrip(os.sep) + os.sep})
+
+    return query
+
+
+class LibraryScanner(object):
+    '''
+    Walks the comics directory with os.scandir (one stat per file) and
+    compares the result against the persisted LibraryFile index, so that
+    finding what has changed doesn't require hitting the database or the
+    disk once per archive.
+
+    Each directory also gets a fingerprint of its mtime plus a digest of
+    its files and sub-directories. A directory whose mtime hasn't moved
+    since the last scan hasn't had anything added, removed or renamed in
+    it, so its files are taken from the index instead of being listed and
+    stat'ed again. Cold publisher/series folders then cost one stat each.
+    Archives that are rewritten in place (rather than replaced) don't
+    touch the directory mtime, so pass full=True to check every file.
+
+    A directory modified within MTIME_GRANULARITY of the scan starting
+    isn't trusted to be skipped next time, since a file added in the same
+    tick wouldn't change its mtime.
+    '''
+
+    def __init__(self, directory, full=False):
+        self.directory = directory
+        self.full = full
+        self.skipped = 0
+        self.logger = logging.getLogger('thwip')
+
+    @classmethod
+    def load_index(cls):
+        files = {}
+        rows = LibraryFile.objects.values_list('path', 'size', 'mtime', 'inode')
+        for path, size, mtime, inode in rows.iterator():
+            files[path] = FileState(size, mtime, inode)
+
+        directories = {}
+        rows = LibraryDirectory.objects.values_list('path', 'mtime', 'digest')
+        for path, mtime, digest in rows.iterator():
+            directories[path] = DirState(mtime, digest)
+
+        return files, directories
+
+    def walk(self, index_files=None, index_dirs=None):
+        files = {}
+        directories = {}
+        if not os.path.isdir(self.directory):
+            return files, directories
+
+        self._files = files
+        self._directories = directories
+        self._index_dirs = index_dirs or {}
+        self._known_files = defaultdict(list)
+        for path, state in (index_files or {}).items():
+            self._known_files[os.path.dirname(path)].append((path, state))
+        self._known_dirs = defaultdict(list)
+        for path in self._index_dirs:
+            self._known_dirs[os.path.dirname(path)].append(path)
+
+        self.skipped = 0
+        self.started = time.time()
+        self._walk_dir(self.directory, os.stat(self.directory).st_mtime)
+
+        return files, directories
+
+    def _walk_dir(self, path, mtime):
+        dir_files = []
+        subdirs = []
+
+        prev = self._index_dirs.get(path)
+        if not self.full and prev is not None and prev.mtime == mtime:
+            # Nothing has been added, removed or renamed in here since
+            # the last scan, so use the index rather than listing it.
+            self.skipped += 1
+            for file_path, state in self._known_files[path]:
+                dir_files.append((file_path, state))
+            for dir_path in self._known_dirs[path]:
+                try:
+                    subdirs.append((dir_path, os.stat(dir_path).st_mtime))
+                except OSError as e:
+                    self.logger.error(f'LibraryScanner stat - {e}')
+        else:
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        # Same as os.walk(), don't follow symlinked directories.
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirs.append((entry.path,
+                                                entry.stat().st_mtime))
+                            continue
+                        st = entry.stat()
+                        dir_files.append((entry.path,
+                                          FileState(st.st_size,
+                                                    st.st_mtime,
+                                                    st.st_ino)))
+            except OSError as e:
+                self.logger.error(f'LibraryScanner walk - {e}')
+
+        digest = hashlib.sha1()
+        for file_path, state in sorted(dir_files):
+            self._files[file_path] = state
+            digest.update(encode_name(os.path.basename(file_path)))
+            digest.update(f'\0{state.size}\0{state.mtime}\0{state.inode}\n'
+                          .encode())
+        for dir_path, dir_mtime in sorted(subdirs):
+            self._walk_dir(dir_path, dir_mtime)
+            digest.update(encode_name(os.path.basename(dir_path)))
+            digest.update(f'/\0{self._directories[dir_path].digest}\n'
+                          .encode())
+
+        if mtime > self.started - MTIME_GRANULARITY:
+            mtime = RACY_MTIME
+        self._directories[path] = DirState(mtime, digest.hexdigest())
+
+    @classmethod
+    def diff(cls, previous, current, prev_dirs=None, cur_dirs=None):
+        added = current.keys() - previous.keys()
+        removed = previous.keys() - current.keys()
+
+        # A directory with the same fingerprint has exactly the same
+        # files as before, so there's nothing to compare in it.
+        prev_dirs = prev_dirs or {}
+        unchanged = set()
+        for path, state in (cur_dirs or {}).items():
+            if prev_dirs.get(path) == state:
+                unchanged.add(path)
+
+        modified = set()
+        for path in current.keys() & previous.keys():
+            if os.path.dirname(path) in unchanged:
+                continue
+            if current[path] != previous[path]:
+                modified.add(path)
+
+        return added, removed, modified
+
+    def scan_paths(self, paths):
+        '''
+        Like scan() but only looks at the given files and directories, for
+        when we already know what changed. The directory index is left alone.
+        '''
+        files = {}
+        for path in paths:
+            if os.path.isdir(path):
+                sub_files, _ = LibraryScanner(path, full=True).walk()
+                files.update(sub_files)
+            elif os.path.isfile(path):
+                st = os.stat(path)
+                files[path] = FileState(st.st_size, st.st_mtime, st.st_ino)
+
+        previous = {}
+        rows = (LibraryFile.objects
+                .filter(under_paths(paths))
+                .values_list('path', 'size', 'mtime', 'inode'))
+        for path, size, mtime, inode in rows.iterator():
+            previous[path] = FileState(size, mtime, inode)
+
+        added, removed, modified = self.diff(previous, files)
+
+        return ScanResult(files, None, added, removed, modified)
+
+    def scan(self):
+        prev_files, prev_dirs = self.load_index()
+        files, directories = self.walk(prev_files, prev_dirs)
+        added, removed, modified = self.diff(prev_files, files,
+                                             prev_dirs, directories)
+        self.logger.info(f'Scanned {len(files)} files in {len(directories)} '
+                         f'directories ({self.skipped} unchanged): '
+                         f'{len(added)} added, {len(removed)} removed, '
+                         f'{len(modified)} modified')
+
+        return ScanResult(files, directories, added, removed, modified)
+
+    @classmethod
+    def index_files(cls, files):
+        '''
+        Adds (path, size, mtime, inode) entries to the index, for files
+        that were imported after the rest of the scan was saved.
+        '''
+        with transaction.atomic():
+            for batch in chunks(files):
+                LibraryFile.objects.filter(
+                    path__in=[f[0] for f in batch]).delete()
+                LibraryFile.objects.bulk_create(
+                    [LibraryFile(path=path, size=size, mtime=mtime,
+                                 inode=inode)
+                     for path, size, mtime, inode in batch])
+
+    @classmethod
+    def save_index(cls, scan, exclude=()):
+        '''
+        Bring the index in line with the scan. Paths in exclude (files that
+        failed to import) are left out of the index so they show up as added
+        and get retried on the next scan.
+        '''
+        exclude = set(exclude)
+        stale = scan.removed | scan.modified | exclude
+        fresh = (scan.added | scan.modified) - exclude
+
+        # Directories holding excluded files are left out as well, otherwise
+        # they'd be skipped and the excluded files never seen again.
+        skip_dirs = set()
+        gone_dirs = set()
+        new_dirs = []
+        if scan.directories is not None:
+            for path in exclude:
+                path = os.path.dirname(path)
+                while path not in skip_dirs and path in scan.directories:
+                    skip_dirs.add(path)
+                    path = os.path.dirname(path)
+            _, prev_dirs = cls.load_index()
+            gone_dirs = (prev_dirs.keys() - scan.directories.keys()) | skip_dirs
+            new_dirs = [path for path, state in scan.directories.items()
+                        if path not in skip_dirs and prev_dirs.get(path) != state]
+
+        with transaction.atomic():
+            for batch in chunks(stale):
+                LibraryFile.objects.filter(path__in=batch).delete()
+            for batch in chunks(fresh):
+                LibraryFile.objects.bulk_create(
+                    [LibraryFile(path=path,
+                                 size=scan.files[path].size,
+                                 mtime=scan.files[path].mtime,
+                                 inode=scan.files[path].inode)
+                     for path in batch])
+
+            for batch in chunks(gone_dirs | set(new_dirs)):
+                LibraryDirectory.objects.filter(path__in=batch).delete()
+            for batch in chunks(new_dirs):
+                LibraryDirectory.objects.bulk_create(
+                    [LibraryDirectory(path=path,
+                                      mtime=scan.directories[path].mtime,
+                                      digest=scan.directories[path].digest)
+                     for path in batch])
@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+import redis
+
+
+KEY_PREFIX = 'thwip:ratelimit'
+
+# Comic Vine's limits are per hour, for each type of resource.
+RESOURCES = ('issue', 'volume', 'person', 'story_arc', 'publisher')
+
+# Lanes for Comic Vine requests. Interactive ones (an admin refreshing
+# something) go ahead of bulk ones (imports) on the same budget.
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# Takes a token from a bucket, refilling it for the time since it was
+# last used. The token is taken even if the bucket is empty, and the
+# caller waits for it to refill, so callers are served in order.
+#
+# Given a reserve, the token is only taken if that many are left over
+# afterwards; otherwise nothing is taken, and the wait until there would
+# be is returned as a negative number for the caller to try again then.
+TAKE_TOKEN = '''
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if reserve and tokens - 1 < reserve then
+    wait = -(reserve + 1 - tokens) / rate
+else
+    tokens = tokens - 1
+    if tokens < 0 then
+        wait = -tokens / rate
+    end
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return tostring(wait)
+'''
+
+_connections = {}
+
+
+def get_redis(url=None):
+    url = url or settings.CELERY_BROKER_URL
+    if url not in _connections:
+        _connections[url] = redis.Redis.from_url(url)
+
+    return _connections[url]
+
+
+class LocalBucket(object):
+    '''
+    The same token bucket, kept in this process for when Redis isn't
+    available.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, reserve=None):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if reserve is not None and self.tokens - 1 < reserve:
+                return -(reserve + 1 - self.tokens) / self.rate
+            self.tokens -= 1
+
+            return max(0, -self.tokens / self.rate)
+
+
+class TokenBucket(object):
+    '''
+    A token bucket kept in Redis, so every thread, process and node shares
+    the one budget. Holds up to capacity tokens, refilling at rate tokens
+    a second.
+    '''
+
+    def __init__(self, name, rate, capacity, url=None):
+        self.key = f'{KEY_PREFIX}:{name}'
+        self.rate = rate
+        self.capacity = capacity
+        self.url = url
+        self.local = LocalBucket(rate, capacity)
+        self.logger = logging.getLogger('thwip')
+
+    def take(self, reserve=None):
+        '''
+        Takes a token, returning how many seconds to wait before using it.
+
+        Given a reserve, it's only taken if that many tokens are left for
+        others, and if not a negative number of seconds is returned
+        instead: how long until it's worth trying again.
+        '''
+        args = [self.rate, self.capacity, time.time()]
+        if reserve is not None:
+            args.append(reserve)
+        try:
+            conn = get_redis(self.url)
+            wait = conn.eval(TAKE_TOKEN, 1, self.key, *args)
+        except redis.RedisError as e:
+            self.logger.warning(f'Rate limit {self.key} - {e}')
+            return self.local.take(reserve)
+
+        return float(wait)
+
+    def acquire(self, reserve=None):
+        '''
+        Waits for a token, returning how many seconds that took.
+        '''
+        waited = 0
+        wait = self.take(reserve)
+        while wait < 0:
+            time.sleep(-wait)
+            waited -= wait
+            wait = self.take(reserve)
+        if wait > 0:
+            time.sleep(wait)
+
+        return waited + wait
+
+
+class ComicVineLimiter(object):
+    '''
+    One bucket for each Comic Vine resource. Every call to Comic Vine
+    takes a token from its resource's bucket first.
+
+    Requests go in one of two lanes sharing those buckets. Interactive
+    ones queue for the next token as usual. Bulk ones never queue: they
+    leave the last few tokens (the reserve) alone and try again once
+    there's more, so an interactive request only ever waits behind
+    other interactive ones, never behind an import's backlog.
+    '''
+
+    def __init__(self, per_hour=None, burst=None, url=None, priority=BULK,
+                 reserve=None):
+        per_hour = per_hour or getattr(settings, 'COMICVINE_REQUESTS_PER_HOUR',
+                                       200)
+        burst = burst or getattr(settings, 'COMICVINE_BURST', 7)
+        if reserve is None:
+            reserve = getattr(settings, 'COMICVINE_INTERACTIVE_RESERVE', 2)
+        self.priority = priority
+        self.reserve = reserve if priority == BULK else None
+        self.buckets = {resource: TokenBucket(f'comicvine:{resource}',
+                                              per_hour / 3600, burst, url)
+                        for resource in RESOURCES}
+
+    def acquire(self, resource):
+        return self.buckets[resource].acquire(self.reserve)
+
+
+class CircuitBreaker(object):
+    '''
+    Stops every thread, process and node from calling Comic Vine for a
+    while once it keeps failing (or tells us to back off), so requests
+    that are bound to fail don't use up the quota. It opens after
+    threshold failures in a row, or straight away when tripped, and
+    stays open for cooldown seconds, doubling each time it opens again
+    without a success in between.
+
+    The state is kept in Redis, or in this process when Redis isn't
+    available.
+    '''
+
+    def __init__(self, name, threshold=5, cooldown=300, max_cooldown=3600,
+                 url=None):
+        self.key = f'{KEY_PREFIX}:circuit:{name}'
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.url = url
+        self.local = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('thwip')
+
+    def retry_after(self):
+        '''
+        Returns how many seconds until the circuit closes, or 0 if it's
+        closed.
+        '''
+        try:
+            ttl = get_redis(self.url).pttl(f'{self.key}:open')
+        except redis.RedisError as e:
+            self.logger.warning(f'Circuit breaker {self.key} - {e}')
+            with self.lock:
+                return max(0, self.local.get('open', 0) - time.monotonic())
+
+        return max(0, ttl / 1000)
+
+    def failure(self):
+        try:
+            conn = get_redis(self.url)
+            failures = conn.incr(f'{self.key}:failures')
+            conn.expire(f'{self.key}:failures', self.max_cooldown)
+        except redis.RedisError as e:
+            self.logger.warning(f'Circuit breaker {self.key} - {e}')
+            with self.lock:
+                failures = self.local['failures'] = (
+                    self.local.get('failures', 0) + 1)
+
+        if failures >= self.threshold:
+            self.trip()
+
+    def trip(self, wait=0):
+        '''
+        Opens the circuit for the cooldown, or for wait seconds if that's
+        longer.
+        '''
+        try:
+            conn = get_redis(self.url)
+            trips = conn.incr(f'{self.key}:trips')
+            conn.expire(f'{self.key}:trips', self.max_cooldown * 2)
+        except redis.RedisError:
+            conn = None
+            with self.lock:
+                trips = self.local['trips'] = self.local.get('trips', 0) + 1
+
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** (trips - 1))
+        cooldown = max(cooldown, wait)
+        self.logger.warning(
+            f'Comic Vine unavailable, pausing requests for {cooldown:.0f}s')
+        if conn is not None:
+            try:
+                conn.set(f'{self.key}:open', 1, px=int(cooldown * 1000))
+                conn.delete(f'{self.key}:failures')
+                return
+            except redis.RedisError as e:
+                self.logger.warning(f'Circuit breaker {self.key} - {e}')
+        with self.lock:
+            self.local['open'] = time.monotonic() + cooldown
+            self.local['failures'] = 0
+
+    def success(self):
+        try:
+            get_redis(self.url).delete(f'{self.key}:failures',
+                                       f'{self.key}:trips')
+        except redis.RedisError as e:
+            self.logger.warning(f'Circuit breaker {self.key} - {e}')
+        with self.lock:
+            self.local.pop('failures', None)
+            self.local.pop('trips', None)
@@ -1,13 +1,24 @@
+from collections import deque
 import logging
+import math
 import os
 import re
+import shutil
+import time
 import uuid
 
 from PIL import Image
 from bs4 import BeautifulSoup
+import billiard
 from django.conf import settings
 
 
+# JPEGs are decoded at no less than this many times the size they're
+# resized to, rather than at full size, which is still plenty for a
+# good BICUBIC resize (the same as Pillow's thumbnail does).
+REDUCING_GAP = 2.0
+
+
 def resize_images(path, folder, width, height):
     if path:
         # Split width and height
@@ -15,6 +26,7 @@ def resize_images(path, folder, width, height):
         crop_height = height
         # Directory permission
         access_rights = 0o755
+        logger = logging.getLogger('thwip')
 
         old_filename = os.path.basename(str(path))
         (_, ext) = os.path.splitext(old_filename)
@@ -25,7 +37,6 @@ def resize_images(path, folder, width, height):
             try:
                 os.makedirs(save_directory, access_rights)
             except OSError:
-                logger = logging.getLogger('thwip')
                 logger.error(
                     f'Creation of the directory {save_directory} failed')
 
@@ -35,26 +46,8 @@ def resize_images(path, folder, width, height):
 
         new_path = settings.MEDIA_ROOT + '/' + cache_path
         new_url = cache_path
-
-        try:
-            img = Image.open(settings.MEDIA_ROOT + '/images/' + old_filename)
-            # Check Aspect ratio and resize accordingly
-            if crop_width * img.height < crop_height * img.width:
-                height_percent = (float(crop_height) / float(img.size[1]))
-                width_size = int(float(img.size[0]) * float(height_percent))
-                img = img.resize((width_size, crop_height), Image.BICUBIC)
-            else:
-                width_percent = (float(crop_width) / float(img.size[0]))
-                height_size = int(float(img.size[1]) * float(width_percent))
-                img = img.resize((crop_width, height_size), Image.BICUBIC)
-
-            cropped = crop_from_center(img, crop_width, crop_height)
-            try:
-                cropped.save(new_path)
-            except ValueError:
-                new_url = ''
-                print(f'Unable to crop: {os.path.basename(new_path)}')
-        except IOError:
+        if not render_image(settings.MEDIA_ROOT + '/images/' + old_filename,
+                            new_path, crop_width, crop_height):
             # Save as blank instead of None for bad images.
             new_url = ''
 
@@ -63,20 +56,262 @@ def resize_images(path, folder, width, height):
         return None
 
 
-def crop_from_center(image, width, height):
-    img = image
-    center_width = img.size[0] / 2
-    center_height = img.size[1] / 2
-    cropped = img.crop(
-        (
-            center_width - width / 2,
-            center_height - height / 2,
-            center_width + width / 2,
-            center_height + height / 2
-        )
-    )
-
-    return cropped
+def render_image(source, target, width, height):
+    '''
+    Scales and crops the image at source to fill width x height, saving
+    it to target. Returns whether that worked.
+    '''
+    logger = logging.getLogger('thwip')
+    try:
+        start = time.perf_counter()
+        img = Image.open(source)
+        # Only decode as much of it as the resize needs.
+        draft_image(img, width, height)
+        img.load()
+        decoded = time.perf_counter()
+
+        cropped = thumbnail(img, width, height)
+        resized = time.perf_counter()
+        try:
+            cropped.save(target)
+        except ValueError:
+            logger.error(f'Unable to crop: {os.path.basename(target)}')
+            return False
+        saved = time.perf_counter()
+    except IOError:
+        return False
+
+    logger.debug(
+        f'Resized {os.path.basename(source)} to {width}x{height} '
+        f'in {(saved - start) * 1000:.1f}ms '
+        f'(decode {(decoded - start) * 1000:.1f}ms, '
+        f'resize {(resized - decoded) * 1000:.1f}ms, '
+        f'save {(saved - resized) * 1000:.1f}ms)')
+
+    return True
+
+
+def fill_box(size, width, height):
+    '''
+    Returns the part of an image (of the given size) that fills width x
+    height once it's scaled: as much of it as has the same aspect ratio,
+    from the center.
+    '''
+    img_width, img_height = size
+    if width * img_height < height * img_width:
+        # Too wide, so trim the sides.
+        box_width = img_height * width / height
+        left = (img_width - box_width) / 2
+        return (left, 0, left + box_width, img_height)
+
+    box_height = img_width * height / width
+    top = (img_height - box_height) / 2
+    return (0, top, img_width, top + box_height)
+
+
+def draft_image(image, width, height):
+    '''
+    Has a JPEG that's yet to be loaded decoded at a 1/2, 1/4 or 1/8 of its
+    size if that's still big enough to resize to width x height. Nothing
+    is done to other formats.
+    '''
+    box = fill_box(image.size, width, height)
+    scale = REDUCING_GAP * width / (box[2] - box[0])
+    if scale < 1:
+        image.draft(image.mode, (math.ceil(image.width * scale),
+                                 math.ceil(image.height * scale)))
+
+
+def thumbnail(image, width, height):
+    '''
+    Scales and crops an image to fill width x height in one resize.
+    '''
+    return image.resize((width, height), Image.BICUBIC,
+                        box=fill_box(image.size, width, height),
+                        reducing_gap=REDUCING_GAP)
+
+
+# Covers are also saved at these widths, in WebP and (for browsers that
+# can't show that) JPEG, so a grid of them doesn't have to be sent the
+# full size ones.
+RENDITION_WIDTHS = (160, 320, 640)
+RENDITION_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+
+def rendition_widths(width):
+    widths = getattr(settings, 'IMAGE_RENDITION_WIDTHS', RENDITION_WIDTHS)
+    return [w for w in widths if w <= width]
+
+
+def rendition_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f'{root}-{width}w.{ext}'
+
+
+def create_renditions(name):
+    '''
+    Saves copies of an image (a path under MEDIA_ROOT) at each of the
+    rendition widths up to its own, in each of the formats. Returns the
+    widths for the renditions field, or an empty string if there aren't
+    any.
+    '''
+    widths = []
+    try:
+        img = Image.open(os.path.join(settings.MEDIA_ROOT, name))
+        img.load()
+        widths = rendition_widths(img.width)
+        for width in widths:
+            resized = img
+            if width != img.width:
+                height = max(1, round(img.height * width / img.width))
+                resized = img.resize((width, height), Image.BICUBIC,
+                                     reducing_gap=REDUCING_GAP)
+            for ext, image_format, options in RENDITION_FORMATS:
+                copy = resized
+                if image_format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+                    copy = copy.convert('RGB')
+                copy.save(os.path.join(settings.MEDIA_ROOT,
+                                       rendition_name(name, width, ext)),
+                          image_format, **options)
+    except (IOError, ValueError) as e:
+        logging.getLogger('thwip').error(
+            f'Unable to create renditions of {name} - {e}')
+        # Don't leave some of them behind.
+        delete_renditions(name, ','.join(map(str, widths)))
+        return ''
+
+    return ','.join(map(str, widths))
+
+
+def delete_renditions(name, renditions):
+    for width in filter(None, renditions.split(',')):
+        for ext, _, _ in RENDITION_FORMATS:
+            path = os.path.join(settings.MEDIA_ROOT,
+                                rendition_name(name, width, ext))
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def original_name(name):
+    '''
+    Where the original of an image is kept, so it can be rendered again
+    (see the rebuild_images command): the same path under images/originals.
+    '''
+    return os.path.join('images', 'originals', os.path.relpath(name, 'images'))
+
+
+def keep_original(path, name):
+    '''
+    Moves the file an image was made from (path) to where its original is
+    kept.
+    '''
+    original = os.path.join(settings.MEDIA_ROOT, original_name(name))
+    os.makedirs(os.path.dirname(original), exist_ok=True)
+    os.replace(path, original)
+
+
+def copy_image(name, renditions):
+    '''
+    Makes a copy of an image (a path under MEDIA_ROOT), its renditions and
+    its original under a new name, which is returned. They're linked
+    rather than copied where the filesystem allows.
+    '''
+    root, ext = os.path.splitext(name)
+    new_name = os.path.join(os.path.dirname(name), str(uuid.uuid4()) + ext)
+    names = [(name, new_name), (original_name(name), original_name(new_name))]
+    for width in filter(None, renditions.split(',')):
+        for rendition_ext, _, _ in RENDITION_FORMATS:
+            names.append((rendition_name(name, width, rendition_ext),
+                          rendition_name(new_name, width, rendition_ext)))
+
+    for src, dst in names:
+        src = os.path.join(settings.MEDIA_ROOT, src)
+        dst = os.path.join(settings.MEDIA_ROOT, dst)
+        if not os.path.exists(src):
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    return new_name
+
+
+def image_shared(instance):
+    '''
+    Whether another object of the same model has the same image file, as
+    ones imported together used to.
+    '''
+    return (type(instance).objects.filter(image=instance.image.name)
+            .exclude(pk=instance.pk).exists())
+
+
+def delete_image_copies(name, renditions):
+    '''
+    Deletes the renditions and original kept for an image.
+    '''
+    delete_renditions(name, renditions)
+    original = os.path.join(settings.MEDIA_ROOT, original_name(name))
+    if os.path.exists(original):
+        os.remove(original)
+
+
+def rebuild_image(name, renditions, width, height):
+    '''
+    Renders an image (a path under MEDIA_ROOT) again from its original
+    and makes its renditions again. One without an original only gets
+    new renditions.
+
+    Returns whether it was rendered (None if there was no original) and
+    its renditions.
+    '''
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    original = os.path.join(settings.MEDIA_ROOT, original_name(name))
+    rendered = None
+    if os.path.exists(original):
+        rendered = render_image(original, path, width, height)
+    if rendered is False or not os.path.exists(path):
+        return False, renditions
+
+    delete_renditions(name, renditions)
+
+    return rendered, create_renditions(name)
+
+
+def process_map(func, args, workers):
+    '''
+    Yields func(*a) for each tuple in args, in order, spread over a pool
+    of worker processes. billiard's pool is used since, unlike
+    multiprocessing's, it can be started from inside one of Celery's
+    (daemonic) prefork workers, which is where imports actually run.
+    '''
+    if workers <= 1:
+        for a in args:
+            yield func(*a)
+        return
+
+    # Only keep a few per worker in flight, so we don't get far ahead of
+    # whoever is consuming the results (and stopping early doesn't have
+    # to wait on the whole list).
+    window = workers * 4
+    pending = deque()
+    pool = billiard.Pool(workers)
+    try:
+        for a in args:
+            pending.append(pool.apply_async(func, a))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # Even when stopped early there's only the window left to finish,
+        # and billiard's terminate() can hang waiting on its workers.
+        pool.close()
+        pool.join()
 
 
 def create_series_sortname(title):
@@ -0,0 +1,200 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+from .scanner import LibraryScanner
+
+
+# inotify event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def get_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+class InotifyBackend(object):
+    '''
+    Watches the library with inotify. read() returns the paths touched
+    since the last call, or None if the kernel dropped events and a full
+    scan is needed.
+    '''
+
+    def __init__(self, directory, libc):
+        self.directory = directory
+        self.libc = libc
+        self.logger = logging.getLogger('thwip')
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+        self.add_watches(directory)
+
+    def add_watches(self, directory):
+        for root, dirs, _ in os.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root),
+                                             WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.logger.error(f'Unable to watch {root} - '
+                                  f'{os.strerror(errno)}')
+                continue
+            self.watches[wd] = root
+
+    def read(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            root = self.watches.get(wd)
+            if root is None or not name:
+                continue
+            path = os.path.join(root, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Anything that was already in a new directory won't
+                    # get events of its own, so report the directory.
+                    self.add_watches(path)
+                    paths.append(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    paths.append(path)
+            elif not mask & IN_CREATE:
+                # Wait for IN_CLOSE_WRITE rather than picking up
+                # files that are still being copied in.
+                paths.append(path)
+
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend(object):
+    '''
+    Fallback for when inotify isn't available (or doesn't see remote
+    changes, ie. NFS). Rescans the library every interval, only listing
+    directories whose mtime has changed.
+    '''
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self.scanner = LibraryScanner(directory)
+        self.files, self.directories = self.scanner.walk()
+
+    def read(self, timeout=None):
+        time.sleep(self.interval)
+
+        files, directories = self.scanner.walk(self.files, self.directories)
+        added, removed, modified = self.scanner.diff(
+            self.files, files, self.directories, directories)
+        self.files = files
+        self.directories = directories
+
+        return list(added | removed | modified)
+
+    def close(self):
+        pass
+
+
+class LibraryWatcher(object):
+    '''
+    Watches the comics directory and calls callback with the set of changed
+    paths once things have been quiet for debounce seconds (or max_delay
+    seconds have passed since the first change, for long copies). The
+    callback gets None if events were lost and the whole library needs a
+    scan.
+    '''
+
+    def __init__(self, directory, callback, debounce=5, max_delay=60,
+                 poll=False, interval=30):
+        self.directory = directory
+        self.callback = callback
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.stopped = False
+        self.logger = logging.getLogger('thwip')
+
+        libc = None if poll else get_libc()
+        if libc is not None:
+            self.backend = InotifyBackend(directory, libc)
+        else:
+            self.backend = PollingBackend(directory, interval)
+        self.logger.info(f'Watching {directory} with '
+                         f'{type(self.backend).__name__}')
+
+    def run(self):
+        pending = set()
+        rescan = False
+        first_change = None
+
+        try:
+            while not self.stopped:
+                waiting = pending or rescan
+                changes = self.backend.read(self.debounce if waiting else None)
+
+                if changes is None:
+                    rescan = True
+                else:
+                    pending.update(changes)
+                if (changes is None or changes) and first_change is None:
+                    first_change = time.monotonic()
+
+                if not (pending or rescan):
+                    continue
+                quiet = changes == []
+                overdue = time.monotonic() - first_change >= self.max_delay
+                if quiet or overdue:
+                    self.callback(None if rescan else pending)
+                    pending = set()
+                    rescan = False
+                    first_change = None
+        finally:
+            self.backend.close()
+
+    def stop(self):
+        self.stopped = True
@@ -153,6 +153,49 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Tests keep what they put in Redis in a database of their own, which is
+# emptied on every run (see thwip.test_runner).
+TEST_RUNNER = 'thwip.test_runner.ThwipTestRunner'
+TEST_REDIS_URL = 'redis://localhost/15'
+
+# Importer Config
+# Number of processes used to read the metadata from new comic archives.
+IMPORT_PARSE_WORKERS = os.cpu_count()
+# Number of threads fetching images during an import.
+IMPORT_IMAGE_WORKERS = 4
+# Widths of the smaller copies made of covers, for srcset.
+IMAGE_RENDITION_WIDTHS = (160, 320, 640)
+# Number of files in each import task handed out to the celery workers.
+IMPORT_BATCH_SIZE = 50
+
+# Comic Vine Config
+# Where the Comic Vine api is. Tests and benchmarks can point this at a
+# local stand-in (see the comicvine_standin command) instead.
+COMICVINE_BASE_URL = os.environ.get('COMICVINE_BASE_URL',
+                                    'https://comicvine.gamespot.com/api')
+# Comic Vine allows 200 requests an hour for each type of resource.
+COMICVINE_REQUESTS_PER_HOUR = 200
+# Requests that can go out back to back before they get spaced out.
+COMICVINE_BURST = 7
+# Tokens of that burst imports leave alone, so an admin refreshing
+# something doesn't have to wait behind them.
+COMICVINE_INTERACTIVE_RESERVE = 2
+# Failed requests in a row before Comic Vine is left alone for a while,
+# and how many seconds that is to begin with (it doubles each time).
+COMICVINE_CIRCUIT_THRESHOLD = 5
+COMICVINE_CIRCUIT_COOLDOWN = 300
+# Seconds to skip a Comic Vine lookup for after it came back empty or
+# failed.
+COMICVINE_MISS_TTL = 7 * 24 * 60 * 60
+# Seconds to cache each type of Comic Vine record for.
+COMICVINE_CACHE_TTL = {
+    'issue': 24 * 60 * 60,
+    'volume': 7 * 24 * 60 * 60,
+    'story_arc': 7 * 24 * 60 * 60,
+    'person': 30 * 24 * 60 * 60,
+    'publisher': 30 * 24 * 60 * 60,
+}
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
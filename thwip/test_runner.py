@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from comics.utils.throttle import get_redis
+
+
+class ThwipTestRunner(DiscoverRunner):
+    '''
+    Points everything kept in Redis (the Comic Vine rate limits, circuit
+    breaker and caches) at a database of its own for the test run, so
+    tests can't trip the breaker or use up the quota for a real worker,
+    or leave bogus records in its caches. It's emptied before and after.
+    '''
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.redis_settings = override_settings(
+            CELERY_BROKER_URL=settings.TEST_REDIS_URL)
+        self.redis_settings.enable()
+        get_redis().flushdb()
+
+    def teardown_test_environment(self, **kwargs):
+        get_redis().flushdb()
+        self.redis_settings.disable()
+        super().teardown_test_environment(**kwargs)